@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+
+""" Per-call overhead of the Python -> JS bridge for 10k synthetic
+    transform commands (translate / rotate / scale of 100 meshes):
+
+    - before: one script per call, built by string concatenation &
+      evaluated on its own (each one is new source text for the JS engine)
+    - after: SetupScene's commands, serialized with json.dumps & sent to
+      dispatch() in one script
+
+    Each variant is run once to warm up; the best of REPEATS runs is
+    reported. The coalesced variant (SetupScene's methods as the system
+    calls them) sends far fewer commands, so it is reported on its own.
+
+    With QtWebKit, the scripts are evaluated in a QWebPage that defines the
+    functions as no-ops; without it, only the Python side is measured.
+
+    Run from the project directory: python3 benchmarks/bench_bridge_protocol.py
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from PyQt5 import QtWidgets
+
+from python.modules import js_interface_module as js
+
+COMMANDS = 10000
+MESHES = 100
+REPEATS = 5
+
+STUB_PAGE = """<html><head><script>
+var python_callback = {"on_js_console_log": function(log) {}};
+function translateMeshByID(id, x, y, z) {}
+function rotateMeshByID(id, x, y, z) {}
+function scaleMeshByID(id, x, y, z) {}
+var commands = {"translateMeshByID": translateMeshByID,
+                "rotateMeshByID": rotateMeshByID,
+                "scaleMeshByID": scaleMeshByID};
+function dispatch(batch) {
+    for (var i = 0; i < batch.length; i++) {
+        try {
+            commands[batch[i][0]].apply(null, batch[i][1]);
+        } catch (e) {
+            python_callback.on_js_console_log(batch[i][0] + ": " + e);
+        }
+    }
+}
+</script></head><body></body></html>"""
+
+
+class NullFrame:
+    """ Used if QtWebKit is not available: scripts are only built. """
+
+    def evaluateJavaScript(self, script):
+        pass
+
+
+def synthetic_commands():
+    random.seed(1)
+    operations = ("translate", "rotate", "scale")
+    return [(random.choice(operations), "mesh" + str(i % MESHES),
+             random.uniform(-1, 1), random.uniform(0, 6.3),
+             random.uniform(0.5, 2)) for i in range(COMMANDS)]
+
+
+def legacy_calls(frame, commands):
+    """ The previous SetupScene methods, kept here as the reference. """
+    for operation, id_, x, y, z in commands:
+        if operation == "translate":
+            frame.evaluateJavaScript(
+                "translateMeshByID('" + id_ + "', " +
+                str(x) + ", " + str(y) + ", " + str(z) + " );")
+        elif operation == "rotate":
+            frame.evaluateJavaScript(
+                "rotateMeshByID('" + id_ + "', " +
+                str(x) + ", " + str(y) + ", " + str(z) + " );")
+        else:
+            frame.evaluateJavaScript(
+                "scaleMeshByID('" + id_ + "', " +
+                str(x) + ", " + str(y) + ", " + str(z) + " );")
+
+
+def protocol_calls(frame, commands):
+    functions = {"translate": "translateMeshByID",
+                 "rotate": "rotateMeshByID",
+                 "scale": "scaleMeshByID"}
+
+    js.SetupScene.webview = frame
+    for operation, id_, x, y, z in commands:
+        # (not coalesced: every command is sent)
+        js.SetupScene.call(functions[operation], id_, x, y, z)
+    js.SetupScene.flush()
+
+
+def coalesced_calls(frame, commands):
+    """ The SetupScene methods as the system calls them. """
+    js.SetupScene.webview = frame
+    for operation, id_, x, y, z in commands:
+        if operation == "translate":
+            js.SetupScene.translate_mesh_by_id(id_, x, y, z)
+        elif operation == "rotate":
+            js.SetupScene.rotate_mesh_by_id(id_, x, y, z)
+        else:
+            js.SetupScene.scale_mesh_by_id(id_, x, y, z)
+    js.SetupScene.flush()
+
+
+def measure(function, frame, commands):
+    """ Best time of REPEATS runs (after one to warm up) & the number of
+        commands that were sent in the last one.
+    """
+    function(frame, commands)
+
+    best = None
+    for _ in range(REPEATS):
+        sent = js.SetupScene.commands - js.SetupScene.dropped_updates
+        start = time.perf_counter()
+        function(frame, commands)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+        sent = js.SetupScene.commands - js.SetupScene.dropped_updates - sent
+
+    return best, sent
+
+
+def create_frame(app):
+    try:
+        from PyQt5.QtWebKitWidgets import QWebPage
+    except ImportError:
+        print('QtWebKit is not available: measuring the Python side only')
+        return NullFrame()
+
+    page = QWebPage()
+    page.mainFrame().setHtml(STUB_PAGE)
+    app.processEvents()
+    create_frame.page = page
+    return page.mainFrame()
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+    frame = create_frame(app)
+    commands = synthetic_commands()
+
+    print('{:<34} {:>10} {:>12}'.format('', 'total ms', 'us / call'))
+    for name, function in (('string per call (before)', legacy_calls),
+                           ('JSON batch + dispatch', protocol_calls)):
+        seconds, sent = measure(function, frame, commands)
+        print('{:<34} {:>10.1f} {:>12.2f}'.format(
+            name, seconds * 1000, seconds * 1e6 / len(commands)))
+
+    # not comparable per call: most of the commands are merged
+    seconds, sent = measure(coalesced_calls, frame, commands)
+    print('\ncoalesced by SetupScene: {} of {} commands sent, '
+          '{:.1f} ms in total'.format(sent, len(commands), seconds * 1000))
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
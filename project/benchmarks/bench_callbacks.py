@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+""" Python side of the JS -> Python callbacks, before and after they got
+    typed arguments:
+
+    - on_translation_rotation_scale_request (every B button tick): three
+      comma-joined strings parsed by deserialize_list vs. three lists of
+      floats (what PyQt passes to 'QVariantList' slots)
+    - save_state_result: the JSON text of a room (rooms/*.json) parsed
+      with json.loads vs. the dict PyQt passes to a 'QVariantMap' slot,
+      cleaned up by from_js_object
+
+    Run from the project directory: python3 benchmarks/bench_callbacks.py
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from python.modules import js_interface_module as js
+
+TICKS = 10000
+ROOMS_GLOB = 'rooms/*.json'
+
+
+def legacy_deserialize_list(js_list_as_string):
+    """ The previous implementation, kept here as the reference. """
+    l = []
+    s = ''
+
+    for c in list(js_list_as_string):
+        if c != ',':
+            s += c
+        else:
+            l.append(float(s))
+            s = ''
+
+    l.append(float(s))
+
+    return l
+
+
+def js_number(value):
+    """ How JS would print the number when the array is converted to a
+        string.
+    """
+    return repr(value)
+
+
+def measure(function, arguments):
+    start = time.perf_counter()
+    for args in arguments:
+        function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    random.seed(1)
+    transforms = [[[random.uniform(-5, 5) for i in range(3)]
+                   for j in range(3)] for k in range(TICKS)]
+    as_strings = [[','.join(js_number(v) for v in values)
+                   for values in transform] for transform in transforms]
+
+    def legacy_tick(trans, rot, scale):
+        return (legacy_deserialize_list(trans), legacy_deserialize_list(rot),
+                legacy_deserialize_list(scale))
+
+    def typed_tick(trans, rot, scale):
+        return js.to_floats(trans), js.to_floats(rot), js.to_floats(scale)
+
+    legacy = measure(legacy_tick, as_strings)
+    typed = measure(typed_tick, transforms)
+    print('transform callback ({} ticks)'.format(TICKS))
+    print('    deserialize_list: {:8.2f} us / tick'.format(
+        legacy * 1e6 / TICKS))
+    print('    list of floats:   {:8.2f} us / tick'.format(
+        typed * 1e6 / TICKS))
+
+    for room_file in sorted(glob.glob(ROOMS_GLOB)):
+        with open(room_file) as file:
+            scene_json = file.read()
+        scene = json.loads(scene_json)
+
+        repetitions = 200
+        legacy = measure(json.loads, [(scene_json,)] * repetitions)
+        typed = measure(js.from_js_object, [(scene,)] * repetitions)
+        print('save_state_result, {} ({} meshes)'.format(
+            os.path.basename(room_file), len(scene['meshes'])))
+        print('    json.loads:       {:8.2f} us'.format(
+            legacy * 1e6 / repetitions))
+        print('    from_js_object:   {:8.2f} us'.format(
+            typed * 1e6 / repetitions))
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
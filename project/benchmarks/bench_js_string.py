@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+
+""" Compares utility_module.read_file_as_js_string (chunks escaped into
+    bytes) with the implementations before it (line by line, and str.replace
+    passes over the whole file), for every model in assets/models/.
+
+    Run from the project directory: python3 benchmarks/bench_js_string.py
+"""
+
+import os
+import sys
+import glob
+import ast
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from python.modules import utility_module as um
+
+MODELS_GLOB = 'assets/models/*.babylon'
+REPETITIONS = 3
+
+
+def legacy_read_file_as_js_string(file, regular_contents_as_well=False):
+    """ The previous implementation, kept here as the reference. """
+    for_js = '('
+    regular_contents = ''
+    for line in file:
+        for_js += "'" + line[:-1] + "' + \n"
+        if regular_contents_as_well:
+            regular_contents += line
+    for_js += "'')"
+
+    if regular_contents_as_well:
+        return for_js, regular_contents
+    else:
+        return for_js
+
+
+def replace_read_file_as_js_string(file):
+    """ The version before the chunked one: the whole file as str, escaped
+        by one str.replace pass per character.
+    """
+    contents = str(file.read(), 'utf-8')
+    for char, escaped in (('\\', '\\\\'), ("'", "\\'"), ('\n', '\\n'),
+                          ('\r', '\\r'), ('\u2028', '\\u2028'),
+                          ('\u2029', '\\u2029')):
+        contents = contents.replace(char, escaped)
+    return ''.join(("'", contents, "'"))
+
+
+def measure(function, file_name, mode):
+    """ Returns the best time (seconds) and the peak memory (bytes) of
+        reading the file with the function.
+    """
+    best = float('inf')
+    for i in range(REPETITIONS):
+        with open(file_name, mode) as file:
+            start = time.perf_counter()
+            function(file)
+            best = min(best, time.perf_counter() - start)
+
+    with open(file_name, mode) as file:
+        tracemalloc.start()
+        function(file)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def main():
+    file_names = sorted(glob.glob(MODELS_GLOB))
+
+    versions = (('lines', legacy_read_file_as_js_string, 'r'),
+                ('replace', replace_read_file_as_js_string, 'rb'),
+                ('chunks', um.read_file_as_js_string, 'rb'))
+
+    print('{:<34} {:>7}'.format('', 'KB') + ''.join(
+        ' {:>10} {:>6}'.format(name + ' ms', 'MB') for name, _, _ in versions))
+
+    totals = [0] + [0.0] * len(versions)
+    for file_name in file_names:
+        with open(file_name, 'rb') as file:
+            literal, contents = um.read_file_as_js_string(file, True)
+        # the literal must decode to exactly the file contents (the escapes
+        # used are valid in Python string literals as well)
+        assert ast.literal_eval(literal.decode()) == contents.decode()
+
+        size = os.path.getsize(file_name)
+        totals[0] += size
+        line = '{:<34} {:>7.0f}'.format(os.path.basename(file_name),
+                                       size / 1024)
+        for i, (name, function, mode) in enumerate(versions):
+            best, peak = measure(function, file_name, mode)
+            totals[i + 1] += best
+            line += ' {:>10.2f} {:>6.1f}'.format(best * 1000, peak / 2 ** 20)
+        print(line)
+
+    print('{:<34} {:>7.0f}'.format('total', totals[0] / 1024) + ''.join(
+        ' {:>10.2f} {:>6}'.format(total * 1000, '')
+        for total in totals[1:]))
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+""" Cost of naming new meshes & copies as the scene grows:
+
+    - before: trying name, name1, name2, ... until one is not in the scene
+      (the lookups are O(1), but there are as many as meshes with the name)
+    - after: scene_registry.NameAllocator, which starts at the lowest number
+      that might be free
+
+    Both get the same names: a random mix of new meshes, copies & deletes is
+    run with both & the names are compared first. Run from the project
+    directory:
+    python3 benchmarks/bench_name_allocation.py
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from python.modules import scene_registry
+
+SCENE_SIZES = (100, 1000, 5000)
+CHECK_OPERATIONS = 20000
+TYPES = ('Chair', 'Chair1', 'Table', 'Lamp')
+
+
+def legacy_name(name, used_names):
+    """ The previous naming (utility_module.get_name_for_new_mesh /
+        get_name_for_copy), kept here as the reference.
+    """
+    original_name = name
+    index = 1
+    while name in used_names:
+        name = original_name + str(index)
+        index += 1
+    return name
+
+
+def check_names():
+    random.seed(1)
+    legacy = set()
+    registry = scene_registry.SceneRegistry()
+
+    for _ in range(CHECK_OPERATIONS):
+        action = random.random()
+        if action < 0.5 or not legacy:
+            base = random.choice(TYPES)
+        elif action < 0.7:
+            base = random.choice(sorted(legacy)) + "_copy"
+        else:
+            mesh_id = random.choice(sorted(legacy))
+            legacy.discard(mesh_id)
+            registry.remove(mesh_id)
+            continue
+
+        expected = legacy_name(base, legacy)
+        name = registry.names.allocate(base)
+        if name != expected:
+            raise AssertionError('{} != {}'.format(name, expected))
+        legacy.add(expected)
+        registry.reserve(name)
+
+        if random.random() < 0.001:
+            legacy.clear()
+            registry.clear()
+
+
+def measure_legacy(size):
+    registry = scene_registry.SceneRegistry()
+    start = time.perf_counter()
+    for _ in range(size):
+        registry.reserve(legacy_name('Chair', registry))
+        registry.reserve(legacy_name('Chair_copy', registry))
+    return (time.perf_counter() - start) / (2 * size)
+
+
+def measure_allocator(size):
+    registry = scene_registry.SceneRegistry()
+    start = time.perf_counter()
+    for _ in range(size):
+        registry.reserve(registry.names.name_for_new_mesh(None, 'Chair'))
+        registry.reserve(registry.names.name_for_copy('Chair'))
+    return (time.perf_counter() - start) / (2 * size)
+
+
+def main():
+    check_names()
+    print('same names for {} random operations'.format(CHECK_OPERATIONS))
+
+    print('{:<10} {:>7} {:>12}'.format('', 'meshes', 'name us'))
+    for size in SCENE_SIZES:
+        for name, measure in (('probing', measure_legacy),
+                              ('allocator', measure_allocator)):
+            print('{:<10} {:>7} {:>12.2f}'.format(
+                name, size, measure(size) * 1e6))
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
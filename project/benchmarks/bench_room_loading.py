@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+""" Prepares the meshes of the bundled rooms (rooms/*.json) like
+    Window.load_state does in inline mode, once per mesh as before and once
+    grouped by file in the thread pool of the AssetLoader, and reports the
+    number of distinct files, the bytes read and the wall time.
+
+    Run from the project directory: python3 benchmarks/bench_room_loading.py
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from PyQt5 import QtCore
+
+from python.modules import asset_loader
+from python.modules import utility_module as um
+
+ROOMS_GLOB = 'rooms/*.json'
+
+
+def load_per_mesh(meshes):
+    """ Before: every mesh is read & encoded on its own. """
+    start = time.perf_counter()
+    bytes_read = 0
+    for mesh in meshes:
+        um.prepare_mesh_payload(mesh["fileName"])
+        bytes_read += os.path.getsize(mesh["fileName"])
+    return len(meshes), bytes_read, time.perf_counter() - start
+
+
+def load_grouped(app, meshes):
+    """ After: one task per distinct file in the asset loader's pool. """
+    file_names = list(dict.fromkeys(mesh["fileName"] for mesh in meshes))
+    metrics = asset_loader.LoadMetrics(file_names, file_names)
+
+    loader = asset_loader.AssetLoader()
+
+    def done(file_name):
+        if metrics.mesh_done(file_name):
+            app.quit()
+
+    for file_name in file_names:
+        loader.submit(um.prepare_mesh_payload, (file_name,),
+                      lambda result, f=file_name: done(f),
+                      lambda error, f=file_name: done(f), file_name)
+    app.exec_()
+    loader.wait()
+
+    return metrics.unique_files, metrics.bytes_read, metrics.wall_time
+
+
+def main():
+    app = QtCore.QCoreApplication(sys.argv)
+
+    print('{:<16} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+        'room', 'meshes', 'files', 'old MB', 'new MB', 'old s', 'new s'))
+
+    for room_file in sorted(glob.glob(ROOMS_GLOB)):
+        with open(room_file) as file:
+            meshes = json.load(file)["meshes"]
+
+        _, old_bytes, old_time = load_per_mesh(meshes)
+        files, new_bytes, new_time = load_grouped(app, meshes)
+
+        print('{:<16} {:>7} {:>7} {:>9.1f} {:>9.1f} {:>9.3f} {:>9.3f}'.format(
+            os.path.basename(room_file), len(meshes), files,
+            old_bytes / 2 ** 20, new_bytes / 2 ** 20, old_time, new_time))
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+
+""" Drives the Window with a headless_scene.HeadlessScene instead of the
+    web view & times the scene operations for each room (rooms/*.json):
+
+    - load_state (until all meshes are loaded)
+    - select_mesh for every mesh
+    - a move of every mesh (save_state + translation), then undo & redo of
+      all of them
+
+    The time includes what the JS component would be sent & answer, but
+    not the rendering. Run from the project directory:
+    QT_QPA_PLATFORM=offscreen python3 benchmarks/bench_scene_operations.py
+
+    With --check, the same operations (plus adding, duplicating & deleting
+    meshes) are checked instead of timed: the headless scene, the scene
+    registry, the list & the scene mirror must agree, and undo & redo must
+    bring back the previous meshes. Exits with status 1 if a check fails,
+    so it can run in CI without a browser.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from PyQt5 import QtWidgets
+
+import system_demo
+from python.modules import js_interface_module as js
+from python.modules import headless_scene
+from python.modules import asset_index
+
+ROOMS_GLOB = 'rooms/*.json'
+# meshes per room that are selected / moved etc. in the --check mode
+CHECKED_MESHES = 8
+
+
+def wait_until(app, condition, timeout=30):
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end:
+            raise RuntimeError('timeout')
+        app.processEvents()
+
+
+def settle(app, window):
+    """ Sends everything that is queued & waits for the meshes &
+        textures.
+    """
+    js.SetupScene.flush()
+    wait_until(app, lambda: window.scene.loading == 0 and
+               not window.asset_loader.is_busy() and
+               len(js.SetupScene.queue) == 0)
+
+
+def measure(name, function, app, window, count):
+    start = time.perf_counter()
+    function()
+    settle(app, window)
+    seconds = time.perf_counter() - start
+    print('    {:<24} {:>10.1f} ms {:>10.3f} ms / mesh'.format(
+        name, seconds * 1000, seconds * 1000 / max(count, 1)))
+
+
+def snapshot(scene):
+    """ The meshes of the headless scene: id -> transform & file. """
+    return {mesh.id: (mesh.type, mesh.file_name,
+                      [round(value, 6) for value in
+                       mesh.position + mesh.rotation + mesh.scaling])
+            for mesh in scene.meshes.values()}
+
+
+def canonical(state):
+    state = dict(state)
+    state["meshes"] = sorted(state["meshes"], key=lambda mesh: mesh["id"])
+    return json.dumps(state, sort_keys=True)
+
+
+class Checker:
+    def __init__(self, app, window, scene):
+        self.app = app
+        self.window = window
+        self.scene = scene
+        self.failures = 0
+
+    def expect(self, condition, message):
+        if not condition:
+            self.failures += 1
+            print('    FAILED:', message)
+
+    def check_consistent(self, step):
+        """ The Window's bookkeeping matches the (headless) scene. """
+        settle(self.app, self.window)
+        ids = set(self.scene.meshes)
+        self.expect(set(self.window.scene) == ids,
+                    step + ': registry != scene')
+        self.expect(self.window.mesh_list.rowCount() == len(ids),
+                    step + ': list != scene')
+
+        saved = self.scene.scene_settings()
+        saved["meshes"] = [self.scene.mesh_data(mesh)
+                           for mesh in self.scene.meshes.values()]
+        self.expect(canonical(self.window.scene_mirror.state()) ==
+                    canonical(saved), step + ': mirror != scene')
+
+    def check_undo_redo(self, step, change, steps=1):
+        """ change() must make steps undo states; undoing them must
+            restore the scene, redoing them the changed one.
+        """
+        before = snapshot(self.scene)
+        change()
+        self.check_consistent(step)
+        after = snapshot(self.scene)
+        self.expect(after != before, step + ': nothing changed')
+
+        for _ in range(steps):
+            self.window.request_undo()
+            settle(self.app, self.window)
+        self.check_consistent(step + ' + undo')
+        self.expect(snapshot(self.scene) == before,
+                    step + ': undo did not restore the scene')
+
+        for _ in range(steps):
+            self.window.redo()
+            settle(self.app, self.window)
+        self.check_consistent(step + ' + redo')
+        self.expect(snapshot(self.scene) == after,
+                    step + ': redo did not restore the change')
+
+    def check_room(self, scene_json):
+        window = self.window
+        room = json.loads(scene_json)
+
+        window.load_state(scene_json)
+        self.check_consistent('load_state')
+        self.expect(set(self.scene.meshes) ==
+                    set(mesh["id"] for mesh in room["meshes"]),
+                    'load_state: not the meshes of the room')
+
+        meshes = list(window.scene)[:CHECKED_MESHES]
+        for mesh in meshes:
+            window.select_mesh(mesh)
+            settle(self.app, window)
+            self.expect(window.selected_mesh == mesh and
+                        self.scene.highlighted_mesh is not None and
+                        self.scene.highlighted_mesh.id == mesh,
+                        'select_mesh: ' + mesh + ' is not selected')
+
+        def move():
+            for mesh in meshes:
+                window.save_state("move")
+                js.SetupScene.translate_mesh_by_id(mesh, 0.1, 0, -0.2)
+
+        def add():
+            mesh = room["meshes"][0]
+            window.request_add_mesh(mesh["fileName"], mesh["type"])
+
+        def duplicate():
+            window.request_duplicate_mesh(meshes[0])
+
+        def delete():
+            window.save_state("remove_mesh")
+            window.delete_mesh(meshes[-1])
+
+        self.check_undo_redo('move', move, len(meshes))
+        self.check_undo_redo('add', add)
+        self.check_undo_redo('duplicate', duplicate)
+        self.check_undo_redo('delete', delete)
+
+
+def check():
+    app = QtWidgets.QApplication(sys.argv)
+    scene = headless_scene.HeadlessScene(asset_index.AssetIndex())
+    window = system_demo.Window(None, app, scene)
+    checker = Checker(app, window, scene)
+
+    for room_file in sorted(glob.glob(ROOMS_GLOB)):
+        with open(room_file) as file:
+            scene_json = file.read()
+
+        print(os.path.basename(room_file))
+        failures = checker.failures
+        checker.check_room(scene_json)
+        if checker.failures == failures:
+            print('    ok')
+
+    return checker.failures == 0
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+    scene = headless_scene.HeadlessScene(asset_index.AssetIndex())
+    window = system_demo.Window(None, app, scene)
+
+    for room_file in sorted(glob.glob(ROOMS_GLOB)):
+        with open(room_file) as file:
+            scene_json = file.read()
+
+        print(os.path.basename(room_file))
+        measure('load_state', lambda: window.load_state(scene_json), app,
+                window, len(json.loads(scene_json)['meshes']))
+        meshes = list(window.scene)
+
+        def select_all():
+            for mesh in meshes:
+                window.select_mesh(mesh)
+
+        def move_all():
+            for mesh in meshes:
+                window.save_state("move")
+                js.SetupScene.translate_mesh_by_id(mesh, 0.1, 0, 0)
+
+        def undo_all():
+            for mesh in meshes:
+                window.request_undo()
+                js.SetupScene.flush()
+
+        def redo_all():
+            for mesh in meshes:
+                window.redo()
+                js.SetupScene.flush()
+
+        measure('select_mesh', select_all, app, window, len(meshes))
+        measure('move', move_all, app, window, len(meshes))
+        measure('undo', undo_all, app, window, len(meshes))
+        measure('redo', redo_all, app, window, len(meshes))
+
+    print(js.SetupScene.stats())
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if '--check' in sys.argv:
+        sys.exit(0 if check() else 1)
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+""" Cost of adding, selecting & deleting a mesh as the scene grows:
+
+    - before: Window.meshes (list) & the QListWidget, kept in sync by row
+      (list.index, del, takeItem, ...)
+    - after: scene_registry.SceneRegistry & the SceneListModel of the
+      QListView
+
+    For each scene size, the scene is filled up to the size, then meshes
+    are selected (like select_mesh does in the list) & deleted at random
+    positions. Run from the project directory:
+    QT_QPA_PLATFORM=offscreen python3 benchmarks/bench_scene_registry.py
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from PyQt5 import QtCore, QtWidgets
+
+from python.modules import scene_registry
+
+SCENE_SIZES = (100, 1000, 5000)
+OPERATIONS = 200
+
+
+class LegacyScene:
+    """ The previous bookkeeping of the Window, kept here as the
+        reference.
+    """
+
+    def __init__(self):
+        self.meshes = []
+        self.list_widget = QtWidgets.QListWidget()
+
+    def add(self, mesh_id):
+        self.list_widget.addItem(mesh_id)
+        self.meshes.append(mesh_id)
+
+    def select(self, mesh_id):
+        if mesh_id in self.meshes:
+            selection_model = self.list_widget.selectionModel()
+            selection_model.clear()
+            selected_index = self.meshes.index(mesh_id)
+            new_selection = self.list_widget.indexFromItem(
+                self.list_widget.item(selected_index))
+            selection_model.select(new_selection,
+                                   QtCore.QItemSelectionModel.Select)
+
+    def delete(self, mesh_id):
+        if mesh_id in self.meshes:
+            index = self.meshes.index(mesh_id)
+            del self.meshes[index]
+            self.list_widget.takeItem(index)
+
+
+class RegistryScene:
+    """ The same with the registry (as the Window uses it now). """
+
+    def __init__(self):
+        self.scene = scene_registry.SceneRegistry()
+        self.mesh_list = scene_registry.SceneListModel(self.scene)
+        self.list_view = QtWidgets.QListView()
+        self.list_view.setModel(self.mesh_list)
+
+    def add(self, mesh_id):
+        self.scene.reserve(mesh_id)
+        self.mesh_list.mesh_loaded(mesh_id)
+
+    def select(self, mesh_id):
+        if self.scene.is_loaded(mesh_id):
+            selection_model = self.list_view.selectionModel()
+            selection_model.clear()
+            selection_model.select(self.mesh_list.index_of(mesh_id),
+                                   QtCore.QItemSelectionModel.Select)
+
+    def delete(self, mesh_id):
+        self.mesh_list.remove_mesh(mesh_id)
+
+
+def measure(scene_class, size):
+    random.seed(size)
+    scene = scene_class()
+    ids = ['mesh' + str(i) for i in range(size)]
+
+    start = time.perf_counter()
+    for mesh_id in ids:
+        scene.add(mesh_id)
+    add = (time.perf_counter() - start) / size
+
+    picked = random.sample(ids, min(OPERATIONS, size // 2))
+    start = time.perf_counter()
+    for mesh_id in picked:
+        scene.select(mesh_id)
+    select = (time.perf_counter() - start) / len(picked)
+
+    start = time.perf_counter()
+    for mesh_id in picked:
+        scene.delete(mesh_id)
+    delete = (time.perf_counter() - start) / len(picked)
+
+    return add, select, delete
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+
+    print('{:<10} {:>7} {:>12} {:>12} {:>12}'.format(
+        '', 'meshes', 'add us', 'select us', 'delete us'))
+    for size in SCENE_SIZES:
+        for name, scene_class in (('list', LegacyScene),
+                                  ('registry', RegistryScene)):
+            add, select, delete = measure(scene_class, size)
+            print('{:<10} {:>7} {:>12.1f} {:>12.1f} {:>12.1f}'.format(
+                name, size, add * 1e6, select * 1e6, delete * 1e6))
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
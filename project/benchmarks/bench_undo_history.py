@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+
+""" Size of the undo history & time of undo as the scene grows:
+
+    - full: every state is stored whole (keyframe_interval=1)
+    - delta: the changes to the state before, with keyframes
+    - delta + zlib: the same, compressed (the default)
+
+    Each step moves one mesh (every 10th adds a mesh, every 25th removes
+    one), like dragging the meshes around in the room. Then everything is
+    undone (undo + current_state, as Window.undo uses them). Run from the
+    project directory:
+    python3 benchmarks/bench_undo_history.py
+
+    With --check, random sequences of add_action, undo & redo (with
+    different step limits, keyframe intervals & compression) are run on
+    the UndoUtility and on BaselineUndo, which keeps whole states like the
+    UndoUtility did before the deltas; they must return the same states.
+    Histories that are limited by their size must keep the newest states.
+    Exits with status 1 if there are mismatches.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from python.modules import scene_state
+from python.modules import undo_utility
+
+SCENE_SIZES = (30, 300, 3000)
+STEPS = 200
+
+# random sequences & their length in the --check mode
+CHECK_SEQUENCES = 200
+CHECK_STEPS = 60
+
+
+def make_mesh(number):
+    return {"id": "Chair" + str(number), "type": "Chair",
+            "fileName": "assets/models/chair.babylon",
+            "pos": [random.uniform(-3, 3), 0.0, random.uniform(-3, 3)],
+            "rot": [0.0, random.uniform(0, 6.28), 0.0],
+            "scale": [1.0, 1.0, 1.0]}
+
+
+def make_states(size):
+    random.seed(size)
+    meshes = [make_mesh(i) for i in range(size)]
+    state = {"meshes": meshes, "room": {"x": 6.0, "y": 6.0},
+             "floor": {"fileName": "parquet.jpg", "textureName": "parquet",
+                       "type": "floor"},
+             "selection": "None"}
+    states = []
+    for step in range(STEPS):
+        meshes = list(state["meshes"])
+        if step % 10 == 9:
+            meshes.append(make_mesh(size + step))
+        elif step % 25 == 24:
+            del meshes[random.randrange(len(meshes))]
+        else:
+            index = random.randrange(len(meshes))
+            mesh = dict(meshes[index])
+            mesh["pos"] = [mesh["pos"][0] + 0.1, 0.0, mesh["pos"][2]]
+            meshes[index] = mesh
+        state = dict(state, meshes=meshes, selection=meshes[-1]["id"])
+        states.append(scene_state.freeze_state(state))
+    return states
+
+
+def measure(states, **options):
+    history = undo_utility.UndoUtility(max_bytes=float('inf'), **options)
+
+    start = time.perf_counter()
+    for state in states:
+        history.add_action("move", state)
+    add = (time.perf_counter() - start) / len(states)
+    size = history.total_bytes / len(states)
+
+    history.set_first_state_at_undo(states[-1])
+    start = time.perf_counter()
+    for _ in states:
+        history.undo()
+        history.current_state(True)
+    undo = (time.perf_counter() - start) / len(states)
+
+    return size, add, undo
+
+
+class BaselineUndo:
+    """ The UndoUtility before the history was stored as deltas: the
+        whole states in a ring of max_steps (a deque instead of
+        utility_module.RingArray, which works the same).
+    """
+
+    def __init__(self, max_steps):
+        self.ring = deque(maxlen=max_steps)
+        self.current_index = 0
+        self.first_state_at_undo = None
+        self.currently_undoing = False
+
+    def add_action(self, action, state):
+        self.currently_undoing = False
+        self.first_state_at_undo = None
+
+        if self.current_index != len(self.ring) - 1 and len(self.ring) != 0:
+            # (range(0, current_index) in the original, so nothing is
+            # kept after everything was undone)
+            kept = list(self.ring)[:max(self.current_index, 0)]
+            self.ring = deque(kept, maxlen=self.ring.maxlen)
+
+        self.ring.append({"action": action, "state": state})
+        self.current_index = len(self.ring) - 1
+
+    def undo(self):
+        if self.current_index not in range(0, len(self.ring)):
+            return None
+
+        self.currently_undoing = True
+        index = self.current_index
+        self.current_index -= 1
+        return self.ring[index]
+
+    def set_first_state_at_undo(self, state):
+        if not self.currently_undoing:
+            self.first_state_at_undo = state
+
+    def redo(self):
+        if not self.currently_undoing:
+            return None
+
+        if self.current_index == len(self.ring) - 2:
+            self.current_index += 1
+            return {"state": self.first_state_at_undo,
+                    "action": "not identified"}
+        elif self.current_index < len(self.ring) - 2:
+            self.current_index += 1
+            return self.ring[self.current_index + 1]
+        return None
+
+    def current_state(self, after_undo=True):
+        if len(self.ring) == 0:
+            return None
+        if after_undo:
+            if self.current_index == len(self.ring) - 2:
+                return {"state": self.first_state_at_undo,
+                        "action": "not identified"}
+            return self.ring[self.current_index + 2]
+        return self.ring[self.current_index]
+
+
+def random_change(state, rng, number):
+    """ The state after a random action (like the ones of the Window). """
+    meshes = list(state["meshes"])
+    kind = rng.random()
+    if kind < 0.15 or len(meshes) == 0:
+        meshes.insert(rng.randint(0, len(meshes)), make_mesh(number))
+    elif kind < 0.25:
+        del meshes[rng.randrange(len(meshes))]
+    elif kind < 0.3:
+        rng.shuffle(meshes)
+    elif kind < 0.35:
+        return dict(state, room={"x": rng.choice((6.0, 8.0)), "y": 6.0})
+    elif kind < 0.4:
+        if "floor" in state:
+            return {key: value for key, value in state.items()
+                    if key != "floor"}
+        return dict(state, floor={"fileName": "parquet.jpg",
+                                  "textureName": "parquet",
+                                  "type": "floor"})
+    else:
+        index = rng.randrange(len(meshes))
+        mesh = dict(meshes[index])
+        mesh["pos"] = [mesh["pos"][0] + rng.uniform(-1, 1), 0.0,
+                       mesh["pos"][2]]
+        meshes[index] = mesh
+    selection = meshes[-1]["id"] if meshes else "None"
+    return dict(state, meshes=meshes, selection=selection)
+
+
+def same(a, b):
+    """ Whether the results (entries with "action" & "state", or None)
+        are equal.
+    """
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+def check_sequence(seed):
+    """ Returns the number of mismatches in one random sequence. """
+    rng = random.Random(seed)
+    random.seed(seed)
+    max_steps = rng.randint(2, 20)
+    history = undo_utility.UndoUtility(
+        max_bytes=float('inf'), keyframe_interval=rng.randint(1, 6),
+        compress=rng.random() < 0.5, max_steps=max_steps,
+        coalesce_window=0)
+    baseline = BaselineUndo(max_steps)
+    # limited by size only: must keep the newest states of an unlimited
+    # history (drop_oldest, drop_first)
+    limited = undo_utility.UndoUtility(
+        max_bytes=rng.randint(500, 3000), keyframe_interval=4,
+        compress=False, coalesce_window=0)
+    unlimited = []
+
+    mismatches = 0
+    state = {"meshes": [make_mesh(i) for i in range(rng.randint(0, 5))],
+             "room": {"x": 6.0, "y": 6.0}, "selection": "None"}
+    for step in range(CHECK_STEPS):
+        operation = rng.choice(("add", "add", "add", "undo", "undo",
+                                "redo"))
+        if operation == "add":
+            action = rng.choice(("move", "add_mesh", "remove_mesh"))
+            history.add_action(action, state)
+            baseline.add_action(action, state)
+            limited.add_action(action, state)
+            unlimited.append(state)
+            state = random_change(state, rng, 100 + step)
+            results = [(None, None)]
+        elif operation == "undo":
+            history.set_first_state_at_undo(state)
+            baseline.set_first_state_at_undo(state)
+            results = [(history.undo(), baseline.undo()),
+                       (history.current_state(True),
+                        baseline.current_state(True))]
+        else:
+            results = [(history.redo(), baseline.redo()),
+                       (history.current_state(False),
+                        baseline.current_state(False))]
+
+        for new, old in results:
+            if not same(new, old):
+                mismatches += 1
+        if operation != "add" and results[0][1] is not None:
+            state = results[0][1]["state"]
+
+        kept = len(limited.entries)
+        if not same([limited.history_item(i)["state"] for i in range(kept)],
+                    unlimited[len(unlimited) - kept:]):
+            mismatches += 1
+
+    return mismatches
+
+
+def check():
+    failed = 0
+    for seed in range(CHECK_SEQUENCES):
+        mismatches = check_sequence(seed)
+        if mismatches > 0:
+            failed += 1
+            print('sequence {}: {} mismatches'.format(seed, mismatches))
+
+    print('{} of {} random sequences match the baseline'.format(
+        CHECK_SEQUENCES - failed, CHECK_SEQUENCES))
+    return failed == 0
+
+
+def main():
+    print('{:<14} {:>7} {:>14} {:>10} {:>10}'.format(
+        '', 'meshes', 'bytes / step', 'add ms', 'undo ms'))
+    for size in SCENE_SIZES:
+        states = make_states(size)
+        for name, options in (
+                ('full', dict(keyframe_interval=1, compress=False)),
+                ('delta', dict(compress=False)),
+                ('delta + zlib', dict())):
+            step_bytes, add, undo = measure(states, **options)
+            print('{:<14} {:>7} {:>14.0f} {:>10.3f} {:>10.3f}'.format(
+                name, size, step_bytes, add * 1000, undo * 1000))
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if '--check' in sys.argv:
+        sys.exit(0 if check() else 1)
+    main()
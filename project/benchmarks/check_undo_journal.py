@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+
+""" Checks the on-disk format of the undo journal (undo_journal.py):
+
+    - records of entries are read back as they were written
+    - replaying the ENTRY, TRUNCATE, DROP, FIRST & RESET records gives the
+      entries of the UndoUtility, the SCENE records its scene
+    - a torn (incomplete) or damaged end of the file is ignored
+    - compaction (a temporary file & os.replace) keeps every state_at of
+      the history & the scene
+
+    Exits with status 1 if a check fails. Run from the project directory:
+    python3 benchmarks/check_undo_journal.py
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from python.modules import scene_state
+from python.modules import undo_journal
+from python.modules import undo_utility
+
+STEPS = 300
+
+
+class Checker:
+    def __init__(self, directory):
+        self.directory = directory
+        self.failures = 0
+
+    def expect(self, condition, message):
+        print('    {:<50} {}'.format(message, 'ok' if condition else
+                                     'FAILED'))
+        if not condition:
+            self.failures += 1
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+
+def make_mesh(rng, number):
+    return {"id": "Chair" + str(number), "type": "Chair",
+            "fileName": "assets/models/chair.babylon",
+            "pos": [rng.uniform(-3, 3), 0.0, rng.uniform(-3, 3)],
+            "rot": [0.0, rng.uniform(0, 6.28), 0.0],
+            "scale": [1.0, 1.0, 1.0]}
+
+
+def random_scene(rng, scene, number):
+    meshes = list(scene["meshes"])
+    if rng.random() < 0.2 or not meshes:
+        meshes.append(make_mesh(rng, number))
+    elif rng.random() < 0.2:
+        del meshes[rng.randrange(len(meshes))]
+    else:
+        index = rng.randrange(len(meshes))
+        mesh = dict(meshes[index])
+        mesh["pos"] = [mesh["pos"][0] + 0.1, 0.0, mesh["pos"][2]]
+        meshes[index] = mesh
+    return scene_state.freeze_state(dict(
+        scene, meshes=meshes,
+        selection=meshes[-1]["id"] if meshes else "None"))
+
+
+def dumps(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def states(history):
+    return [dumps(history.state_at(i)) for i in range(len(history.entries))]
+
+
+def restored_states(session):
+    history = undo_utility.UndoUtility(max_bytes=float('inf'))
+    history.load_entries(session.entries)
+    return states(history)
+
+
+def record_kinds(path):
+    """ The kinds of the records in the file, in order. """
+    with open(path, 'rb') as file:
+        data = file.read()
+    kinds = []
+    offset = len(undo_journal.JOURNAL_MAGIC)
+    while offset + undo_journal.RECORD_HEADER.size <= len(data):
+        kind, length, crc = undo_journal.RECORD_HEADER.unpack_from(
+            data, offset)
+        kinds.append(kind)
+        offset += undo_journal.RECORD_HEADER.size + length
+    return kinds
+
+
+def run_session(path, rng, compact_bytes=undo_journal.JOURNAL_COMPACT_BYTES):
+    """ Changes a journaled history at random: adds, undo followed by
+        add (TRUNCATE), the oldest entries dropped (DROP & FIRST) & a
+        reset. Returns the history & the last scene.
+    """
+    history = undo_utility.UndoUtility(max_bytes=float('inf'),
+                                       keyframe_interval=5, max_steps=20,
+                                       coalesce_window=0)
+    journal = undo_journal.UndoJournal(path, compact_bytes=compact_bytes,
+                                       fsync_interval=0.01)
+    journal.start(history)
+    history.journal = journal
+
+    scene = scene_state.freeze_state({"meshes": [], "room": {"x": 6.0,
+                                                             "y": 6.0},
+                                      "selection": "None"})
+    for step in range(STEPS):
+        if step == STEPS // 3:
+            history.reset()
+        if rng.random() < 0.15:
+            history.set_first_state_at_undo(scene)
+            for _ in range(rng.randint(1, 3)):
+                history.undo()
+        history.add_action(rng.choice(("move", "add_mesh", "remove_mesh")),
+                           scene)
+        scene = random_scene(rng, scene, step)
+        journal.scene_changed(scene)
+
+    journal.close()
+    return history, scene, journal
+
+
+def check_round_trip(checker):
+    print('record round trip')
+    ok = True
+    for keyframe in (True, False):
+        for compress in (True, False):
+            entry = undo_utility.UndoEntry.encode(
+                'move ä', keyframe, {"meshes": [], "x": [1, 2]},
+                compress)
+            data = undo_journal.record(undo_journal.ENTRY,
+                                       undo_journal.entry_data(entry))
+            kind, length, crc = undo_journal.RECORD_HEADER.unpack_from(data)
+            read = undo_journal.read_entry(
+                data[undo_journal.RECORD_HEADER.size:])
+            ok = ok and kind == undo_journal.ENTRY and \
+                length == len(data) - undo_journal.RECORD_HEADER.size and \
+                (read.action, read.keyframe, read.data, read.compressed) == \
+                (entry.action, entry.keyframe, entry.data, entry.compressed)
+    checker.expect(ok, 'entries (keyframe / delta, compressed / not)')
+
+
+def check_replay(checker):
+    print('replay')
+    path = checker.path('replay.bin')
+    history, scene, journal = run_session(path, random.Random(1))
+    kinds = set(record_kinds(path))
+    checker.expect(kinds >= {undo_journal.ENTRY, undo_journal.TRUNCATE,
+                             undo_journal.DROP, undo_journal.FIRST,
+                             undo_journal.RESET, undo_journal.SCENE},
+                   'all kinds of records were written')
+
+    session = undo_journal.UndoJournal(path).read()
+    checker.expect(session is not None and
+                   restored_states(session) == states(history),
+                   'TRUNCATE / DROP / FIRST / RESET replayed')
+    checker.expect(session is not None and
+                   dumps(session.scene) == dumps(scene), 'scene replayed')
+    return path, session
+
+
+def check_damaged_end(checker, path, session):
+    print('damaged end')
+    expected = restored_states(session)
+
+    garbage = checker.path('garbage.bin')
+    shutil.copy(path, garbage)
+    with open(garbage, 'ab') as file:
+        file.write(undo_journal.RECORD_HEADER.pack(undo_journal.ENTRY, 80, 0))
+        file.write(b'garbage')
+    read = undo_journal.UndoJournal(garbage).read()
+    checker.expect(read is not None and restored_states(read) == expected,
+                   'garbage after the last record is ignored')
+
+    # a file whose last record was only written in part
+    scene = scene_state.freeze_state({"meshes": [], "room": {"x": 6.0,
+                                                             "y": 6.0}})
+    entries = [undo_utility.UndoEntry.encode(str(i), True, scene, False)
+               for i in range(3)]
+    data = undo_journal.JOURNAL_MAGIC + \
+        undo_journal.UndoJournal(path).scene_record(True, scene) + \
+        b''.join(undo_journal.record(undo_journal.ENTRY,
+                                     undo_journal.entry_data(entry))
+                 for entry in entries)
+    torn = checker.path('torn.bin')
+    for cut in (1, 5, 20):
+        with open(torn, 'wb') as file:
+            file.write(data[:-cut])
+        read = undo_journal.UndoJournal(torn).read()
+        checker.expect(read is not None and
+                       [entry.action for entry in read.entries] == ['0', '1'],
+                       'torn last record ({} bytes missing)'.format(cut))
+
+
+def check_compaction(checker):
+    print('compaction')
+    path = checker.path('compact.bin')
+    replaced = []
+    os_replace = os.replace
+
+    def replace(source, destination):
+        replaced.append((source, destination))
+        os_replace(source, destination)
+
+    undo_journal.os.replace = replace
+    try:
+        history, scene, journal = run_session(path, random.Random(2),
+                                              compact_bytes=20000)
+    finally:
+        undo_journal.os.replace = os_replace
+
+    checker.expect(journal.compactions > 2 and
+                   all(source == path + '.tmp' and destination == path
+                       for source, destination in replaced) and
+                   len(replaced) == journal.compactions,
+                   'compacted {} times via a temporary file'.format(
+                       journal.compactions))
+    checker.expect(not os.path.exists(path + '.tmp'),
+                   'no temporary file is left')
+
+    session = undo_journal.UndoJournal(path).read()
+    checker.expect(session is not None and
+                   restored_states(session) == states(history),
+                   'state_at of every entry is kept')
+    checker.expect(session is not None and
+                   dumps(session.scene) == dumps(scene), 'scene is kept')
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    checker = Checker(directory)
+    try:
+        check_round_trip(checker)
+        path, session = check_replay(checker)
+        check_damaged_end(checker, path, session)
+        check_compaction(checker)
+    finally:
+        shutil.rmtree(directory)
+
+    return checker.failures == 0
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.exit(0 if main() else 1)
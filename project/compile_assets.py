@@ -0,0 +1,9 @@
+#!/usr/bin/python3
+
+import sys
+
+from python.modules import asset_compiler
+
+
+if __name__ == '__main__':
+    sys.exit(asset_compiler.main())
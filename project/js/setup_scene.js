@@ -25,6 +25,22 @@ var isMouseDown = false;
 var scaleInitialYBottom = undefined;
 
 var meshes = {};
+// content hash -> image data (data URI or URL), filled by registerTexture
+var textureRegistry = {};
+// url -> {"mesh": hidden mesh to clone (null while it is loading),
+//         "waiting": instances that were added while it was loading,
+//         "dropped": dispose the mesh once it is loaded}
+// (python keeps them as long as the models are in its model cache)
+var meshTemplates = {};
+// incremented by cancelMeshLoads; meshes whose import was started before
+// are dropped when they are loaded
+var loadGeneration = 0;
+// what changed since the last on_scene_changed (see sendSceneChanges)
+var changedMeshIds = [];
+var changedMeshes = {};
+var removedMeshes = {};
+var sceneSettingsChanged = false;
+var sceneChangesScheduled = false;
 var highlightedMesh;
 var floorSizeX, floorSizeY;
 
@@ -54,6 +70,7 @@ function createScene(floorX, floorY) {
 
     floorSizeX = floorX;
     floorSizeY = floorY;
+    markSceneSettingsChanged();
 
     createWalls(scene, floorX, floorY);
 }
@@ -63,6 +80,7 @@ function redoScene(floorX, floorY) {
 
     floorSizeX = floorX;
     floorSizeY = floorY;
+    markSceneSettingsChanged();
 
     ground.dispose();
 
@@ -78,6 +96,11 @@ function redoScene(floorX, floorY) {
 jQuery(document).ready(function($) {
     canvas = document.getElementById('my_canvas');
     engine = new BABYLON.Engine(canvas, true);
+    // assets are served by python; there are no .manifest files to check
+    engine.enableOfflineSupport = false;
+    // compiled models (see asset_compiler.py) keep their geometry in a
+    // separate file; load it right away, not when the mesh is first visible
+    BABYLON.SceneLoader.ForceFullSceneLoadingForIncremental = true;
     createScene(6, 6);
         
     engine.runRenderLoop(function() {
@@ -128,34 +151,287 @@ function createWalls(scene, floorX, floorY) {
 
 }
 
+// batch: [[function name, [arguments]], ...]
+function dispatch(batch) {
+    for (var i = 0; i < batch.length; i++) {
+        try {
+            commands[batch[i][0]].apply(null, batch[i][1]);
+        } catch (e) {
+            // an error in one call must not stop the others
+            python_callback.on_js_console_log(batch[i][0] + ": " + e);
+        }
+    }
+    sendSceneChanges();
+}
+
+function markMeshChanged(id) {
+    if (!(id in changedMeshes)) {
+        changedMeshes[id] = true;
+        changedMeshIds.push(id);
+    }
+    scheduleSceneChanges();
+}
+
+function markMeshRemoved(id) {
+    removedMeshes[id] = true;
+    scheduleSceneChanges();
+}
+
+function markSceneSettingsChanged() {
+    sceneSettingsChanged = true;
+    scheduleSceneChanges();
+}
+
+// changes that are not made by dispatch (e.g. dragging, meshes that were
+// loaded from a url) are sent at the next turn of the event loop
+function scheduleSceneChanges() {
+    if (!sceneChangesScheduled) {
+        sceneChangesScheduled = true;
+        setTimeout(sendSceneChanges, 0);
+    }
+}
+
+function meshData(mesh) {
+    return {
+        "id": mesh.id,
+        "type": mesh.mesh_type,
+        "pos": [mesh.position.x, mesh.position.y, mesh.position.z],
+        "rot": [mesh.rotation.x, mesh.rotation.y, mesh.rotation.z],
+        "scale": [mesh.scaling.x, mesh.scaling.y, mesh.scaling.z],
+        "fileName": mesh.modelFileName
+    };
+}
+
+// python keeps a mirror of the scene (see scene_mirror.py), so it does not
+// need saveScene for its undo states. It gets the meshes that were added
+// or changed, the ids of the removed ones &, if they changed, the room
+// size & textures. Must be called before python callbacks that might save
+// the state.
+function sendSceneChanges() {
+    sceneChangesScheduled = false;
+
+    var changes = {"meshes": [], "removed": []};
+    for (var id in removedMeshes) {
+        changes["removed"].push(id);
+    }
+    for (var i = 0; i < changedMeshIds.length; i++) {
+        if (changedMeshIds[i] in meshes) {
+            changes["meshes"].push(meshData(meshes[changedMeshIds[i]]));
+        }
+    }
+    if (sceneSettingsChanged) {
+        changes["scene"] = {
+            "room": {"x": floorSizeX, "y": floorSizeY},
+            "walls": wallTextureData,
+            "floor": groundTextureData};
+    }
+
+    var anything = changes["meshes"].length > 0 ||
+        changes["removed"].length > 0 || sceneSettingsChanged;
+
+    changedMeshIds = [];
+    changedMeshes = {};
+    removedMeshes = {};
+    sceneSettingsChanged = false;
+
+    if (anything) {
+        python_callback.on_scene_changed(changes);
+    }
+}
+
+// images: texture name -> hash of a texture in the textureRegistry
 function addMesh(data, id, images, type, transform, fileName) {
+    addMeshInstances(data, [{"id": id, "type": type, "transform": transform,
+                             "fileName": fileName}], images);
+}
+
+// the model is only imported once for all instances
+// ({"id", "type", "transform", "fileName"}); the others are clones.
+function addMeshInstances(data, instances, images) {
+    var imageData = {};
+    for (var name in images) {
+        imageData[name] = resolveTexture(images[name]);
+    }
+
+    importMeshInstances("", "data:" + data, instances, imageData);
+}
+
+// same as addMeshInstances, but Babylon loads the model (and its textures,
+// which are resolved relative to the model) from the url
+function addMeshInstancesFromUrl(url, instances) {
+    var template = meshTemplates[url];
+    if (template !== undefined) {
+        if (template.mesh === null) {
+            template.waiting = template.waiting.concat(instances);
+        } else {
+            cloneMeshInstances(template.mesh, instances);
+        }
+        return;
+    }
+
+    var separator = url.lastIndexOf("/") + 1;
+
+    importMeshInstances(url.substring(0, separator),
+                        url.substring(separator), instances, null);
+}
+
+function importMeshInstances(rootUrl, sceneFileName, instances, images) {
+    var generation = loadGeneration;
+
+    var onError = function(e) {
+        if (generation !== loadGeneration) {
+            return;
+        }
+        for (var i = 0; i < instances.length; i++) {
+            python_callback.js_mesh_load_error(instances[i].id, "" + e);
+        }
+    };
+
     try {
-        BABYLON.SceneLoader.ImportMesh("", "", "data:" + data, scene,
+        BABYLON.SceneLoader.ImportMesh("", rootUrl, sceneFileName, scene,
         function (newMeshes) {
-            newMeshes[0].id = id;
-            newMeshes[0].mesh_type = type;
-            meshes[id] = newMeshes[0];
-
-            // only called when this is loaded
-            if (transform != null) {
-                loadTransformations(newMeshes[0], transform);
-            } else {
-                var bbox = newMeshes[0].getBoundingInfo().boundingBox;
-                newMeshes[0].position.y -= bbox.minimumWorld.y;
-            }
-
-            // for loading only
-            if (fileName != undefined && fileName != null) {
-                newMeshes[0].modelFileName = fileName;
-            }
-
-            python_callback.js_mesh_loaded(id);
-        }, function(a){}, function(b){}, images);
+            whenGeometryLoaded(newMeshes[0], function() {
+                if (generation !== loadGeneration) {
+                    for (var i = 0; i < newMeshes.length; i++) {
+                        newMeshes[i].dispose();
+                    }
+                    return;
+                }
+
+                // clone before the first one is moved around
+                var instanceMeshes = [newMeshes[0]];
+                for (var i = 1; i < instances.length; i++) {
+                    instanceMeshes.push(newMeshes[0].clone(instances[i].id));
+                }
+
+                for (var i = 0; i < instances.length; i++) {
+                    onMeshImported(instanceMeshes[i], instances[i].id,
+                                   instances[i].type, instances[i].transform,
+                                   instances[i].fileName);
+                }
+            });
+        }, function(a){}, function(scene, message) {
+            onError(message);
+        }, images);
     } catch (e) {
-        python_callback.js_mesh_load_error(id, e);
+        onError(e);
     }
 }
 
+// the geometry of compiled models is loaded after the mesh itself; it must
+// be there before the mesh is cloned
+function whenGeometryLoaded(mesh, callback) {
+    if (mesh.delayLoadState === BABYLON.Engine.DELAYLOADSTATE_LOADING) {
+        scene.executeWhenReady(callback);
+    } else {
+        callback();
+    }
+}
+
+function cloneMeshInstances(template, instances) {
+    for (var i = 0; i < instances.length; i++) {
+        var mesh = template.clone(instances[i].id);
+        mesh.setEnabled(true);
+        onMeshImported(mesh, instances[i].id, instances[i].type,
+                       instances[i].transform, instances[i].fileName);
+    }
+}
+
+// imports the model at the url as a hidden mesh, so addMeshInstancesFromUrl
+// only has to clone it
+function loadMeshTemplate(url) {
+    if (url in meshTemplates) {
+        return;
+    }
+
+    var template = {"mesh": null, "waiting": [], "dropped": false};
+    meshTemplates[url] = template;
+
+    var onLoaded = function(mesh) {
+        mesh.setEnabled(false);
+        template.mesh = mesh;
+
+        cloneMeshInstances(mesh, template.waiting);
+        template.waiting = [];
+
+        if (template.dropped) {
+            mesh.dispose();
+        }
+    };
+
+    var onError = function(e) {
+        if (meshTemplates[url] === template) {
+            delete meshTemplates[url];
+        }
+        // these were added while it was loading; load them the normal way
+        if (template.waiting.length > 0) {
+            addMeshInstancesFromUrl(url, template.waiting);
+        }
+    };
+
+    var separator = url.lastIndexOf("/") + 1;
+    try {
+        BABYLON.SceneLoader.ImportMesh("", url.substring(0, separator),
+            url.substring(separator), scene, function (newMeshes) {
+                whenGeometryLoaded(newMeshes[0], function() {
+                    onLoaded(newMeshes[0]);
+                });
+            }, function(a){}, function(scene, message) {
+                onError(message);
+            });
+    } catch (e) {
+        onError(e);
+    }
+}
+
+// meshes that are being imported are dropped (the templates are still
+// loaded)
+function cancelMeshLoads() {
+    loadGeneration++;
+    for (var url in meshTemplates) {
+        meshTemplates[url].waiting = [];
+    }
+}
+
+// drops the template of the url (meshes in the scene that were cloned from
+// it are not affected)
+function dropMeshTemplate(url) {
+    var template = meshTemplates[url];
+    if (template === undefined) {
+        return;
+    }
+
+    if (template.mesh !== null) {
+        template.mesh.dispose();
+    } else {
+        template.dropped = true;
+    }
+    delete meshTemplates[url];
+}
+
+function onMeshImported(mesh, id, type, transform, fileName) {
+    mesh.id = id;
+    mesh.mesh_type = type;
+    meshes[id] = mesh;
+
+    // only called when this is loaded
+    if (transform != null) {
+        loadTransformations(mesh, transform);
+    } else {
+        var bbox = mesh.getBoundingInfo().boundingBox;
+        mesh.position.y -= bbox.minimumWorld.y;
+    }
+
+    // for loading only
+    if (fileName != undefined && fileName != null) {
+        mesh.modelFileName = fileName;
+    }
+
+    markMeshChanged(id);
+    sendSceneChanges();
+    python_callback.js_mesh_loaded(id);
+}
+
 function duplicateMesh(originalMeshId, newMeshId) {
     if (originalMeshId in meshes) {
         removeHighlight(originalMeshId);
@@ -168,6 +444,8 @@ function duplicateMesh(originalMeshId, newMeshId) {
         newMesh.position.x += bbox.extendSize.x * 2.2;
 
         meshes[newMeshId] = newMesh;
+        markMeshChanged(newMeshId);
+        sendSceneChanges();
         python_callback.js_mesh_loaded(newMeshId);
     }
 }
@@ -189,6 +467,7 @@ function loadTransformations(mesh, transform) {
 function setMeshPosition(id, x, y, z) {
     if (id in meshes) {
         meshes[id].setAbsolutePosition(new BABYLON.Vector3(x, y, z));
+        markMeshChanged(id);
     }
 }
 
@@ -210,6 +489,7 @@ function translateMeshByID(id, x, y, z) {
         meshes[id].position.x += x;
         meshes[id].position.y += y;
         meshes[id].position.z += z;
+        markMeshChanged(id);
 }
 
 function rotateMeshByID(id, x, y, z) {
@@ -230,6 +510,7 @@ function rotateMeshByID(id, x, y, z) {
         meshes[id].rotation.x = x;
         meshes[id].rotation.y = y;
         meshes[id].rotation.z = z;
+        markMeshChanged(id);
     }
 }
 
@@ -238,6 +519,7 @@ function scaleMeshByIDBasic(id, factorX, factorY, factorZ) {
         meshes[id].scaling.x = factorX;
         meshes[id].scaling.y = factorY;
         meshes[id].scaling.z = factorZ;
+        markMeshChanged(id);
     }
 }
 
@@ -270,6 +552,7 @@ function scaleMeshByID(id, factorX, factorY, factorZ) {
         var min_y_after = meshes[id].getBoundingInfo().boundingBox.minimumWorld.y;
 
         meshes[id].position.y += scaleInitialYBottom - min_y_after;
+        markMeshChanged(id);
 
         python_callback.on_js_object_manipulation_performed(id, 'scaled',
                                                             x1, y1, z1);
@@ -329,15 +612,31 @@ function getTranslationRotationScale(mesh_id) {
     python_callback.on_translation_rotation_scale_request(trans, rot, scale);
 }
 
+function registerTexture(hash, data) {
+    textureRegistry[hash] = data;
+}
+
+// textures are referred to by their hash; anything else is used as it is
+function resolveTexture(hashOrData) {
+    if (hashOrData in textureRegistry) {
+        return textureRegistry[hashOrData];
+    }
+    return hashOrData;
+}
+
 function setTextureData(type, textureName, textureData, fileName) {
+    textureData = resolveTexture(textureData);
+
     if (type == "carpet") {
         groundTextureData = {"type": type, "textureName": textureName, "fileName": fileName};
+        markSceneSettingsChanged();
 
         groundMaterial.diffuseTexture = new BABYLON.Texture(textureData, scene);   
         groundMaterial.diffuseTexture.uScale = Math.ceil(floorSizeX / 2);
         groundMaterial.diffuseTexture.vScale = Math.ceil(floorSizeY / 2);
     } else {
         wallTextureData = {"type": type, "textureName": textureName, "fileName": fileName};
+        markSceneSettingsChanged();
 
         wallMaterialVert.diffuseTexture = new BABYLON.Texture(textureData, scene);
         wallMaterialHoriz.diffuseTexture = new BABYLON.Texture(textureData, scene);
@@ -353,10 +652,12 @@ function removeTextureData(type) {
     if (type == "carpet") {
         groundTextureData = undefined;
         groundMaterial.diffuseTexture = null;
+        markSceneSettingsChanged();
     } else {
         wallTextureData = undefined;
         wallMaterialVert.diffuseTexture = null;
         wallMaterialHoriz.diffuseTexture = null;
+        markSceneSettingsChanged();
     }
 }
 
@@ -364,6 +665,7 @@ function removeMesh(mesh_id) {
     if (mesh_id in meshes) {
         meshes[mesh_id].dispose();
         delete meshes[mesh_id];
+        markMeshRemoved(mesh_id);
     }
 }
 
@@ -375,16 +677,10 @@ function saveScene(identifier) {
         "floor": groundTextureData};
 
     for (id in meshes) {    
-        scene_data["meshes"][scene_data["meshes"].length] = {
-            "id": meshes[id].id,
-            "type": meshes[id].mesh_type,
-            "pos": [meshes[id].position.x, meshes[id].position.y, meshes[id].position.z],
-            "rot": [meshes[id].rotation.x, meshes[id].rotation.y, meshes[id].rotation.z],
-            "scale": [meshes[id].scaling.x, meshes[id].scaling.y, meshes[id].scaling.z],
-            "fileName": meshes[id].modelFileName
-        };
+        scene_data["meshes"][scene_data["meshes"].length] = meshData(meshes[id]);
     }
-    python_callback.save_state_result(JSON.stringify(scene_data), identifier);
+    // arrives in python as a dict; no JSON text in between
+    python_callback.save_state_result(scene_data, identifier);
 }
 
 function selectPlane(which) {
@@ -501,6 +797,8 @@ function onMouseUp() {
 function onMouseMove(evt) {
     if (isMouseDown && highlightedMesh != null && dragBugfixActive) {
         dragBugfixActive = false;
+        // the undo state is taken from the mirror before the mesh moves
+        sendSceneChanges();
         python_callback.on_js_obj_drag_start(highlightedMesh.id);
         createPlaneForSelection();
     }
@@ -517,6 +815,7 @@ function onMouseMove(evt) {
 
     var diff = current.subtract(startingPoint);
     highlightedMesh.position.addInPlace(diff);
+    markMeshChanged(highlightedMesh.id);
 
     startingPoint = current;
 }
@@ -578,4 +877,35 @@ function setRoomDimensions(x, y) {
                                        scene);
 
     python_callback.on_js_console_log('js')
-}
\ No newline at end of file
+}
+
+// functions the python component can call with dispatch (see SetupScene in
+// js_interface_module.py)
+var commands = {
+    "addMesh": addMesh,
+    "addMeshInstances": addMeshInstances,
+    "addMeshInstancesFromUrl": addMeshInstancesFromUrl,
+    "loadMeshTemplate": loadMeshTemplate,
+    "dropMeshTemplate": dropMeshTemplate,
+    "cancelMeshLoads": cancelMeshLoads,
+    "duplicateMesh": duplicateMesh,
+    "setMeshPosition": setMeshPosition,
+    "translateMeshByID": translateMeshByID,
+    "rotateMeshByID": rotateMeshByID,
+    "scaleMeshByIDBasic": scaleMeshByIDBasic,
+    "scaleMeshByID": scaleMeshByID,
+    "onScaleEnd": onScaleEnd,
+    "highlight": highlight,
+    "removeHighlight": removeHighlight,
+    "getTranslationRotationScale": getTranslationRotationScale,
+    "registerTexture": registerTexture,
+    "setTextureData": setTextureData,
+    "removeTextureData": removeTextureData,
+    "removeMesh": removeMesh,
+    "saveScene": saveScene,
+    "selectPlane": selectPlane,
+    "setCameraToDefault": setCameraToDefault,
+    "targetCameraToPlane": targetCameraToPlane,
+    "createScene": createScene,
+    "redoScene": redoScene
+};
@@ -0,0 +1,244 @@
+import os
+import hashlib
+from collections import OrderedDict
+
+# default amount of payload data (in bytes) that is kept in memory
+MODEL_CACHE_BUDGET = 64 * 1024 * 1024
+
+
+class ModelCache:
+    """ LRU cache for the prepared data of .babylon model files.
+
+        The cached value is whatever the loader function returns for a file
+        (for the system: the JS string of the mesh and the dict of its
+        texture files), so adding a model that was already added before does not
+        have to read or encode anything again. In URL mode, the JS component
+        imports the models itself; then the value is the URL of a model that
+        the JS component keeps as a template (see on_remove).
+
+        Entries are keyed by the file path and are only valid as long as the
+        file's modification time and size do not change. The cache holds at
+        most max_bytes of data; the least recently used entries are dropped
+        first.
+    """
+
+    def __init__(self, loader, max_bytes=MODEL_CACHE_BUDGET, on_remove=None):
+        """ loader: function that gets a file name and returns the data
+                    that should be cached for it
+            max_bytes: byte budget of the cache
+            on_remove: function that gets the value of an entry that is
+                       dropped (evicted, out of date or invalidated)
+        """
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.on_remove = on_remove
+
+        # path -> (stamp, value, size); the order is the order of use,
+        # i.e. the first entry is the least recently used one.
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_name):
+        """ Returns the cached value for the file, loads it if necessary. """
+        value = self.lookup(file_name)
+        if value is None:
+            value = self.loader(file_name)
+            self.put(file_name, value)
+        return value
+
+    def lookup(self, file_name):
+        """ Returns the cached value for the file or None (without loading
+            it; the caller is expected to put the value after loading).
+        """
+        key = os.path.abspath(file_name)
+        stamp = file_stamp(key)
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def put(self, file_name, value, stamp=None, size=None):
+        """ Stores a value that was prepared somewhere else.
+            size: bytes the value stands for (None: the size of the value,
+                  see payload_size)
+
+            Returns False if the value is too big for the cache.
+        """
+        key = os.path.abspath(file_name)
+        if stamp is None:
+            stamp = file_stamp(key)
+
+        self.remove_entry(key)
+
+        if size is None:
+            size = payload_size(value)
+        if size > self.max_bytes:
+            # would push out everything else & still not fit
+            return False
+
+        self.entries[key] = (stamp, value, size)
+        self.current_bytes += size
+
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.remove_entry(oldest)
+            self.evictions += 1
+
+        return True
+
+    def invalidate(self, file_name=None):
+        """ Removes the entry of the file, or all entries if file_name is
+            None.
+        """
+        if file_name is None:
+            for key in list(self.entries):
+                self.remove_entry(key)
+        else:
+            self.remove_entry(os.path.abspath(file_name))
+
+    def remove_entry(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+            if self.on_remove is not None:
+                self.on_remove(entry[1])
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes}
+
+    def __contains__(self, file_name):
+        key = os.path.abspath(file_name)
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] == file_stamp(key)
+
+
+class TextureStore:
+    """ Keeps track of the texture images that have been sent to the JS
+        component.
+
+        Images are identified by the hash of their contents. The data of an
+        image is only encoded & sent the first time it is used; after that,
+        the JS side looks it up in its texture registry by the hash
+        (see registerTexture in setup_scene.js).
+    """
+
+    def __init__(self, encoder):
+        """ encoder: function that gets a file name and returns the data
+                     that JS needs for the image (data URI or URL)
+        """
+        self.encoder = encoder
+
+        # path -> (stamp, hash), so files are only hashed again if they
+        # changed
+        self.hashes = {}
+        # hash -> size of the data that was sent for it
+        self.sent = {}
+
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.hits = 0
+        self.misses = 0
+
+    def reference(self, file_name):
+        """ Returns (hash, data) for the image. data is None if the JS
+            component already has the image, i.e. it only needs the hash.
+        """
+        hash_ = self.lookup(file_name)
+        if hash_ is not None:
+            return hash_, None
+
+        return self.add(self.load(file_name))
+
+    def lookup(self, file_name):
+        """ Returns the hash of the image if the JS component already has it
+            (and the file did not change since then), else None.
+        """
+        key = os.path.abspath(file_name)
+
+        entry = self.hashes.get(key)
+        if entry is None or entry[0] != file_stamp(key) or \
+                entry[1] not in self.sent:
+            return None
+
+        self.hits += 1
+        self.bytes_saved += self.sent[entry[1]]
+        return entry[1]
+
+    def load(self, file_name):
+        """ Reads, hashes & encodes the image. Does not change the store, so
+            it can be called from another thread; the result must then be
+            passed to add.
+        """
+        key = os.path.abspath(file_name)
+        stamp = file_stamp(key)
+
+        with open(key, 'rb') as file:
+            hash_ = hashlib.sha1(file.read()).hexdigest()
+
+        return key, stamp, hash_, self.encoder(file_name)
+
+    def add(self, loaded):
+        """ Takes the result of load & returns (hash, data) like reference.
+        """
+        key, stamp, hash_, data = loaded
+        self.hashes[key] = (stamp, hash_)
+
+        if hash_ in self.sent:
+            # same image as another file
+            self.hits += 1
+            self.bytes_saved += self.sent[hash_]
+            return hash_, None
+
+        self.misses += 1
+        self.sent[hash_] = len(data)
+        self.bytes_sent += len(data)
+
+        return hash_, data
+
+    def forget(self):
+        """ Must be called if the JS registry was lost (page reload). """
+        self.sent = {}
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "textures": len(self.sent),
+                "bytes_sent": self.bytes_sent,
+                "bytes_saved": self.bytes_saved}
+
+
+def file_stamp(file_name):
+    """ (mtime, size) of the file, or None if it cannot be read. """
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def payload_size(value):
+    """ Approximate size of a cached value in bytes: the lengths of all the
+        strings in it (strings, bytes, and tuples, lists and dicts of these).
+    """
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(k) + payload_size(v)
+                   for k, v in value.items())
+    if isinstance(value, (tuple, list)):
+        return sum(payload_size(v) for v in value)
+    return 0
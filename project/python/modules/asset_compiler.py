@@ -0,0 +1,421 @@
+""" Build step that converts the .babylon models of the catalog into a more
+    compact form, which Babylon can load without parsing the geometry as
+    JSON text:
+
+    - <model>.babylon: the JSON of the model without the vertex data
+      (materials etc. stay as they are); each mesh refers to the
+      binary file with "delayLoadingFile" & "_binaryInfo"
+    - <model>.babylonbinarymeshdata: positions, normals and uvs as float32,
+      indices and sub meshes as int32 (Babylon's binary mesh format)
+
+    Optionally, vertex data is quantized (rounded to a grid, which makes it
+    compress a lot better) and the files are gzipped; the asset scheme
+    decompresses them when they are requested.
+
+    Besides the full model (LOD level 0), coarser levels of detail are
+    made with mesh_simplifier (<model>.lod1.babylon, ...), which the system
+    can use instead, depending on its quality setting & vertex budget.
+
+    The manifest records which source file (& version of it) each bundle
+    was made from, so the system only uses bundles that are up to date.
+
+    Usage (from the project directory):
+        python3 compile_assets.py [--quantize BITS] [--no-compress]
+                                  [--lods CELLS [CELLS ...]]
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+
+import numpy as np
+
+from python.modules import asset_cache
+from python.modules import mesh_simplifier
+
+MODELS_INFO = 'assets/models_info.json'
+OUTPUT_DIR = 'assets/compiled'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 2
+
+BINARY_EXTENSION = '.babylonbinarymeshdata'
+COMPRESSED_EXTENSION = '.gz'
+
+# (key in the .babylon mesh, key of the attribute in _binaryInfo,
+#  numpy type, "has..." flag for Babylon's delay loading)
+VERTEX_ATTRIBUTES = (('positions', 'positionsAttrDesc', '<f4', None),
+                     ('normals', 'normalsAttrDesc', '<f4', None),
+                     ('uvs', 'uvsAttrDesc', '<f4', 'hasUVs'),
+                     ('uvs2', 'uvs2AttrDesc', '<f4', 'hasUVs2'),
+                     ('colors', 'colorsAttrDesc', '<f4', 'hasColors'),
+                     ('indices', 'indicesAttrDesc', '<i4', None))
+
+# number of values per element of an attribute (stride in _binaryInfo);
+# vertex colors can be RGB or RGBA, see attribute_stride
+ATTRIBUTE_STRIDES = {'positions': 3, 'normals': 3, 'uvs': 2, 'uvs2': 2,
+                     'indices': 1}
+COLOR_STRIDES = (3, 4)
+
+SUB_MESH_FIELDS = ('materialIndex', 'verticesStart', 'verticesCount',
+                   'indexStart', 'indexCount')
+
+# grid resolution (cells along the longest side of a model) of each LOD
+# level after the full model; coarser levels come last
+LOD_RESOLUTIONS = (48, 16)
+
+
+def catalog_models(models_info=MODELS_INFO):
+    """ The model files of all categories in models_info.json. """
+    with open(models_info) as file:
+        data = json.load(file)
+
+    file_names = []
+    for category in data['categories']:
+        for model in category['models']:
+            if model['file'] not in file_names:
+                file_names.append(model['file'])
+
+    return file_names
+
+
+def quantize(values, bits):
+    """ Rounds the values to 2^bits steps between their minimum and maximum.
+        They stay floats; rounding only makes the data compress better.
+    """
+    low, high = values.min(), values.max()
+    if high <= low:
+        return values
+
+    steps = float(2 ** bits - 1)
+    scale = (high - low) / steps
+    return (np.round((values - low) / scale) * scale + low).astype(
+        values.dtype)
+
+
+def compile_model(source, output_dir, binary_name, quantize_bits=None,
+                  lod_resolution=None):
+    """ Splits the model into the header JSON and the binary data.
+        Returns both (as a dict and bytes).
+
+        lod_resolution: if not None, the meshes are simplified with this
+                        grid resolution first
+    """
+    with open(source) as file:
+        model = json.load(file)
+
+    # textures are still loaded from the directory of the source model
+    relative_dir = os.path.relpath(os.path.dirname(source), output_dir)
+    for material in model.get('materials', []):
+        texture = material.get('diffuseTexture')
+        if texture is not None and 'name' in texture:
+            texture['name'] = relative_dir.replace(os.sep, '/') + '/' + \
+                texture['name']
+
+    chunks = []
+    offset = 0
+
+    meshes = model.get('meshes', [])
+    if lod_resolution is not None:
+        meshes = [mesh_simplifier.simplify_mesh(mesh, lod_resolution)
+                  if mesh_simplifier.vertex_count(mesh) > 0 else mesh
+                  for mesh in meshes]
+        model['meshes'] = meshes
+
+    for mesh in meshes:
+        if mesh_simplifier.vertex_count(mesh) == 0:
+            continue
+
+        binary_info = {}
+
+        positions = np.asarray(mesh['positions'], dtype='<f4').reshape(-1, 3)
+        mesh['boundingBoxMinimum'] = positions.min(axis=0).tolist()
+        mesh['boundingBoxMaximum'] = positions.max(axis=0).tolist()
+
+        for key, info_key, dtype, flag in VERTEX_ATTRIBUTES:
+            values = mesh.pop(key, None)
+            if values is None or len(values) == 0:
+                continue
+
+            array = np.asarray(values, dtype=dtype)
+            if quantize_bits is not None and dtype == '<f4':
+                array = quantize(array, quantize_bits)
+
+            binary_info[info_key] = {'count': int(array.size),
+                                     'stride': attribute_stride(
+                                         key, array.size, len(positions)),
+                                     'offset': offset,
+                                     'dataType': 1 if dtype == '<f4' else 0}
+            chunks.append(array.tobytes())
+            offset += array.nbytes
+
+            if flag is not None:
+                mesh[flag] = True
+
+        sub_meshes = mesh.pop('subMeshes', None) or []
+        if len(sub_meshes) > 0:
+            array = np.asarray([[sub_mesh[field] for field in SUB_MESH_FIELDS]
+                                for sub_mesh in sub_meshes], dtype='<i4')
+            binary_info['subMeshesAttrDesc'] = {'count': len(sub_meshes),
+                                                'stride': 5,
+                                                'offset': offset,
+                                                'dataType': 0}
+            chunks.append(array.tobytes())
+            offset += array.nbytes
+
+        mesh['delayLoadingFile'] = binary_name
+        mesh['_binaryInfo'] = binary_info
+
+    return model, b''.join(chunks)
+
+
+def attribute_stride(key, count, vertex_count):
+    """ Stride of an attribute with count values in a mesh with
+        vertex_count vertices. The stride of the colors is not fixed, it
+        follows from the number of values per vertex.
+    """
+    if key in ATTRIBUTE_STRIDES:
+        return ATTRIBUTE_STRIDES[key]
+
+    if vertex_count == 0 or count % vertex_count != 0 or \
+            count // vertex_count not in COLOR_STRIDES:
+        raise ValueError('{} {} for {} vertices'.format(
+            count, key, vertex_count))
+    return count // vertex_count
+
+
+def write_file(file_name, data, compress):
+    """ Writes the data (gzipped as file_name + ".gz" if compress is True)
+        & returns the number of bytes on the disk.
+    """
+    # remove the other variant, it would be out of date
+    stale = file_name if compress else file_name + COMPRESSED_EXTENSION
+    if os.path.isfile(stale):
+        os.remove(stale)
+
+    if compress:
+        file_name += COMPRESSED_EXTENSION
+        data = gzip.compress(data, 9)
+
+    with open(file_name, 'wb') as file:
+        file.write(data)
+
+    return len(data)
+
+
+def read_file(file_name):
+    """ Reads a file that was written by write_file. """
+    if not os.path.isfile(file_name) and \
+            os.path.isfile(file_name + COMPRESSED_EXTENSION):
+        with open(file_name + COMPRESSED_EXTENSION, 'rb') as file:
+            return gzip.decompress(file.read())
+
+    with open(file_name, 'rb') as file:
+        return file.read()
+
+
+def compile_catalog(file_names, output_dir=OUTPUT_DIR, quantize_bits=None,
+                    compress=True, lod_resolutions=LOD_RESOLUTIONS):
+    """ Compiles all models & writes the manifest. Returns the manifest. """
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {'version': MANIFEST_VERSION,
+                'options': {'quantize_bits': quantize_bits,
+                            'compress': compress,
+                            'lod_resolutions': list(lod_resolutions)},
+                'models': {}}
+
+    for source in file_names:
+        base_name = os.path.splitext(os.path.basename(source))[0]
+        stamp = asset_cache.file_stamp(source)
+
+        lods = []
+        for level, resolution in enumerate((None,) + tuple(lod_resolutions)):
+            lod_name = base_name if level == 0 else \
+                '{}.lod{}'.format(base_name, level)
+            header_file = os.path.join(output_dir, lod_name + '.babylon')
+            binary_file = os.path.join(output_dir,
+                                       lod_name + BINARY_EXTENSION)
+
+            header, binary = compile_model(source, output_dir,
+                                           os.path.basename(binary_file),
+                                           quantize_bits, resolution)
+
+            header_bytes = write_file(header_file, json.dumps(
+                header, separators=(',', ':')).encode('utf-8'), compress)
+            binary_bytes = write_file(binary_file, binary, compress)
+
+            lods.append({'header': header_file,
+                         'binary': binary_file,
+                         'vertices': header_vertex_count(header),
+                         'compiled_bytes': header_bytes + binary_bytes})
+
+        manifest['models'][source] = {
+            'source_stamp': list(stamp),
+            'compressed': compress,
+            'source_bytes': stamp[1],
+            'lods': lods}
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+
+    return manifest
+
+
+def header_vertex_count(header):
+    """ Number of vertices of all meshes of a compiled model. """
+    return sum(mesh['_binaryInfo']['positionsAttrDesc']['count'] // 3
+               for mesh in header.get('meshes', [])
+               if 'positionsAttrDesc' in mesh.get('_binaryInfo', {}))
+
+
+def measure_load_time(function, repetitions=3):
+    best = float('inf')
+    for i in range(repetitions):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def load_source(source):
+    with open(source) as file:
+        json.load(file)
+
+
+def load_compiled(entry):
+    header = json.loads(read_file(entry['header']).decode('utf-8'))
+    binary = read_file(entry['binary'])
+    for mesh in header['meshes']:
+        for key, info in mesh.get('_binaryInfo', {}).items():
+            count = info['count']
+            if key == 'subMeshesAttrDesc':
+                count *= len(SUB_MESH_FIELDS)
+            np.frombuffer(binary, '<f4' if info['dataType'] == 1 else '<i4',
+                          count, info['offset'])
+
+
+def report(manifest):
+    """ Prints the size & (Python) parse time of each model before and after
+        compiling & the number of vertices of its LOD levels.
+    """
+    print('{:<44} {:>9} {:>9} {:>7} {:>9} {:>9} {:>7}  {}'.format(
+        'model', 'src KB', 'out KB', 'size', 'src ms', 'out ms', 'time',
+        'vertices per LOD'))
+
+    totals = [0, 0, 0.0, 0.0]
+    lod_totals = []
+    for source, entry in sorted(manifest['models'].items()):
+        full = entry['lods'][0]
+        source_time = measure_load_time(lambda: load_source(source))
+        compiled_time = measure_load_time(lambda: load_compiled(full))
+
+        totals[0] += entry['source_bytes']
+        totals[1] += full['compiled_bytes']
+        totals[2] += source_time
+        totals[3] += compiled_time
+
+        vertices = [lod['vertices'] for lod in entry['lods']]
+        lod_totals = [a + b for a, b in zip(lod_totals, vertices)] \
+            if lod_totals else vertices
+
+        print('{:<44} {:>9.0f} {:>9.0f} {:>6.0f}% {:>9.2f} {:>9.2f} {:>6.0f}%'
+              '  {}'.format(source, entry['source_bytes'] / 1024,
+                            full['compiled_bytes'] / 1024,
+                            100.0 * full['compiled_bytes'] /
+                            entry['source_bytes'],
+                            source_time * 1000, compiled_time * 1000,
+                            100.0 * compiled_time / source_time,
+                            ' / '.join(str(v) for v in vertices)))
+
+    print('{:<44} {:>9.0f} {:>9.0f} {:>6.0f}% {:>9.2f} {:>9.2f} {:>6.0f}%'
+          '  {}'.format('total', totals[0] / 1024, totals[1] / 1024,
+                        100.0 * totals[1] / totals[0], totals[2] * 1000,
+                        totals[3] * 1000, 100.0 * totals[3] / totals[2],
+                        ' / '.join(str(v) for v in lod_totals)))
+
+
+class CompiledAssets:
+    """ Runtime side: tells the system which compiled bundle to load instead
+        of a .babylon file, if there is one and it is up to date.
+    """
+
+    def __init__(self, output_dir=OUTPUT_DIR):
+        self.models = {}
+
+        manifest_file = os.path.join(output_dir, MANIFEST_NAME)
+        if os.path.isfile(manifest_file):
+            with open(manifest_file) as file:
+                manifest = json.load(file)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self.models = manifest['models']
+
+    def compiled_file(self, source, lod=0):
+        """ The header file of the bundle for the source model, or None if
+            there is none or the source changed after it was compiled.
+            lod: level of detail (0 = full; higher levels are coarser; if
+                 there are fewer levels, the coarsest one is used)
+        """
+        lods = self.lods(source)
+        if lods is None:
+            return None
+
+        return lods[min(lod, len(lods) - 1)]['header']
+
+    def choose_lod(self, source, instances, quality, vertices_left):
+        """ Picks the level of detail for adding the model "instances" times:
+            the one of the quality setting (see compiled_file), or a coarser
+            one if that would use more than vertices_left vertices.
+
+            Returns (header file, vertices per instance) or (None, None) if
+            there is no (up to date) bundle for the model.
+        """
+        lods = self.lods(source)
+        if lods is None:
+            return None, None
+
+        level = min(quality, len(lods) - 1)
+        while level < len(lods) - 1 and \
+                lods[level]['vertices'] * instances > vertices_left:
+            level += 1
+
+        return lods[level]['header'], lods[level]['vertices']
+
+    def lods(self, source):
+        entry = self.models.get(source)
+        if entry is None:
+            return None
+
+        stamp = asset_cache.file_stamp(source)
+        if stamp is None or list(stamp) != entry['source_stamp']:
+            return None
+
+        return entry['lods']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compiles the models in ' + MODELS_INFO + ' to binary '
+                    'bundles in ' + OUTPUT_DIR + '.')
+    parser.add_argument('--quantize', type=int, metavar='BITS', default=None,
+                        help='round vertex data to 2^BITS steps (e.g. 16)')
+    parser.add_argument('--no-compress', action='store_true',
+                        help='do not gzip the bundles')
+    parser.add_argument('--lods', type=int, nargs='*', metavar='CELLS',
+                        default=list(LOD_RESOLUTIONS),
+                        help='grid resolution of each coarser level of '
+                             'detail (default: %(default)s)')
+    parser.add_argument('--models-info', default=MODELS_INFO)
+    parser.add_argument('--output', default=OUTPUT_DIR)
+    args = parser.parse_args(argv)
+
+    manifest = compile_catalog(catalog_models(args.models_info), args.output,
+                               args.quantize, not args.no_compress,
+                               args.lods)
+    report(manifest)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
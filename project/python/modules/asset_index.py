@@ -0,0 +1,234 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from python.modules import asset_cache
+
+MODELS_DIR = 'assets/models'
+MODELS_INFO = 'assets/models_info.json'
+# cache of the index on the disk; rebuilt automatically (see AssetIndex)
+INDEX_FILE = 'assets/models_index.json'
+INDEX_VERSION = 1
+
+MODEL_EXTENSION = '.babylon'
+
+
+class AssetIndex:
+    """ Index of the models in assets/models, so the system does not have to
+        parse a model's JSON to find out about it when it is added.
+
+        For each model it records the texture files (like
+        utility_module.find_texture_files), the file size & content hash,
+        the number of vertices & triangles and the bounding box.
+
+        The index is kept in INDEX_FILE. An entry is only used as long as
+        the mtime & size of its model do not change; build() updates the
+        entries of models that changed & reports missing and orphaned files.
+
+        Not thread-safe: entries are (re)indexed when they are looked up, so
+        it must only be used in the GUI thread.
+    """
+
+    def __init__(self, index_file=INDEX_FILE, models_dir=MODELS_DIR,
+                 models_info=MODELS_INFO):
+        self.index_file = index_file
+        self.models_dir = models_dir
+        self.models_info = models_info
+
+        # model path -> entry (see index_model)
+        self.entries = {}
+        # (mtime, size) of the models directory at the last build; files
+        # that were added or removed since then change it
+        self.dir_stamp = None
+        self.dirty = False
+
+        self.hits = 0
+        self.misses = 0
+        # result of find_problems at the last build
+        self.problems = {}
+
+        if os.path.isfile(index_file):
+            try:
+                with open(index_file) as file:
+                    data = json.load(file)
+            except ValueError:
+                data = {}
+            if data.get('version') == INDEX_VERSION:
+                self.entries = data['models']
+                self.dir_stamp = data['dir_stamp']
+
+    def build(self, report=True):
+        """ Indexes all models that are new or changed, removes the entries
+            of models that do not exist anymore & saves the index if
+            anything changed.
+
+            Returns the problems (see find_problems). If report is True,
+            missing files are printed; orphaned files are harmless and only
+            counted in stats().
+        """
+        model_files = set(os.path.join(self.models_dir, name)
+                          for name in os.listdir(self.models_dir)
+                          if name.endswith(MODEL_EXTENSION))
+
+        for file_name in list(self.entries.keys()):
+            if file_name not in model_files:
+                del self.entries[file_name]
+                self.dirty = True
+
+        dir_stamp = list(asset_cache.file_stamp(self.models_dir))
+        textures_changed = dir_stamp != self.dir_stamp
+        for file_name in sorted(model_files):
+            # texture files might have been added or removed
+            self.entry(file_name, textures_changed)
+
+        if dir_stamp != self.dir_stamp:
+            self.dir_stamp = dir_stamp
+            self.dirty = True
+
+        self.save()
+
+        problems = self.problems = self.find_problems()
+        if report:
+            for kind, file_names in sorted(problems.items()):
+                if kind == 'orphaned file':
+                    continue
+                for file_name in file_names:
+                    print('asset index: ' + kind + ':', file_name)
+
+        return problems
+
+    def entry(self, file_name, reindex=False):
+        """ The entry of the model, indexed again if it changed.
+            None if the file does not exist.
+        """
+        stamp = asset_cache.file_stamp(file_name)
+        if stamp is None:
+            return None
+
+        entry = self.entries.get(file_name)
+        if not reindex and entry is not None and \
+                entry['stamp'] == list(stamp):
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = index_model(file_name)
+        self.entries[file_name] = entry
+        self.dirty = True
+
+        return entry
+
+    def texture_files(self, file_name):
+        """ Same as utility_module.find_texture_files for the model, without
+            reading it.
+        """
+        entry = self.entry(file_name)
+        return {} if entry is None else dict(entry['textures'])
+
+    def vertex_count(self, file_name):
+        entry = self.entry(file_name)
+        return 0 if entry is None else entry['vertices']
+
+    def find_problems(self):
+        """ Returns a dict with lists of files:
+            "missing model": in models_info.json, but not in assets/models
+            "missing texture": used by a model, but not in assets/models
+            "orphaned file": in assets/models, but not used by models_info
+                             or any model
+        """
+        catalog = []
+        if os.path.isfile(self.models_info):
+            with open(self.models_info) as file:
+                for category in json.load(file)['categories']:
+                    catalog.extend(model['file']
+                                   for model in category['models'])
+
+        used = set(os.path.normpath(f) for f in catalog)
+        missing_textures = set()
+        for entry in self.entries.values():
+            used.update(os.path.normpath(f)
+                        for f in entry['textures'].values())
+            missing_textures.update(
+                os.path.join(self.models_dir, name)
+                for name in entry['missing_textures'])
+
+        orphaned = [os.path.join(self.models_dir, name)
+                    for name in sorted(os.listdir(self.models_dir))
+                    if os.path.normpath(os.path.join(self.models_dir, name))
+                    not in used]
+
+        return {'missing model': sorted(f for f in set(catalog)
+                                        if not os.path.isfile(f)),
+                'missing texture': sorted(missing_textures),
+                'orphaned file': orphaned}
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        with open(self.index_file, 'w') as file:
+            json.dump({'version': INDEX_VERSION,
+                       'dir_stamp': self.dir_stamp,
+                       'models': self.entries}, file, indent=1,
+                      sort_keys=True)
+        self.dirty = False
+
+    def stats(self):
+        return {"models": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "missing models": len(self.problems.get('missing model', [])),
+                "missing textures": len(
+                    self.problems.get('missing texture', [])),
+                "orphaned files": len(self.problems.get('orphaned file', []))}
+
+
+def index_model(file_name):
+    """ Reads & parses the model; returns its entry for the index. """
+    # before reading: if the file changes meanwhile, the entry is outdated
+    stamp = asset_cache.file_stamp(file_name)
+    with open(file_name, 'rb') as file:
+        data = file.read()
+    model = json.loads(data.decode('utf-8'))
+
+    textures = {}
+    missing_textures = []
+    model_dir = os.path.dirname(file_name)
+    for material in model.get('materials', []):
+        name = material.get('diffuseTexture', {}).get('name')
+        if name is None:
+            continue
+        # same path as in utility_module.find_texture_files
+        texture_file = model_dir + '/' + name
+        if os.path.isfile(texture_file):
+            textures[name] = texture_file
+        else:
+            missing_textures.append(name)
+
+    vertices = 0
+    triangles = 0
+    low, high = None, None
+    for mesh in model.get('meshes', []):
+        positions = mesh.get('positions')
+        if not positions:
+            continue
+        positions = np.asarray(positions, dtype='f8').reshape(-1, 3)
+        vertices += len(positions)
+        triangles += len(mesh.get('indices', [])) // 3
+
+        mesh_low, mesh_high = positions.min(axis=0), positions.max(axis=0)
+        low = mesh_low if low is None else np.minimum(low, mesh_low)
+        high = mesh_high if high is None else np.maximum(high, mesh_high)
+
+    return {'stamp': list(stamp),
+            'size': len(data),
+            'sha1': hashlib.sha1(data).hexdigest(),
+            'textures': textures,
+            'missing_textures': missing_textures,
+            'meshes': len(model.get('meshes', [])),
+            'vertices': vertices,
+            'triangles': triangles,
+            'bounding_box': None if low is None else
+            [low.tolist(), high.tolist()]}
@@ -0,0 +1,207 @@
+import os
+import time
+from collections import deque
+
+from PyQt5 import QtCore
+
+# number of threads that prepare assets at the same time
+LOADER_THREADS = 2
+
+
+class TaskSignals(QtCore.QObject):
+    """ QRunnables are no QObjects, so the signals of a PreparationTask live
+        in this class. It is created in the GUI thread, hence the
+        connections to the AssetLoader are queued.
+    """
+    done = QtCore.pyqtSignal(int, int, object, object)
+    error = QtCore.pyqtSignal(int, int, object, str)
+
+
+class PreparationTask(QtCore.QRunnable):
+    def __init__(self, task_id, generation, function, args, key=None):
+        super(PreparationTask, self).__init__()
+        self.task_id = task_id
+        self.generation = generation
+        self.function = function
+        self.args = args
+        self.key = key
+        self.signals = TaskSignals()
+
+    def run(self):
+        try:
+            result = self.function(*self.args)
+        except Exception as e:
+            self.signals.error.emit(self.task_id, self.generation, self.key,
+                                    str(e))
+        else:
+            self.signals.done.emit(self.task_id, self.generation, self.key,
+                                   result)
+
+
+class AssetLoader(QtCore.QObject):
+    """ Runs the preparation of assets (reading files, parsing JSON, base64
+        encoding) in a thread pool, so the GUI (and the Wiimote cursor)
+        does not freeze while a big model is loaded.
+
+        The callbacks are called in the GUI thread and in the order the
+        tasks were submitted, so e.g. meshes are added to the scene in the
+        same order as without the thread pool.
+
+        Tasks can have a key (e.g. the file name): while a task with the
+        same key is still running, no second one is started; its result is
+        delivered to both callbacks.
+
+        cancel_all discards all tasks that have not been delivered yet
+        (e.g. when the scene is cleared while something is still loading).
+    """
+
+    def __init__(self, max_threads=LOADER_THREADS, parent=None):
+        super(AssetLoader, self).__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+
+        # results of older generations are discarded
+        self.generation = 0
+        self.next_task_id = 0
+
+        # task ids in the order of submission & the state of the tasks:
+        # task_id -> [callback, error_callback, finished, result, error]
+        self.order = deque()
+        self.tasks = {}
+        # key -> ids of the tasks that wait for the running task of that key
+        self.running_keys = {}
+
+        self.discarded = 0
+
+    def submit(self, function, args, callback, error_callback=None,
+               key=None, first=False):
+        """ Calls function(*args) in the thread pool and callback(result)
+            (or error_callback(message)) in the GUI thread.
+
+            first: the task is started & delivered before the ones that were
+                   submitted before it (for urgent tasks of loaders that
+                   do not need the order, e.g. the prefetch of the model
+                   under the cursor)
+        """
+        task_id = self.add_task(callback, error_callback, first)
+
+        if key is not None:
+            if key in self.running_keys:
+                self.running_keys[key].append(task_id)
+                return task_id
+            self.running_keys[key] = [task_id]
+
+        task = PreparationTask(task_id, self.generation, function, args,
+                               key)
+        task.signals.done.connect(self.on_task_done)
+        task.signals.error.connect(self.on_task_error)
+        self.pool.start(task, 1 if first else 0)
+
+        return task_id
+
+    def deliver(self, result, callback):
+        """ For results that are available without any work (e.g. cached):
+            callback(result) is called right away, or after the tasks that
+            were submitted before are delivered.
+        """
+        if len(self.order) == 0:
+            callback(result)
+        else:
+            task_id = self.add_task(callback, None)
+            self.finish_task(task_id, result, None)
+
+    def add_task(self, callback, error_callback, first=False):
+        task_id = self.next_task_id
+        self.next_task_id += 1
+
+        if first:
+            self.order.appendleft(task_id)
+        else:
+            self.order.append(task_id)
+        self.tasks[task_id] = [callback, error_callback, False, None, None]
+
+        return task_id
+
+    def cancel_all(self):
+        self.generation += 1
+        self.pool.clear()
+
+        self.discarded += len(self.order)
+        self.order.clear()
+        self.tasks.clear()
+        self.running_keys.clear()
+
+    def wait(self):
+        """ Blocks until the running tasks are done. Must be called before
+            the loader is destroyed while tasks might still be running (the
+            pool's destructor waits for them, too, but keeps the GIL they
+            need to finish).
+        """
+        self.pool.waitForDone()
+
+    def is_busy(self):
+        return len(self.order) > 0
+
+    def on_task_done(self, task_id, generation, key, result):
+        if generation == self.generation:
+            for waiting_id in self.running_keys.pop(key, [task_id]):
+                self.finish_task(waiting_id, result, None)
+
+    def on_task_error(self, task_id, generation, key, error):
+        if generation == self.generation:
+            for waiting_id in self.running_keys.pop(key, [task_id]):
+                self.finish_task(waiting_id, None, error)
+
+    def finish_task(self, task_id, result, error):
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+
+        task[2:] = [True, result, error]
+
+        # deliver everything that is finished, in the order of submission
+        while len(self.order) > 0 and self.tasks[self.order[0]][2]:
+            callback, error_callback, finished, result, error = \
+                self.tasks.pop(self.order.popleft())
+            if error is None:
+                callback(result)
+            elif error_callback is not None:
+                error_callback(error)
+            else:
+                print('asset preparation failed:', error)
+
+
+class LoadMetrics:
+    """ Numbers about loading a whole scene (see Window.load_meshes):
+        how many meshes & distinct files there are, how many bytes had to
+        be read and how long it took until the last mesh was in the scene.
+    """
+
+    def __init__(self, mesh_ids, file_names):
+        self.instances = len(mesh_ids)
+        self.unique_files = len(file_names)
+        self.bytes_read = sum(os.path.getsize(f) for f in file_names
+                              if os.path.isfile(f))
+
+        self.waiting_for = set(mesh_ids)
+        self.start_time = time.perf_counter()
+        self.wall_time = None
+
+    def mesh_done(self, mesh_id):
+        """ Returns True if this was the last mesh of the scene. """
+        if mesh_id not in self.waiting_for:
+            return False
+
+        self.waiting_for.discard(mesh_id)
+        if len(self.waiting_for) == 0:
+            self.wall_time = time.perf_counter() - self.start_time
+            return True
+
+        return False
+
+    def __repr__(self):
+        wall_time = 'loading' if self.wall_time is None else \
+            '{:.3f} s'.format(self.wall_time)
+        return '{} meshes from {} files, {:.1f} MB read, {}'.format(
+            self.instances, self.unique_files, self.bytes_read / 2 ** 20,
+            wall_time)
@@ -0,0 +1,226 @@
+import os
+import gzip
+import mmap
+import mimetypes
+from urllib.parse import quote, unquote
+
+from PyQt5 import QtCore
+from PyQt5.QtNetwork import (QNetworkAccessManager, QNetworkReply,
+                             QNetworkRequest)
+try:
+    from PyQt5.QtWebKit import QWebSecurityOrigin
+except ImportError:
+    # asset_url still works (e.g. with a headless_scene.HeadlessScene)
+    QWebSecurityOrigin = None
+
+# URLs with this scheme are answered from the disk by AssetNetworkManager.
+# "file:" URLs cannot be used for this: Babylon treats every URL that
+# contains "file:" as a file from a file input element.
+ASSET_SCHEME = 'asset'
+
+# only files in these directories (relative to the project) are served
+ASSET_DIRECTORIES = ('assets/models', 'assets/img', 'assets/compiled')
+
+# if a file does not exist, but the file + this extension does, it is
+# decompressed and served instead (see asset_compiler)
+COMPRESSED_EXTENSION = '.gz'
+
+
+def asset_url(file_name):
+    """ Returns the URL under which a file in one of the ASSET_DIRECTORIES
+        can be loaded in the web view, e.g.
+        "assets/models/box.babylon" -> "asset:///assets/models/box.babylon"
+    """
+    return ASSET_SCHEME + ':///' + quote(file_name.replace(os.sep, '/'))
+
+
+def install(web_view, root_dir):
+    """ Makes the web view load asset:/// URLs from root_dir.
+        Must be called before the page is loaded.
+    """
+    # local schemes may be accessed from the file:/// page
+    QWebSecurityOrigin.addLocalScheme(ASSET_SCHEME)
+
+    manager = AssetNetworkManager(root_dir, web_view.page())
+    web_view.page().setNetworkAccessManager(manager)
+
+    return manager
+
+
+class AssetNetworkManager(QNetworkAccessManager):
+    """ Network access manager of the web view that serves asset:/// URLs
+        straight from the disk. All other requests are handled as usual.
+
+        This way, models and textures do not have to be put into the
+        JavaScript source as strings / base64 data.
+    """
+
+    def __init__(self, root_dir, parent=None):
+        super(AssetNetworkManager, self).__init__(parent)
+        self.root_dir = os.path.realpath(root_dir)
+        self.allowed_dirs = [os.path.join(self.root_dir, d)
+                             for d in ASSET_DIRECTORIES]
+
+    def createRequest(self, operation, request, outgoing_data=None):
+        if request.url().scheme() == ASSET_SCHEME and \
+                operation == QNetworkAccessManager.GetOperation:
+            return AssetReply(request, self.file_for_url(request.url()),
+                              self)
+
+        return super(AssetNetworkManager, self).createRequest(
+            operation, request, outgoing_data)
+
+    def file_for_url(self, url):
+        """ Absolute path of the file for the URL, or None if the URL does
+            not point into one of the ASSET_DIRECTORIES.
+        """
+        relative = unquote(url.path()).lstrip('/')
+        file_name = os.path.realpath(os.path.join(self.root_dir, relative))
+
+        for directory in self.allowed_dirs:
+            if file_name.startswith(directory + os.sep):
+                return file_name
+
+        return None
+
+
+class DecompressionSignals(QtCore.QObject):
+    """ Signals of a DecompressionTask, created in the GUI thread so the
+        connections to the AssetReply are queued.
+    """
+    done = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(str)
+
+
+class DecompressionTask(QtCore.QRunnable):
+    """ Decompresses a gzipped asset in the global thread pool, bundles can
+        be big enough to freeze the GUI for a moment.
+    """
+
+    def __init__(self, file_name):
+        super(DecompressionTask, self).__init__()
+        self.file_name = file_name
+        self.signals = DecompressionSignals()
+
+    def run(self):
+        try:
+            with gzip.open(self.file_name, 'rb') as file:
+                data = file.read()
+        except (OSError, EOFError) as e:
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.done.emit(data)
+
+
+class AssetReply(QNetworkReply):
+    """ Reply for a single asset:/// request. The file is memory-mapped, so
+        the data is only copied once, when WebKit reads it. Compressed
+        files are decompressed by a DecompressionTask; the reply finishes
+        when it is done.
+    """
+
+    def __init__(self, request, file_name, parent=None):
+        super(AssetReply, self).__init__(parent)
+        self.setRequest(request)
+        self.setUrl(request.url())
+        self.setOperation(QNetworkAccessManager.GetOperation)
+
+        self.data = b''
+        self.offset = 0
+        self.file_name = file_name
+        self.decompression = None
+
+        try:
+            if file_name is None:
+                raise OSError('not an asset: ' + request.url().toString())
+            if not os.path.isfile(file_name) and \
+                    os.path.isfile(file_name + COMPRESSED_EXTENSION):
+                self.decompression = DecompressionTask(
+                    file_name + COMPRESSED_EXTENSION)
+                self.decompression.signals.done.connect(self.on_decompressed)
+                self.decompression.signals.error.connect(self.on_not_found)
+                QtCore.QThreadPool.globalInstance().start(self.decompression)
+                return
+
+            with open(file_name, 'rb') as file:
+                if os.fstat(file.fileno()).st_size > 0:
+                    self.data = mmap.mmap(file.fileno(), 0,
+                                          access=mmap.ACCESS_READ)
+        except OSError as e:
+            self.on_not_found(str(e))
+            return
+
+        self.on_data_ready()
+
+    def on_decompressed(self, data):
+        self.decompression = None
+        # aborted while the task was running
+        if self.isFinished():
+            return
+        self.data = data
+        self.on_data_ready()
+
+    def on_data_ready(self):
+        content_type = mimetypes.guess_type(self.file_name)[0] or \
+            'application/octet-stream'
+        self.setHeader(QNetworkRequest.ContentTypeHeader, content_type)
+        self.setHeader(QNetworkRequest.ContentLengthHeader, len(self.data))
+        # textures are loaded with crossOrigin = "anonymous" by Babylon
+        self.setRawHeader(b'Access-Control-Allow-Origin', b'*')
+        self.setAttribute(QNetworkRequest.HttpStatusCodeAttribute, 200)
+
+        self.open(QtCore.QIODevice.ReadOnly | QtCore.QIODevice.Unbuffered)
+
+        # signals must only be emitted after the reply has been returned
+        QtCore.QTimer.singleShot(0, self.succeed)
+
+    def on_not_found(self, message):
+        self.decompression = None
+        if self.isFinished():
+            return
+        self.open(QtCore.QIODevice.ReadOnly)
+        self.setError(QNetworkReply.ContentNotFoundError, message)
+        self.setAttribute(QNetworkRequest.HttpStatusCodeAttribute, 404)
+        QtCore.QTimer.singleShot(0, self.fail)
+
+    def succeed(self):
+        self.metaDataChanged.emit()
+        if len(self.data) > 0:
+            self.downloadProgress.emit(len(self.data), len(self.data))
+            self.readyRead.emit()
+        self.setFinished(True)
+        self.finished.emit()
+
+    def fail(self):
+        self.error.emit(QNetworkReply.ContentNotFoundError)
+        self.setFinished(True)
+        self.finished.emit()
+
+    def bytesAvailable(self):
+        return len(self.data) - self.offset + \
+            super(AssetReply, self).bytesAvailable()
+
+    def isSequential(self):
+        return True
+
+    def readData(self, max_size):
+        # (None would be reported to Qt as a read error)
+        if self.offset >= len(self.data):
+            return b''
+        end = min(self.offset + max_size, len(self.data))
+        chunk = self.data[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def abort(self):
+        self.close()
+        # a running decompression is ignored when it is done
+        if self.decompression is not None:
+            self.setFinished(True)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = b''
+        self.offset = 0
+        super(AssetReply, self).close()
@@ -101,6 +101,10 @@ class ExpandableSelectionTable(HorizontalSelectionTable):
     def show_children(self, category_data, index):
         if self.child_type == "Mesh":
             self.child_table = MeshPickerTable(self.item_creator, self.parent())
+            # the user is likely to add one of these models in a moment
+            self.item_creator.cancel_prefetch()
+            self.item_creator.prefetch_models(
+                [mesh["file"] for mesh in category_data["models"]])
         else:
             self.child_table = TexturePickerTable(self.item_creator,
                                                   self.parent())
@@ -122,6 +126,11 @@ class ExpandableSelectionTable(HorizontalSelectionTable):
             self.child_table.setParent(None)
             self.child_table = None
         self.showing_children = False
+        self.cancel_prefetch()
+
+    def cancel_prefetch(self):
+        if self.child_type == "Mesh":
+            self.item_creator.cancel_prefetch()
 
     def wrap_child_selection_changed(self):
         orig_func = self.child_table.selectionChanged
@@ -133,6 +142,7 @@ class ExpandableSelectionTable(HorizontalSelectionTable):
                 self.child_table = None
                 self.showing_children = False
                 self.clearSelection()
+                self.cancel_prefetch()
         self.child_table.selectionChanged = wrapped
 
     def lose_focus(self):
@@ -172,6 +182,13 @@ class MeshPickerTable(ChildSelectionTable):
         self.mesh_creator = mesh_creator
         self.created_mesh = False
 
+    def add_item(self, item_data):
+        new_item = super(MeshPickerTable, self).add_item(item_data)
+        new_item.hovered.connect(
+            lambda: self.mesh_creator.prefetch_models([item_data["file"]],
+                                                      hovered=True))
+        return new_item
+
     def selectionChanged(self, a=0, b=0):
         selectedIndexes = self.selectedIndexes()
         if len(selectedIndexes) > 0 and not self.created_mesh:
@@ -213,6 +230,7 @@ class SelectionTableItem(QtWidgets.QWidget):
         The tables store the corresponding mesh or texture,
         this class is only for the UI of the table item.
     """
+    hovered = QtCore.pyqtSignal()
 
     def __init__(self, name, icon):
         super(SelectionTableItem, self).__init__()
@@ -238,6 +256,10 @@ class SelectionTableItem(QtWidgets.QWidget):
 
         self.setCursor(QtCore.Qt.PointingHandCursor)
 
+    def enterEvent(self, event):
+        super(SelectionTableItem, self).enterEvent(event)
+        self.hovered.emit()
+
     def setup_button(self, name, icon_src):
         icon_label = self.set_icon(icon_src)
 
@@ -0,0 +1,193 @@
+import json
+import time
+import bisect
+import functools
+
+# upper bounds (in ms) of the buckets of the latency histograms; the last
+# bucket holds everything above the last bound
+HISTOGRAM_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250,
+                    500, 1000)
+
+# prefixes of the operation names
+TO_JS = 'js:'
+FROM_JS = 'py:'
+FLUSH = 'flush'
+
+
+class OperationStats:
+    """ Counts, payload bytes & latency histogram of one operation. """
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        # calls that were coalesced with a newer one (never sent)
+        self.dropped = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, size, ms):
+        self.count += 1
+        self.bytes += size
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, ms)] += 1
+
+    def percentile(self, fraction):
+        """ Upper bound of the bucket the percentile falls into (in ms). """
+        if self.count == 0:
+            return 0.0
+
+        rank = fraction * self.count
+        seen = 0
+        for bucket, number in enumerate(self.histogram):
+            seen += number
+            if seen >= rank and number > 0:
+                break
+
+        if bucket < len(HISTOGRAM_BOUNDS):
+            return min(HISTOGRAM_BOUNDS[bucket], self.max_ms)
+        return self.max_ms
+
+    def to_dict(self):
+        return {"count": self.count,
+                "bytes": self.bytes,
+                "dropped": self.dropped,
+                "total_ms": self.total_ms,
+                "mean_ms": self.total_ms / max(self.count, 1),
+                "p50_ms": self.percentile(0.5),
+                "p95_ms": self.percentile(0.95),
+                "max_ms": self.max_ms,
+                "histogram": self.histogram}
+
+
+class BridgeProfiler:
+    """ Records what goes over the Python <-> JS bridge, per operation:
+
+        "js:<function>": calls of setup_scene.js functions by SetupScene;
+                         the latency is the time the call waited in the
+                         queue until its batch was sent; bytes = size of the
+                         command in the batch
+        "flush":         the evaluation of a batch (dispatch); bytes = size
+                         of the script. Includes the time of python_callbacks
+                         that the JS code calls synchronously.
+        "py:<slot>":     python_callbacks (the slots of the Window that are
+                         decorated with callback); the latency is the time
+                         spent in the slot
+
+        Nothing is recorded unless enabled is True, so the bridge does not
+        pay for it normally.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # operation name -> OperationStats
+        self.operations = {}
+        # id of a queued command -> time it was queued
+        self.queued = {}
+        self.started = time.perf_counter()
+
+    def reset(self):
+        self.operations = {}
+        self.queued = {}
+        self.started = time.perf_counter()
+
+    def operation(self, name):
+        stats = self.operations.get(name)
+        if stats is None:
+            stats = self.operations[name] = OperationStats()
+        return stats
+
+    def command_queued(self, command):
+        """ command: [function name, [arguments]] as in SetupScene.queue """
+        self.queued[id(command)] = time.perf_counter()
+
+    def command_dropped(self, command):
+        self.queued.pop(id(command), None)
+        self.operation(TO_JS + command[0]).dropped += 1
+
+    def batch_sent(self, batch, sizes, script_size, start, end):
+        """ batch: the commands that were evaluated between start & end
+            (perf_counter values) as one script of script_size bytes
+            (None: they went to a backend; the size the script would have
+            is counted anyway)
+            sizes: the size of each command in the script
+        """
+        if script_size is None:
+            script_size = len("dispatch([]);") + sum(sizes) + \
+                max(len(sizes) - 1, 0)
+        self.operation(FLUSH).add(script_size, (end - start) * 1000)
+        for command, size in zip(batch, sizes):
+            queued = self.queued.pop(id(command), start)
+            self.operation(TO_JS + command[0]).add(size,
+                                                   (start - queued) * 1000)
+
+    def callback_done(self, name, args, start, end):
+        self.operation(FROM_JS + name).add(payload_size(args),
+                                           (end - start) * 1000)
+
+    def to_dict(self):
+        return {"seconds": time.perf_counter() - self.started,
+                "histogram_bounds_ms": HISTOGRAM_BOUNDS,
+                "operations": {name: stats.to_dict() for name, stats
+                               in sorted(self.operations.items())}}
+
+    def report(self):
+        """ The operations as a table, the most expensive ones first. """
+        lines = ['{:<36} {:>7} {:>10} {:>9} {:>8} {:>8} {:>8} {:>7}'.format(
+            'operation', 'count', 'bytes', 'total ms', 'mean ms', 'p95 ms',
+            'max ms', 'dropped')]
+        for name, stats in sorted(self.operations.items(),
+                                  key=lambda item: -item[1].total_ms):
+            lines.append(
+                '{:<36} {:>7} {:>10} {:>9.1f} {:>8.3f} {:>8.3f} {:>8.3f} '
+                '{:>7}'.format(name, stats.count, stats.bytes,
+                               stats.total_ms,
+                               stats.total_ms / max(stats.count, 1),
+                               stats.percentile(0.95), stats.max_ms,
+                               stats.dropped))
+        return '\n'.join(lines)
+
+    def dump(self, file_name):
+        with open(file_name, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+
+# the profiler of the system (SetupScene is static, too)
+PROFILER = BridgeProfiler()
+
+
+def callback(slot):
+    """ Decorator for the python_callback slots; has to be put below
+        pyqtSlot, e.g.
+
+        @QtCore.pyqtSlot(str)
+        @bridge_profiler.callback
+        def js_mesh_loaded(self, mesh_name):
+    """
+    @functools.wraps(slot)
+    def profiled_slot(self, *args):
+        if not PROFILER.enabled:
+            return slot(self, *args)
+
+        start = time.perf_counter()
+        try:
+            return slot(self, *args)
+        finally:
+            PROFILER.callback_done(slot.__name__, args, start,
+                                   time.perf_counter())
+
+    return profiled_slot
+
+
+def payload_size(args):
+    """ Approximate number of bytes of the arguments of a callback. """
+    size = 0
+    for arg in args:
+        if isinstance(arg, str):
+            size += len(arg)
+        elif isinstance(arg, (dict, list)):
+            size += len(json.dumps(arg))
+        else:
+            size += 8
+    return size
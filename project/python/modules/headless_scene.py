@@ -0,0 +1,462 @@
+import os
+from urllib.parse import unquote
+from collections import Counter, OrderedDict
+
+from PyQt5 import QtCore
+
+# the JS component starts with a 6 x 6 room (see setup_scene.js)
+DEFAULT_ROOM_SIZE = 6.0
+
+ASSET_URL_PREFIX = 'asset:///'
+COMPRESSED_EXTENSION = '.gz'
+
+
+class HeadlessMesh:
+    def __init__(self, id_, type_, file_name):
+        self.id = id_
+        self.type = type_
+        self.file_name = file_name
+        self.position = [0.0, 0.0, 0.0]
+        self.rotation = [0.0, 0.0, 0.0]
+        self.scaling = [1.0, 1.0, 1.0]
+        self.highlighted = False
+
+    def clone(self, id_):
+        mesh = HeadlessMesh(id_, self.type, self.file_name)
+        mesh.position = list(self.position)
+        mesh.rotation = list(self.rotation)
+        mesh.scaling = list(self.scaling)
+        return mesh
+
+
+class HeadlessScene:
+    """ Backend for SetupScene (see SetupScene.init_backend) that does what
+        setup_scene.js does, but without a web view: it keeps the meshes,
+        the room & its textures in memory, answers saveScene with the same
+        data, sends the same change events & calls the same
+        python_callbacks. This way, the Window can be driven by scripts
+        (benchmarks, tests), e.g. with QT_QPA_PLATFORM=offscreen.
+
+        Like in the web view, models that are added from a URL are loaded
+        at a later turn of the event loop; models that are added from data
+        are there right away. Nothing is rendered, so the bounding boxes of
+        the models (for putting them onto the floor & moving duplicates
+        next to the original) are taken from the asset index, if there is
+        one.
+
+        click & drag simulate the mouse events of the JS component.
+    """
+
+    def __init__(self, asset_index=None, root_dir='.'):
+        self.asset_index = asset_index
+        self.root_dir = root_dir
+
+        # name -> object, like addToJavaScriptWindowObject
+        self.callbacks = {}
+
+        # id -> HeadlessMesh, in the order they were added (like the
+        # properties of the meshes object in JS)
+        self.meshes = {}
+        self.room = [DEFAULT_ROOM_SIZE, DEFAULT_ROOM_SIZE]
+        self.wall_texture = None
+        self.floor_texture = None
+        self.texture_registry = {}
+        self.highlighted_mesh = None
+        self.selected_plane = 'xz'
+        self.scale_initial_y_bottom = None
+        # url -> {"loaded", "waiting": instances that were added while it
+        # was loading} (see loadMeshTemplate)
+        self.templates = {}
+        # see cancelMeshLoads
+        self.load_generation = 0
+
+        # what changed since the last on_scene_changed
+        self.changed_meshes = OrderedDict()
+        self.removed_meshes = set()
+        self.scene_settings_changed = False
+        self.scene_changes_scheduled = False
+
+        # number of calls of each JS function
+        self.calls = Counter()
+
+    # (SetupScene's side)
+
+    def add_callback(self, name, obj):
+        self.callbacks[name] = obj
+
+    def dispatch(self, batch):
+        """ Same as dispatch in setup_scene.js. """
+        for function, args in batch:
+            self.calls[function] += 1
+            try:
+                getattr(self, COMMANDS[function])(*args)
+            except Exception as e:
+                self.python_callback().on_js_console_log(
+                    function + ": " + repr(e))
+        self.send_scene_changes()
+
+    def python_callback(self):
+        return self.callbacks['python_callback']
+
+    # change events (like sendSceneChanges in setup_scene.js)
+
+    def mark_mesh_changed(self, mesh_id):
+        self.changed_meshes[mesh_id] = True
+        self.schedule_scene_changes()
+
+    def mark_mesh_removed(self, mesh_id):
+        self.removed_meshes.add(mesh_id)
+        self.schedule_scene_changes()
+
+    def mark_scene_settings_changed(self):
+        self.scene_settings_changed = True
+        self.schedule_scene_changes()
+
+    def schedule_scene_changes(self):
+        if not self.scene_changes_scheduled:
+            self.scene_changes_scheduled = True
+            QtCore.QTimer.singleShot(0, self.send_scene_changes)
+
+    def send_scene_changes(self):
+        self.scene_changes_scheduled = False
+
+        changes = {"meshes": [self.mesh_data(self.meshes[mesh_id])
+                              for mesh_id in self.changed_meshes
+                              if mesh_id in self.meshes],
+                   "removed": list(self.removed_meshes)}
+        if self.scene_settings_changed:
+            changes["scene"] = self.scene_settings()
+
+        anything = len(changes["meshes"]) > 0 or \
+            len(changes["removed"]) > 0 or self.scene_settings_changed
+
+        self.changed_meshes = OrderedDict()
+        self.removed_meshes = set()
+        self.scene_settings_changed = False
+
+        if anything:
+            self.python_callback().on_scene_changed(changes)
+
+    # scene setup
+
+    def create_scene(self, floor_x, floor_y):
+        self.room = [floor_x, floor_y]
+        self.mark_scene_settings_changed()
+
+    def redo_scene(self, floor_x, floor_y):
+        self.room = [floor_x, floor_y]
+        self.mark_scene_settings_changed()
+
+    def select_plane(self, which):
+        self.selected_plane = which
+
+    def set_camera_to_default(self):
+        pass
+
+    def target_camera_to_plane(self, plane):
+        pass
+
+    # meshes
+
+    def add_mesh(self, data, id_, images, type_, transform, file_name):
+        self.add_mesh_instances(data, [{"id": id_, "type": type_,
+                                        "transform": transform,
+                                        "fileName": file_name}], images)
+
+    def add_mesh_instances(self, data, instances, images):
+        # Babylon imports models from data right away
+        for instance in instances:
+            self.on_mesh_imported(instance)
+
+    def add_mesh_instances_from_url(self, url, instances):
+        template = self.templates.get(url)
+        if template is not None:
+            if not template["loaded"]:
+                template["waiting"].extend(instances)
+            else:
+                for instance in instances:
+                    self.on_mesh_imported(instance)
+            return
+
+        generation = self.load_generation
+        QtCore.QTimer.singleShot(
+            0, lambda: self.on_url_loaded(url, instances, generation))
+
+    def on_url_loaded(self, url, instances, generation):
+        if generation != self.load_generation:
+            return
+        if self.url_exists(url):
+            for instance in instances:
+                self.on_mesh_imported(instance)
+        else:
+            for instance in instances:
+                self.python_callback().js_mesh_load_error(
+                    instance["id"], "404 " + url)
+
+    def url_exists(self, url):
+        if not url.startswith(ASSET_URL_PREFIX):
+            return False
+        file_name = os.path.join(self.root_dir,
+                                 unquote(url[len(ASSET_URL_PREFIX):]))
+        return os.path.isfile(file_name) or \
+            os.path.isfile(file_name + COMPRESSED_EXTENSION)
+
+    def load_mesh_template(self, url):
+        if url in self.templates:
+            return
+
+        template = {"loaded": False, "waiting": []}
+        self.templates[url] = template
+        QtCore.QTimer.singleShot(
+            0, lambda: self.on_template_loaded(url, template))
+
+    def on_template_loaded(self, url, template):
+        waiting = template["waiting"]
+        template["waiting"] = []
+        if not self.url_exists(url):
+            if self.templates.get(url) is template:
+                del self.templates[url]
+            if len(waiting) > 0:
+                self.add_mesh_instances_from_url(url, waiting)
+            return
+
+        template["loaded"] = True
+        for instance in waiting:
+            self.on_mesh_imported(instance)
+
+    def cancel_mesh_loads(self):
+        self.load_generation += 1
+        for template in self.templates.values():
+            template["waiting"] = []
+
+    def drop_mesh_template(self, url):
+        # (instances that are waiting for it are still added)
+        self.templates.pop(url, None)
+
+    def on_mesh_imported(self, instance):
+        mesh = HeadlessMesh(instance["id"], instance["type"],
+                            instance["fileName"])
+        self.meshes[mesh.id] = mesh
+
+        transform = instance["transform"]
+        if transform is not None:
+            mesh.position = [float(v) for v in transform["pos"]]
+            mesh.rotation = [float(v) for v in transform["rot"]]
+            mesh.scaling = [float(v) for v in transform["scale"]]
+        else:
+            mesh.position[1] -= self.minimum_y(mesh)
+
+        self.mark_mesh_changed(mesh.id)
+        self.send_scene_changes()
+        self.python_callback().js_mesh_loaded(mesh.id)
+
+    def duplicate_mesh(self, original_id, new_id):
+        if original_id not in self.meshes:
+            return
+
+        self.remove_highlight(original_id)
+        original = self.meshes[original_id]
+        mesh = original.clone(new_id)
+        mesh.position[0] += self.half_size_x(original) * 2.2
+        self.meshes[new_id] = mesh
+
+        self.mark_mesh_changed(new_id)
+        self.send_scene_changes()
+        self.python_callback().js_mesh_loaded(new_id)
+
+    def remove_mesh(self, mesh_id):
+        mesh = self.meshes.pop(mesh_id, None)
+        if mesh is None:
+            return
+
+        if mesh is self.highlighted_mesh:
+            self.highlighted_mesh = None
+        self.mark_mesh_removed(mesh_id)
+
+    # transformations
+
+    def set_mesh_position(self, id_, x, y, z):
+        if id_ in self.meshes:
+            self.meshes[id_].position = [x, y, z]
+            self.mark_mesh_changed(id_)
+
+    def translate_mesh_by_id(self, id_, x, y, z):
+        if id_ in self.meshes:
+            position = self.meshes[id_].position
+            position[0] += x
+            position[1] += y
+            position[2] += z
+            self.mark_mesh_changed(id_)
+
+    def rotate_mesh_by_id(self, id_, x, y, z):
+        if id_ in self.meshes:
+            self.meshes[id_].rotation = [x, y, z]
+            self.mark_mesh_changed(id_)
+
+    def scale_mesh_by_id_basic(self, id_, factor_x, factor_y, factor_z):
+        if id_ in self.meshes:
+            self.meshes[id_].scaling = [factor_x, factor_y, factor_z]
+            self.mark_mesh_changed(id_)
+
+    def scale_mesh_by_id(self, id_, factor_x, factor_y, factor_z):
+        if id_ not in self.meshes or \
+                (factor_x == 1 and factor_y == 1 and factor_z == 1):
+            return
+
+        mesh = self.meshes[id_]
+        # the bottom stays where it is
+        if self.scale_initial_y_bottom is None:
+            self.scale_initial_y_bottom = self.minimum_y(mesh)
+
+        mesh.scaling = [factor_x, factor_y, factor_z]
+        mesh.position[1] += self.scale_initial_y_bottom - \
+            self.minimum_y(mesh)
+        self.mark_mesh_changed(id_)
+        # (the JS component also calls on_js_object_manipulation_performed,
+        # which the Window does not have)
+
+    def on_scale_end(self):
+        self.scale_initial_y_bottom = None
+
+    def get_translation_rotation_scale(self, mesh_id):
+        mesh = self.meshes[mesh_id]
+        self.python_callback().on_translation_rotation_scale_request(
+            list(mesh.position), list(mesh.rotation), list(mesh.scaling))
+
+    # highlighting
+
+    def highlight(self, obj_id, from_click):
+        if obj_id not in self.meshes:
+            return
+
+        mesh = self.meshes[obj_id]
+        mesh.highlighted = True
+        self.highlighted_mesh = mesh
+
+        self.python_callback().on_mesh_highlighted(
+            obj_id, mesh.scaling[0], mesh.rotation[1])
+
+    def remove_highlight(self, obj_id):
+        if obj_id not in self.meshes:
+            return
+
+        mesh = self.meshes[obj_id]
+        mesh.highlighted = False
+        if mesh is self.highlighted_mesh:
+            self.highlighted_mesh = None
+
+    # textures
+
+    def register_texture(self, hash_, data):
+        self.texture_registry[hash_] = data
+
+    def set_texture_data(self, type_, texture_name, texture_data, file_name):
+        data = {"type": type_, "textureName": texture_name,
+                "fileName": file_name}
+        if type_ == "carpet":
+            self.floor_texture = data
+        else:
+            self.wall_texture = data
+        self.mark_scene_settings_changed()
+
+    def remove_texture_data(self, type_):
+        if type_ == "carpet":
+            self.floor_texture = None
+        else:
+            self.wall_texture = None
+        self.mark_scene_settings_changed()
+
+    # state
+
+    def save_scene(self, identifier):
+        """ Calls save_state_result with the data saveScene would pass
+            (properties that would be undefined are left out).
+        """
+        scene = self.scene_settings()
+        scene["meshes"] = [self.mesh_data(mesh)
+                           for mesh in self.meshes.values()]
+
+        self.python_callback().save_state_result(scene, identifier)
+
+    def mesh_data(self, mesh):
+        return {"id": mesh.id,
+                "type": mesh.type,
+                "pos": list(mesh.position),
+                "rot": list(mesh.rotation),
+                "scale": list(mesh.scaling),
+                "fileName": mesh.file_name}
+
+    def scene_settings(self):
+        scene = {"room": {"x": self.room[0], "y": self.room[1]}}
+        if self.wall_texture is not None:
+            scene["walls"] = dict(self.wall_texture)
+        if self.floor_texture is not None:
+            scene["floor"] = dict(self.floor_texture)
+        return scene
+
+    # mouse events of the JS component
+
+    def click(self, mesh_id=None):
+        """ A click onto the mesh (or onto nothing, if mesh_id is None). """
+        self.python_callback().on_object_clicked(
+            mesh_id if mesh_id in self.meshes else '')
+
+    def drag(self, mesh_id, x=0.0, y=0.0, z=0.0):
+        """ Dragging the (highlighted) mesh by the offset (x, y, z). """
+        self.send_scene_changes()
+        self.python_callback().on_js_obj_drag_start(mesh_id)
+
+        if mesh_id in self.meshes:
+            self.translate_mesh_by_id(mesh_id, x, y, z)
+
+    # bounding boxes
+
+    def bounding_box(self, mesh):
+        if self.asset_index is None or mesh.file_name is None:
+            return None
+        entry = self.asset_index.entry(mesh.file_name)
+        if entry is None:
+            return None
+        return entry['bounding_box']
+
+    def minimum_y(self, mesh):
+        box = self.bounding_box(mesh)
+        low_y = 0.0 if box is None else box[0][1]
+        return mesh.position[1] + low_y * mesh.scaling[1]
+
+    def half_size_x(self, mesh):
+        box = self.bounding_box(mesh)
+        if box is None:
+            return 0.0
+        return (box[1][0] - box[0][0]) / 2 * mesh.scaling[0]
+
+
+# function names of setup_scene.js -> methods of HeadlessScene
+COMMANDS = {
+    "addMesh": "add_mesh",
+    "addMeshInstances": "add_mesh_instances",
+    "addMeshInstancesFromUrl": "add_mesh_instances_from_url",
+    "loadMeshTemplate": "load_mesh_template",
+    "dropMeshTemplate": "drop_mesh_template",
+    "cancelMeshLoads": "cancel_mesh_loads",
+    "duplicateMesh": "duplicate_mesh",
+    "setMeshPosition": "set_mesh_position",
+    "translateMeshByID": "translate_mesh_by_id",
+    "rotateMeshByID": "rotate_mesh_by_id",
+    "scaleMeshByIDBasic": "scale_mesh_by_id_basic",
+    "scaleMeshByID": "scale_mesh_by_id",
+    "onScaleEnd": "on_scale_end",
+    "highlight": "highlight",
+    "removeHighlight": "remove_highlight",
+    "getTranslationRotationScale": "get_translation_rotation_scale",
+    "registerTexture": "register_texture",
+    "setTextureData": "set_texture_data",
+    "removeTextureData": "remove_texture_data",
+    "removeMesh": "remove_mesh",
+    "saveScene": "save_scene",
+    "selectPlane": "select_plane",
+    "setCameraToDefault": "set_camera_to_default",
+    "targetCameraToPlane": "target_camera_to_plane",
+    "createScene": "create_scene",
+    "redoScene": "redo_scene"
+}
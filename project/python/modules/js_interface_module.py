@@ -5,9 +5,23 @@ from PyQt5.QtCore import QFile, QIODevice, Qt, QTextStream, QUrl
 from PyQt5.QtWidgets import (QAction, QApplication, QLineEdit, QMainWindow,
                              QSizePolicy, QStyle, QTextEdit)
 from PyQt5.QtNetwork import QNetworkProxyFactory, QNetworkRequest
-from PyQt5.QtWebKitWidgets import QWebPage, QWebView
+try:
+    from PyQt5.QtWebKitWidgets import QWebPage, QWebView
+except ImportError:
+    # only a headless backend can be used (see SetupScene.init_backend)
+    QWebPage = QWebView = None
 
 import json
+import time
+
+from python.modules import bridge_profiler
+
+
+class JSLiteral(str):
+    """ JS code (e.g. a string literal from
+        utility_module.read_file_as_js_string) that is put into a command
+        batch as it is, instead of being encoded with json.dumps again.
+    """
 
 
 class SetupScene:
@@ -15,28 +29,216 @@ class SetupScene:
 
         Our .js file is called "setup_scene.js", hence the name of this class.
         This helps to keep all JS parts of the python system in one place.
+
+        Each call is a command: the name of a function in setup_scene.js
+        & its arguments. Commands are not sent right away, but queued &
+        sent as one JSON array to dispatch (in setup_scene.js) at the next
+        turn of the event loop (or after FLUSH_DELAY ms), so e.g. selecting
+        a mesh or undoing a change only evaluates one script instead of one
+        per call. Callers that need the effects of their calls right away
+        (e.g. because a python_callback is triggered by them) must call
+        flush().
+
+        Transform updates of a mesh (see update) are coalesced while they
+        are queued: only the newest rotation / scale / position is sent,
+        translations are summed up. E.g. while the Wiimote's B button is
+        held, the mesh follows the controller even if the web view cannot
+        keep up with every update. Commands that depend on the transform
+        (e.g. duplicate_mesh) end the coalescing for the mesh, see
+        end_updates.
+
+        If bridge_profiler.PROFILER is enabled, the calls are recorded
+        there.
+
+        Instead of the web view, the commands can be sent to a backend (see
+        init_backend), e.g. a headless_scene.HeadlessScene.
     """
     webview = None
+    # object with dispatch(batch) & add_callback(name, obj); if it is set,
+    # it gets the commands instead of the web view
+    backend = None
+
+    # False: every call is sent right away
+    BATCHING = True
+    # ms between the first queued call & the flush; 0 = at the next turn of
+    # the event loop, ~16 = at most once per frame
+    FLUSH_DELAY = 0
+
+    # [function name, [arguments]] of the calls that have not been sent
+    # yet (None for updates that were replaced by a newer one)
+    queue = []
+    flush_scheduled = False
+    # (mesh id, operation) -> index of the queued update
+    pending_updates = {}
+
+    commands = 0
+    flushes = 0
+    max_commands_per_flush = 0
+    dropped_updates = 0
 
     @staticmethod
     def init(wv):
         SetupScene.webview = wv.page().mainFrame()
 
+    @staticmethod
+    def init_backend(backend):
+        SetupScene.backend = backend
+
     @staticmethod
     def apply_callback(name, parent):
-        SetupScene.webview.addToJavaScriptWindowObject(name, parent)
+        if SetupScene.backend is not None:
+            SetupScene.backend.add_callback(name, parent)
+        else:
+            SetupScene.webview.addToJavaScriptWindowObject(name, parent)
+
+    @staticmethod
+    def call(function, *args):
+        """ Queues a call of the JS function (see flush). The arguments must
+            be JSON serializable (or JSLiterals).
+        """
+        command = [function, list(args)]
+        SetupScene.queue.append(command)
+        SetupScene.commands += 1
+        if bridge_profiler.PROFILER.enabled:
+            bridge_profiler.PROFILER.command_queued(command)
+
+        if not SetupScene.BATCHING:
+            SetupScene.flush()
+        elif not SetupScene.flush_scheduled:
+            SetupScene.flush_scheduled = True
+            QtCore.QTimer.singleShot(SetupScene.FLUSH_DELAY, SetupScene.flush)
+
+    @staticmethod
+    def update(mesh_id, operation, function, *args):
+        """ Queues a call that sets a property of a mesh; a queued call
+            for the same mesh & operation is replaced where it is in the
+            queue (last writer wins), so it stays in order with the other
+            calls.
+        """
+        index = SetupScene.pending_updates.get((mesh_id, operation))
+        if index is None:
+            SetupScene.pending_updates[(mesh_id, operation)] = \
+                len(SetupScene.queue)
+            SetupScene.call(function, *args)
+            return
+
+        command = [function, list(args)]
+        replaced = SetupScene.queue[index]
+        SetupScene.queue[index] = command
+        SetupScene.commands += 1
+        SetupScene.dropped_updates += 1
+        if bridge_profiler.PROFILER.enabled:
+            bridge_profiler.PROFILER.command_dropped(replaced)
+            bridge_profiler.PROFILER.command_queued(command)
+
+    @staticmethod
+    def queued_update(mesh_id, operation):
+        """ The arguments of the queued update (or None). """
+        index = SetupScene.pending_updates.get((mesh_id, operation))
+        return None if index is None else SetupScene.queue[index][1]
+
+    @staticmethod
+    def drop_update(mesh_id, operation):
+        """ Removes the queued update & returns its arguments (or None). """
+        index = SetupScene.pending_updates.pop((mesh_id, operation), None)
+        if index is None:
+            return None
+
+        command = SetupScene.queue[index]
+        SetupScene.queue[index] = None
+        SetupScene.dropped_updates += 1
+        if bridge_profiler.PROFILER.enabled:
+            bridge_profiler.PROFILER.command_dropped(command)
+
+        return command[1]
+
+    @staticmethod
+    def end_updates(mesh_id=None):
+        """ Later updates of the mesh (of all meshes if mesh_id is None)
+            are queued as new calls instead of replacing the ones that are
+            queued. Must be called before queueing a call that uses the
+            mesh's transform or replaces the mesh: e.g. the position of a
+            copy would change if a later translation of the original was
+            merged into one before duplicateMesh.
+        """
+        if mesh_id is None:
+            SetupScene.pending_updates = {}
+            return
+
+        for key in [key for key in SetupScene.pending_updates
+                    if key[0] == mesh_id]:
+            del SetupScene.pending_updates[key]
+
+    @staticmethod
+    def flush():
+        """ Sends all queued calls, in order, in one dispatch call. """
+        SetupScene.flush_scheduled = False
+        SetupScene.pending_updates = {}
+
+        # calls that are made by python_callbacks during the evaluation
+        # go into the next batch
+        batch = [command for command in SetupScene.queue
+                 if command is not None]
+        SetupScene.queue = []
+        if len(batch) == 0:
+            return
+
+        SetupScene.flushes += 1
+        SetupScene.max_commands_per_flush = max(
+            SetupScene.max_commands_per_flush, len(batch))
+
+        if not bridge_profiler.PROFILER.enabled:
+            SetupScene.send(batch)
+            return
+
+        if SetupScene.backend is not None:
+            # nothing is serialized for a backend (see command_size)
+            sizes = [command_size(command) for command in batch]
+        else:
+            sizes = []
+        start = time.perf_counter()
+        size = SetupScene.send(batch, sizes)
+        bridge_profiler.PROFILER.batch_sent(batch, sizes, size, start,
+                                            time.perf_counter())
+
+    @staticmethod
+    def send(batch, sizes=None):
+        """ Returns the size of the script (None if it went to a backend).
+            sizes: see serialize_batch
+        """
+        if SetupScene.backend is not None:
+            SetupScene.backend.dispatch(batch)
+            return None
+
+        script = "dispatch(" + serialize_batch(batch, sizes) + ");"
+        SetupScene.webview.evaluateJavaScript(script)
+        return len(script)
+
+    @staticmethod
+    def stats():
+        return {"commands": SetupScene.commands,
+                "flushes": SetupScene.flushes,
+                "commands_per_flush": (SetupScene.commands -
+                                       SetupScene.dropped_updates) /
+                max(SetupScene.flushes, 1),
+                "max_commands_per_flush": SetupScene.max_commands_per_flush,
+                "dropped_updates": SetupScene.dropped_updates,
+                "queued": len(SetupScene.queue)}
 
     @staticmethod
     def translate_mesh_by_id(id_, x, y, z):
-        SetupScene.webview.evaluateJavaScript(
-            "translateMeshByID('" + id_ + "', " +
-            str(x) + ", " + str(y) + ", " + str(z) + " );")
+        # relative: a queued translation is added to this one
+        queued = SetupScene.queued_update(id_, "translate")
+        if queued is not None:
+            x, y, z = queued[1] + x, queued[2] + y, queued[3] + z
+
+        SetupScene.update(id_, "translate", "translateMeshByID", id_,
+                          float(x), float(y), float(z))
 
     @staticmethod
     def rotate_mesh_by_id(id_, angle_x, angle_y, angle_z):
-        SetupScene.webview.evaluateJavaScript(
-            "rotateMeshByID('" + id_ + "', " +
-            str(angle_x) + ", " + str(angle_y) + ", " + str(angle_z) + " );")
+        SetupScene.update(id_, "rotate", "rotateMeshByID", id_,
+                          float(angle_x), float(angle_y), float(angle_z))
 
     @staticmethod
     def scale_mesh_by_id(id_, factor_x, factor_y, factor_z, keep_y_bottom=True):
@@ -44,104 +246,193 @@ class SetupScene:
         if not keep_y_bottom:
             method = "scaleMeshByIDBasic"
 
-        SetupScene.webview.evaluateJavaScript(
-            method + "('" + id_ + "', " +
-            str(factor_x) + ", " + str(factor_y) + ", " +
-            str(factor_z) + " );")
+        SetupScene.update(id_, "scale", method, id_, float(factor_x),
+                          float(factor_y), float(factor_z))
 
     @staticmethod
     def add_mesh(data, mesh_id, images={}, mesh_type="box",
                  transform="null", mesh_file=""):
-        SetupScene.webview.evaluateJavaScript(
-            "addMesh(" + data + ",'" + mesh_id + "'," + json.dumps(images) +
-            ",'" + mesh_type + "'," + transform + ",'" + mesh_file + "');")
+        """ data: the model as a JS string literal (UTF-8 bytes, see
+                  utility_module.read_file_as_js_string)
+            transform: JS expression (see JSLiteral)
+        """
+        SetupScene.call("addMesh", JSLiteral(data, 'utf-8'), mesh_id, images,
+                        mesh_type, JSLiteral(transform), mesh_file)
+
+    @staticmethod
+    def add_mesh_instances(data, instances, images={}):
+        """ data: see add_mesh
+            instances: list of {"id", "type", "transform", "fileName"};
+            the data is only imported once for all of them.
+        """
+        SetupScene.call("addMeshInstances", JSLiteral(data, 'utf-8'),
+                        instances, images)
+
+    @staticmethod
+    def add_mesh_instances_from_url(url, instances):
+        SetupScene.call("addMeshInstancesFromUrl", url, instances)
+
+    @staticmethod
+    def cancel_mesh_loads():
+        """ The meshes that are being imported are dropped when they are
+            loaded (e.g. after the scene was cleared).
+        """
+        SetupScene.call("cancelMeshLoads")
+
+    @staticmethod
+    def load_mesh_template(url):
+        """ The model at the url is imported as a hidden mesh that
+            add_mesh_instances_from_url clones (until it is dropped).
+        """
+        SetupScene.call("loadMeshTemplate", url)
+
+    @staticmethod
+    def drop_mesh_template(url):
+        SetupScene.call("dropMeshTemplate", url)
 
     @staticmethod
     def duplicate_mesh(mesh_id_original, new_id):
-        SetupScene.webview.evaluateJavaScript(
-            "duplicateMesh('" + mesh_id_original + "', '" + new_id + "');")
+        SetupScene.end_updates(mesh_id_original)
+        SetupScene.call("duplicateMesh", mesh_id_original, new_id)
 
     @staticmethod
     def highlight_mesh(mesh_id, from_click):
-        SetupScene.webview.evaluateJavaScript(
-            "highlight('" + mesh_id + "'," + str(from_click).lower() + ");")
+        SetupScene.call("highlight", mesh_id, bool(from_click))
 
     @staticmethod
     def remove_highlight_from_mesh(mesh_id):
-        SetupScene.webview.evaluateJavaScript(
-            "removeHighlight('" + mesh_id + "');")
+        SetupScene.call("removeHighlight", mesh_id)
 
     @staticmethod
     def set_mesh_position(mesh_id, x, y, z):
-        SetupScene.webview.evaluateJavaScript(
-            "setMeshPosition('" + mesh_id + "', " +
-            str(x) + ", " + str(y) + ", " + str(z) + ");")
+        # absolute, so a queued translation does not matter anymore
+        SetupScene.drop_update(mesh_id, "translate")
+        SetupScene.update(mesh_id, "position", "setMeshPosition", mesh_id,
+                          float(x), float(y), float(z))
 
     @staticmethod
     def get_translation_rotation_scale(mesh_id):
-        SetupScene.webview.evaluateJavaScript(
-            "getTranslationRotationScale('" + mesh_id + "');")
+        # the transform is read after the updates that are queued before
+        # the newest request, not where the first one was queued
+        SetupScene.drop_update(mesh_id, "get_transform")
+        SetupScene.update(mesh_id, "get_transform",
+                          "getTranslationRotationScale", mesh_id)
 
     @staticmethod
     def save_state(identifier="no identifier"):
-        SetupScene.webview.evaluateJavaScript(
-            "saveScene('" + identifier + "');")
+        # the state is passed to save_state_result right away, which adds
+        # python state (the selection) that might change after this call
+        SetupScene.end_updates()
+        SetupScene.call("saveScene", identifier)
+        SetupScene.flush()
 
     @staticmethod
     def remove_mesh(mesh_id):
-        SetupScene.webview.evaluateJavaScript("removeMesh('" + mesh_id + "');")
+        SetupScene.end_updates(mesh_id)
+        SetupScene.call("removeMesh", mesh_id)
 
     @staticmethod
     def set_selected_plane(which):
-        SetupScene.webview.evaluateJavaScript("selectPlane('" + which + "');")
+        SetupScene.call("selectPlane", which)
 
     @staticmethod
     def on_scale_end():
-        SetupScene.webview.evaluateJavaScript("onScaleEnd();")
+        # the next scaling keeps the bottom where it is then
+        SetupScene.end_updates()
+        SetupScene.call("onScaleEnd")
 
     @staticmethod
     def set_camera_to_default():
-        SetupScene.webview.evaluateJavaScript("setCameraToDefault();")
+        SetupScene.call("setCameraToDefault")
 
     @staticmethod
     def target_camera_to_plane(plane):
-        SetupScene.webview.evaluateJavaScript("targetCameraToPlane('" + plane +
-                                              "');")
+        SetupScene.call("targetCameraToPlane", plane)
 
     @staticmethod
     def create_new_scene(x, y):
-        SetupScene.webview.evaluateJavaScript("createScene('" + str(x / 100) +
-                                              "', '" + str(y / 100) + "');")
+        SetupScene.end_updates()
+        # (the JS component has always got the sizes as strings)
+        SetupScene.call("createScene", str(x / 100), str(y / 100))
 
     @staticmethod
     def set_texture(type_, texture_name, texture_data, file_name):
-        SetupScene.webview.evaluateJavaScript(
-            "setTextureData('" + type_ + "'," +
-            "'" + texture_name + "',\"" +
-            texture_data + "\",'" + file_name + "');")
+        SetupScene.call("setTextureData", type_, texture_name, texture_data,
+                        file_name)
+
+    @staticmethod
+    def register_texture(hash_, texture_data):
+        SetupScene.call("registerTexture", hash_, texture_data)
 
     @staticmethod
     def remove_texture(type_):
-        SetupScene.webview.evaluateJavaScript(
-            "removeTextureData('" + type_ + "');")
+        SetupScene.call("removeTextureData", type_)
 
     @staticmethod
     def redo_scene(x, y):
-        SetupScene.webview.evaluateJavaScript("redoScene('" + str(x) + "', '" +
-                                              str(y) + "')")
+        SetupScene.end_updates()
+        SetupScene.call("redoScene", str(x), str(y))
 
 
-def deserialize_list(js_list_as_string):
-    l = []
-    s = ''
+def serialize_batch(batch, sizes=None):
+    """ JSON array of the commands ([function name, [arguments]]).
+        JSLiteral arguments are inserted as they are.
+
+        sizes: if it is a list, the length of each command in the array is
+               appended to it (for the bridge_profiler)
+    """
+    if sizes is None and not any(isinstance(arg, JSLiteral)
+                                 for function, args in batch
+                                 for arg in args):
+        return json.dumps(batch)
+
+    parts = [serialize_command(function, args) for function, args in batch]
+    if sizes is not None:
+        sizes.extend(len(part) for part in parts)
+
+    return '[' + ','.join(parts) + ']'
 
-    for c in list(js_list_as_string):
-        if c != ',':
-            s += c
-        else:
-            l.append(float(s))
-            s = ''
 
-    l.append(float(s))
+def serialize_command(function, args):
+    if any(isinstance(arg, JSLiteral) for arg in args):
+        return '[' + json.dumps(function) + ',[' + ','.join(
+            arg if isinstance(arg, JSLiteral) else json.dumps(arg)
+            for arg in args) + ']]'
+    return json.dumps([function, args])
+
+
+def command_size(command):
+    """ Length of the command in a batch from serialize_batch, without
+        copying the JSLiteral arguments (e.g. whole models) into a string.
+    """
+    function, args = command
+    if not any(isinstance(arg, JSLiteral) for arg in args):
+        return len(json.dumps(command))
 
-    return l
+    # '[' function ',[' arguments separated by ',' ']]'
+    return len(json.dumps(function)) + 5 + max(len(args) - 1, 0) + sum(
+        len(arg) if isinstance(arg, JSLiteral) else len(json.dumps(arg))
+        for arg in args)
+
+
+def to_floats(js_list):
+    """ A JS array of numbers (which PyQt passes to 'QVariantList' slots as a
+        list of floats) as a list of Python floats.
+    """
+    return [float(value) for value in js_list]
+
+
+def from_js_object(value):
+    """ A JS object / array as it is passed to 'QVariantMap' slots, with the
+        properties that were undefined or null removed (like
+        JSON.stringify does for undefined values).
+    """
+    if isinstance(value, dict):
+        return {key: from_js_object(item)
+                if isinstance(item, (dict, list)) else item
+                for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [from_js_object(item)
+                if isinstance(item, (dict, list)) else item
+                for item in value]
+    return value
@@ -0,0 +1,170 @@
+import numpy as np
+
+# vertices are only merged if their normals point roughly into the same of
+# these directions, so the hard edges of e.g. tables & shelves stay hard
+NORMAL_DIRECTIONS = np.array([[1, 0, 0], [-1, 0, 0],
+                              [0, 1, 0], [0, -1, 0],
+                              [0, 0, 1], [0, 0, -1]], dtype='f4')
+
+
+def simplify_mesh(mesh, resolution):
+    """ Simplifies a mesh of a .babylon file by vertex clustering:
+        the bounding box is divided into a grid with "resolution" cells along
+        its longest side; all vertices of a sub mesh in the same cell (and
+        with a similar normal) become one vertex at their average position.
+        Triangles that collapse to a line or point are removed.
+
+        mesh: dict of the mesh as in the .babylon file (positions, normals,
+              uvs, indices, subMeshes)
+        Returns a copy of the mesh dict with the simplified data as numpy
+        arrays; the other keys are left as they are.
+    """
+    positions = np.asarray(mesh['positions'], dtype='f4').reshape(-1, 3)
+    normals = None
+    if mesh.get('normals'):
+        normals = np.asarray(mesh['normals'], dtype='f4').reshape(-1, 3)
+    uvs = None
+    if mesh.get('uvs'):
+        uvs = np.asarray(mesh['uvs'], dtype='f4').reshape(-1, 2)
+    indices = np.asarray(mesh['indices'], dtype='i8')
+
+    sub_meshes = mesh.get('subMeshes')
+    if not sub_meshes or not sub_meshes_valid(sub_meshes, indices,
+                                              len(positions)):
+        # the sub meshes are clustered separately, which only works if
+        # each one uses its own range of vertices; otherwise the mesh is
+        # clustered as a whole
+        material_index = sub_meshes[0]['materialIndex'] if sub_meshes else 0
+        sub_meshes = [{'materialIndex': material_index, 'verticesStart': 0,
+                       'verticesCount': len(positions), 'indexStart': 0,
+                       'indexCount': len(indices)}]
+
+    keys = cluster_keys(positions, normals, resolution)
+
+    new_positions, new_normals, new_uvs, new_indices = [], [], [], []
+    new_sub_meshes = []
+    vertex_offset = 0
+    index_offset = 0
+
+    for sub_mesh in sub_meshes:
+        start = sub_mesh['verticesStart']
+        end = start + sub_mesh['verticesCount']
+        triangles = indices[sub_mesh['indexStart']:sub_mesh['indexStart'] +
+                            sub_mesh['indexCount']].reshape(-1, 3) - start
+
+        # cluster: index of the new vertex for each old vertex
+        unique_keys, first, cluster = np.unique(
+            keys[start:end], return_index=True, return_inverse=True)
+        cluster = cluster.reshape(-1)
+        count = len(unique_keys)
+
+        triangles = cluster[triangles]
+        triangles = triangles[(triangles[:, 0] != triangles[:, 1]) &
+                              (triangles[:, 1] != triangles[:, 2]) &
+                              (triangles[:, 0] != triangles[:, 2])]
+        if len(triangles) == 0:
+            continue
+
+        # only keep the vertices that are still used
+        used = np.unique(triangles)
+        remap = np.full(count, -1, dtype='i8')
+        remap[used] = np.arange(len(used))
+
+        new_positions.append(cluster_average(
+            positions[start:end], cluster, count)[used])
+        if normals is not None:
+            cluster_normals = cluster_average(normals[start:end], cluster,
+                                              count)[used]
+            lengths = np.linalg.norm(cluster_normals, axis=1)[:, None]
+            new_normals.append(cluster_normals / np.maximum(lengths, 1e-12))
+        if uvs is not None:
+            # averaging uvs would smear textures across seams
+            new_uvs.append(uvs[start:end][first[used]])
+
+        new_indices.append(remap[triangles].reshape(-1) + vertex_offset)
+        new_sub_meshes.append({'materialIndex': sub_mesh['materialIndex'],
+                               'verticesStart': vertex_offset,
+                               'verticesCount': len(used),
+                               'indexStart': index_offset,
+                               'indexCount': len(triangles) * 3})
+        vertex_offset += len(used)
+        index_offset += len(triangles) * 3
+
+    if len(new_sub_meshes) == 0:
+        # everything collapsed: the mesh is too small for the grid
+        return dict(mesh)
+
+    simplified = dict(mesh)
+    simplified['positions'] = np.concatenate(new_positions).reshape(-1)
+    if normals is not None:
+        simplified['normals'] = np.concatenate(new_normals).reshape(-1)
+    if uvs is not None:
+        simplified['uvs'] = np.concatenate(new_uvs).reshape(-1)
+    simplified['indices'] = np.concatenate(new_indices)
+    simplified['subMeshes'] = new_sub_meshes
+
+    # other vertex data (colors etc.) would not match the new vertices
+    for key in ('uvs2', 'colors', 'matricesIndices', 'matricesWeights'):
+        simplified.pop(key, None)
+
+    return simplified
+
+
+def sub_meshes_valid(sub_meshes, indices, vertex_count):
+    """ Whether every sub mesh lies inside the mesh's data and its
+        indices only point to the vertices in
+        [verticesStart, verticesStart + verticesCount).
+    """
+    for sub_mesh in sub_meshes:
+        vertices_start = sub_mesh['verticesStart']
+        vertices_end = vertices_start + sub_mesh['verticesCount']
+        index_start = sub_mesh['indexStart']
+        index_end = index_start + sub_mesh['indexCount']
+
+        if vertices_start < 0 or vertices_end > vertex_count or \
+                index_start < 0 or index_end > len(indices) or \
+                sub_mesh['indexCount'] % 3 != 0:
+            return False
+
+        used = indices[index_start:index_end]
+        if len(used) > 0 and (used.min() < vertices_start or
+                              used.max() >= vertices_end):
+            return False
+
+    return True
+
+
+def cluster_keys(positions, normals, resolution):
+    """ Number of the grid cell (& normal direction) of each vertex. """
+    low = positions.min(axis=0)
+    cell_size = max(float((positions.max(axis=0) - low).max()), 1e-6) / \
+        resolution
+
+    cells = np.clip(np.floor((positions - low) / cell_size).astype('i8'),
+                    0, resolution)
+    keys = (cells[:, 0] * (resolution + 1) + cells[:, 1]) * \
+        (resolution + 1) + cells[:, 2]
+
+    if normals is not None:
+        directions = np.argmax(normals.dot(NORMAL_DIRECTIONS.T), axis=1)
+        keys = keys * len(NORMAL_DIRECTIONS) + directions
+
+    return keys
+
+
+def cluster_average(values, cluster, count):
+    """ Average of the rows of values that belong to each cluster. """
+    sizes = np.bincount(cluster, minlength=count).astype('f8')
+    sizes[sizes == 0] = 1
+
+    average = np.empty((count, values.shape[1]), dtype='f4')
+    for column in range(values.shape[1]):
+        average[:, column] = np.bincount(
+            cluster, weights=values[:, column], minlength=count) / sizes
+
+    return average
+
+
+def vertex_count(mesh):
+    positions = mesh.get('positions')
+    return 0 if positions is None else len(positions) // 3
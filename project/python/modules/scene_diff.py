@@ -0,0 +1,81 @@
+# positions, rotations & scalings that differ by less than this are the same
+FLOAT_TOLERANCE = 1e-6
+
+# the textures of a state (see saveScene in setup_scene.js)
+TEXTURE_TYPES = ("walls", "floor")
+
+
+class SceneDiff:
+    """ What has to be sent to the JS component to get from one state of the
+        scene to another (see diff_states).
+    """
+
+    def __init__(self):
+        # ids of the meshes to remove
+        self.removed = []
+        # meshes (of the next state) to add
+        self.added = []
+        # (mesh, previous mesh) of the meshes that have to be moved
+        self.moved = []
+        # meshes that have to be rotated / scaled
+        self.rotated = []
+        self.scaled = []
+        # texture types (see TEXTURE_TYPES) that changed
+        self.textures = []
+
+    def is_empty(self):
+        return not (self.removed or self.added or self.moved or
+                    self.rotated or self.scaled or self.textures)
+
+    def stats(self):
+        return {"removed": len(self.removed), "added": len(self.added),
+                "moved": len(self.moved), "rotated": len(self.rotated),
+                "scaled": len(self.scaled), "textures": len(self.textures)}
+
+
+def vectors_differ(a, b, tolerance=FLOAT_TOLERANCE):
+    if len(a) != len(b):
+        return True
+    for x, y in zip(a, b):
+        if abs(x - y) > tolerance:
+            return True
+    return False
+
+
+def diff_states(current_state, next_state, tolerance=FLOAT_TOLERANCE):
+    """ current_state, next_state: states of the scene (dicts, see saveScene
+        in setup_scene.js)
+
+        The meshes are matched by their ids. A mesh that has the same id but
+        another model in the next state is removed & added again.
+    """
+    diff = SceneDiff()
+
+    current_meshes = {mesh["id"]: mesh for mesh in current_state["meshes"]}
+    next_ids = set()
+    replaced = []
+    for mesh in next_state["meshes"]:
+        next_ids.add(mesh["id"])
+        previous = current_meshes.get(mesh["id"])
+        if previous is None:
+            diff.added.append(mesh)
+        elif previous["fileName"] != mesh["fileName"] or \
+                previous["type"] != mesh["type"]:
+            replaced.append(mesh["id"])
+            diff.added.append(mesh)
+        else:
+            if vectors_differ(mesh["pos"], previous["pos"], tolerance):
+                diff.moved.append((mesh, previous))
+            if vectors_differ(mesh["rot"], previous["rot"], tolerance):
+                diff.rotated.append(mesh)
+            if vectors_differ(mesh["scale"], previous["scale"], tolerance):
+                diff.scaled.append(mesh)
+
+    diff.removed = [mesh_id for mesh_id in current_meshes
+                    if mesh_id not in next_ids] + replaced
+
+    for texture_type in TEXTURE_TYPES:
+        if current_state.get(texture_type) != next_state.get(texture_type):
+            diff.textures.append(texture_type)
+
+    return diff
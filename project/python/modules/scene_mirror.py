@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+from python.modules import scene_state
+
+# the JS component starts with a 6 x 6 room (see setup_scene.js)
+DEFAULT_ROOM_SIZE = 6.0
+
+
+class SceneMirror:
+    """ Python's copy of the scene in the JS component: the meshes (with
+        their transformations), the room size & the textures.
+
+        setup_scene.js sends what changed after each dispatch and before
+        callbacks that might save the state (on_scene_changed), so the state
+        for undo can be taken from here; the JS component does not have to
+        convert the whole scene for each undo step (saveScene).
+    """
+
+    def __init__(self):
+        # mesh id -> frozen dict as in the saved state ("id", "type", "pos",
+        # "rot", "scale", "fileName"), in the order the meshes were added
+        self.meshes = OrderedDict()
+        self.room = scene_state.FrozenDict(x=DEFAULT_ROOM_SIZE,
+                                           y=DEFAULT_ROOM_SIZE)
+        self.walls = None
+        self.floor = None
+
+        self.updates = 0
+
+    def apply(self, changes):
+        """ changes: what on_scene_changed got, with the undefined / null
+            properties removed (see js_interface_module.from_js_object):
+            "meshes": the meshes that were added or changed
+            "removed": ids of the meshes that were removed
+            "scene": the room & textures (only if they changed)
+        """
+        self.updates += 1
+
+        for mesh_id in changes.get("removed", []):
+            self.meshes.pop(mesh_id, None)
+
+        for mesh in changes.get("meshes", []):
+            # the meshes are frozen once & shared by the states
+            self.meshes[mesh["id"]] = scene_state.freeze(mesh)
+
+        scene = changes.get("scene")
+        if scene is not None:
+            self.room = scene_state.freeze(scene["room"])
+            self.walls = scene_state.freeze(scene.get("walls"))
+            self.floor = scene_state.freeze(scene.get("floor"))
+
+    def state(self):
+        """ The scene (SceneState) in the same format as saveScene
+            (setup_scene.js).
+        """
+        state = {"meshes": tuple(self.meshes.values()), "room": self.room}
+        if self.walls is not None:
+            state["walls"] = self.walls
+        if self.floor is not None:
+            state["floor"] = self.floor
+
+        return scene_state.SceneState(state)
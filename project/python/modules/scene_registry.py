@@ -0,0 +1,243 @@
+import bisect
+
+from PyQt5 import QtCore
+
+
+class MeshRecord:
+    """ What the Window knows about a mesh in the scene. """
+    __slots__ = ('id', 'vertices', 'loaded', 'number')
+
+    def __init__(self, mesh_id, vertices=0):
+        self.id = mesh_id
+        # vertices of the model that is loaded for it (if known), for the
+        # SCENE_VERTEX_BUDGET
+        self.vertices = vertices
+        # False while the JS component is still loading it
+        self.loaded = False
+        # the meshes are numbered in the order they were loaded (see
+        # SceneRegistry.row)
+        self.number = -1
+
+
+class NameAllocator:
+    """ Unique names for meshes: the name itself if it is not in use,
+        otherwise the name + 1, 2, 3, ... (the lowest number that is not in
+        use), e.g. "Chair", "Chair1", "Chair2".
+
+        Instead of trying all the numbers for each new name, the allocator
+        keeps the lowest number that might be free for each name, so adding
+        many meshes with the same name is not quadratic. Names that are not
+        used anymore must be released, so their numbers are used again.
+    """
+
+    def __init__(self, used_names):
+        """ used_names: the names in use (anything that supports "in");
+                        the caller has to add the allocated names
+        """
+        self.used_names = used_names
+        # name -> all of name + 1 ... name + (number - 1) are in use
+        self.next_numbers = {}
+
+    def name_for_new_mesh(self, name, type_):
+        """ name: the preferred name (None: the type of the mesh) """
+        if name is None:
+            name = type_
+        return self.allocate(name)
+
+    def name_for_copy(self, orig_mesh_id):
+        return self.allocate(orig_mesh_id + "_copy")
+
+    def allocate(self, name):
+        if name not in self.used_names:
+            return name
+
+        number = self.next_numbers.get(name, 1)
+        while name + str(number) in self.used_names:
+            number += 1
+        self.next_numbers[name] = number + 1
+
+        return name + str(number)
+
+    def release(self, name):
+        # name might be any of the names with a number it ends with, e.g.
+        # "Chair12" = "Chair1" + 2 or "Chair" + 12
+        end = len(name)
+        while end > 1 and name[end - 1].isdigit():
+            end -= 1
+            if name[end] != '0' and name[:end] in self.next_numbers:
+                self.next_numbers[name[:end]] = min(
+                    self.next_numbers[name[:end]], int(name[end:]))
+
+    def reset(self):
+        self.next_numbers = {}
+
+
+class SceneRegistry:
+    """ The meshes of the scene, by id: the ones that are loaded (in the
+        order they were loaded, like the list of meshes in the window) &
+        the ones that were requested but are not loaded yet (their names
+        are reserved).
+
+        Looking up a mesh is O(1). The loaded meshes are numbered in the
+        order they were loaded; the row of a mesh is found by a binary search
+        of its number, so removing a mesh does not have to renumber the rows
+        of the meshes after it.
+    """
+
+    def __init__(self):
+        # id -> MeshRecord (loaded & loading)
+        self.records = {}
+        # the loaded meshes' records & their numbers, in order
+        self.order = []
+        self.numbers = []
+        self.next_number = 0
+        self.loading = 0
+        self.total_vertices = 0
+        # names for new meshes, unique among the reserved ones
+        self.names = NameAllocator(self.records)
+
+    def reserve(self, mesh_id, vertices=0):
+        """ Adds a mesh that is not loaded yet (or replaces the number of
+            vertices of a mesh that is there already).
+        """
+        record = self.records.get(mesh_id)
+        if record is None:
+            record = self.records[mesh_id] = MeshRecord(mesh_id)
+            self.loading += 1
+        self.total_vertices += vertices - record.vertices
+        record.vertices = vertices
+
+        return record
+
+    def mark_loaded(self, mesh_id):
+        """ Appends the mesh to the loaded meshes; returns its row (None if
+            it was not reserved).
+        """
+        record = self.records.get(mesh_id)
+        if record is None:
+            return None
+        if record.loaded:
+            return self.row(mesh_id)
+
+        record.loaded = True
+        self.loading -= 1
+        record.number = self.next_number
+        self.next_number += 1
+        self.order.append(record)
+        self.numbers.append(record.number)
+
+        return len(self.order) - 1
+
+    def remove(self, mesh_id):
+        """ Removes the mesh; returns the row it had (None if it was not
+            loaded or not there).
+        """
+        record = self.records.pop(mesh_id, None)
+        if record is None:
+            return None
+
+        self.names.release(mesh_id)
+        self.total_vertices -= record.vertices
+        if not record.loaded:
+            self.loading -= 1
+            return None
+
+        row = self.row(mesh_id, record)
+        del self.order[row]
+        del self.numbers[row]
+
+        return row
+
+    def row(self, mesh_id, record=None):
+        """ Row of the loaded mesh (None if it is not loaded). """
+        if record is None:
+            record = self.records.get(mesh_id)
+        if record is None or not record.loaded:
+            return None
+
+        return bisect.bisect_left(self.numbers, record.number)
+
+    def id_at(self, row):
+        return self.order[row].id
+
+    def vertices(self, mesh_id):
+        record = self.records.get(mesh_id)
+        return 0 if record is None else record.vertices
+
+    def is_loaded(self, mesh_id):
+        record = self.records.get(mesh_id)
+        return record is not None and record.loaded
+
+    def clear(self):
+        self.records = {}
+        self.order = []
+        self.numbers = []
+        self.loading = 0
+        self.total_vertices = 0
+        self.names = NameAllocator(self.records)
+
+    def __contains__(self, mesh_id):
+        """ True for loaded meshes & meshes that are loading (i.e. the name
+            is in use).
+        """
+        return mesh_id in self.records
+
+    def __iter__(self):
+        """ The ids of the loaded meshes, in order. """
+        return iter([record.id for record in self.order])
+
+    def __len__(self):
+        """ Number of loaded meshes. """
+        return len(self.order)
+
+
+class SceneListModel(QtCore.QAbstractListModel):
+    """ The loaded meshes of a SceneRegistry, for the list view of the
+        window. Changes of the loaded meshes have to go through this model,
+        so the view is notified.
+    """
+
+    def __init__(self, registry, parent=None):
+        super(SceneListModel, self).__init__(parent)
+        self.registry = registry
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.registry.order)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and index.isValid():
+            return self.registry.order[index.row()].id
+        return None
+
+    def mesh_loaded(self, mesh_id):
+        if mesh_id not in self.registry or self.registry.is_loaded(mesh_id):
+            return
+
+        row = len(self.registry.order)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.registry.mark_loaded(mesh_id)
+        self.endInsertRows()
+
+    def remove_mesh(self, mesh_id):
+        row = self.registry.row(mesh_id)
+        if row is None:
+            self.registry.remove(mesh_id)
+            return
+
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        self.registry.remove(mesh_id)
+        self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.registry.clear()
+        self.endResetModel()
+
+    def index_of(self, mesh_id):
+        """ QModelIndex of the mesh (invalid if it is not loaded). """
+        row = self.registry.row(mesh_id)
+        if row is None:
+            return QtCore.QModelIndex()
+        return self.index(row)
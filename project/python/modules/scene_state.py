@@ -0,0 +1,86 @@
+import json
+
+
+class FrozenDict(dict):
+    """ A dict that cannot be changed, so states of the scene can share it
+        (e.g. the meshes that did not change between two states). It is
+        still a dict for everything that reads it (& for json).
+    """
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('scene states cannot be changed')
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = __ior__ = _immutable
+
+
+class SceneState(FrozenDict):
+    """ A state of the scene (see saveScene in setup_scene.js): "meshes"
+        (a tuple of frozen meshes), "room", "walls" & "floor" (if the room
+        has textures) and "selection".
+
+        States are made once from what comes from the JS component (see
+        freeze_state) & never changed; the JSON is only made when it is
+        needed (to_json, e.g. to save the scene to a file).
+    """
+    __slots__ = ('json',)
+
+    def __init__(self, *args, **kwargs):
+        super(SceneState, self).__init__(*args, **kwargs)
+        self.json = None
+
+    def to_json(self):
+        if self.json is None:
+            self.json = json.dumps(self)
+        return self.json
+
+
+def freeze(value):
+    """ The value with all dicts & lists made immutable (FrozenDicts &
+        tuples); frozen dicts are used as they are.
+    """
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def frozen_object(pairs):
+    """ object_pairs_hook for json: frozen dicts with tuples instead of the
+        lists of numbers in them.
+    """
+    return FrozenDict((key, tuple(value) if type(value) is list else value)
+                      for key, value in pairs)
+
+
+def loads(text):
+    """ Parses JSON with all objects & lists frozen (faster than freeze
+        after json.loads).
+    """
+    value = json.loads(text, object_pairs_hook=frozen_object)
+    return tuple(value) if type(value) is list else value
+
+
+def freeze_state(state):
+    """ state: dict or JSON string (the meshes may be frozen already) """
+    if isinstance(state, SceneState):
+        return state
+    if isinstance(state, str):
+        state = loads(state)
+    if isinstance(state, FrozenDict):
+        # (everything in it is frozen)
+        return SceneState(state)
+    return SceneState((key, freeze(value)) for key, value in state.items())
+
+
+def with_changes(state, **changes):
+    """ A new state with the changed properties; everything else is
+        shared.
+    """
+    values = dict(state)
+    values.update((key, freeze(value)) for key, value in changes.items())
+    return SceneState(values)
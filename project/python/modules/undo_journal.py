@@ -0,0 +1,329 @@
+import os
+import mmap
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from python.modules import scene_state
+from python.modules import undo_utility
+
+JOURNAL_MAGIC = b'UNDOJOURNAL1\n'
+# each record: kind, length of the data, crc32 of the data
+RECORD_HEADER = struct.Struct('<BII')
+# data of ENTRY, FIRST & SCENE records (see entry_data): flags (1:
+# keyframe, 2: compressed), length of the action
+ENTRY_HEADER = struct.Struct('<BH')
+
+# the kinds of records; the others mirror the changes of the entries of the
+# UndoUtility
+ENTRY = 1       # an entry was appended
+TRUNCATE = 2    # the entries were cut to <length> (after undo)
+DROP = 3        # the first <count> entries were dropped
+FIRST = 4       # the first entry was replaced by a keyframe
+RESET = 5       # the history was reset
+SCENE = 6       # the current scene (or the changes to the last one)
+COUNT = struct.Struct('<I')
+
+# the writer thread syncs the file at most once in this time (seconds)
+JOURNAL_FSYNC_INTERVAL = 1.0
+# when the file is bigger than this, it is rewritten with only the entries
+# of the history & the current scene
+JOURNAL_COMPACT_BYTES = 4 * undo_utility.UNDO_BYTES
+# the scene is written as a whole every ... scene records
+JOURNAL_SCENE_KEYFRAME_INTERVAL = undo_utility.UNDO_KEYFRAME_INTERVAL
+
+
+def record(kind, data=b''):
+    return RECORD_HEADER.pack(kind, len(data), zlib.crc32(data)) + data
+
+
+def entry_data(entry):
+    action = entry.action.encode()
+    flags = (1 if entry.keyframe else 0) | (2 if entry.compressed else 0)
+    return ENTRY_HEADER.pack(flags, len(action)) + action + entry.data
+
+
+def read_entry(data):
+    flags, length = ENTRY_HEADER.unpack_from(data)
+    start = ENTRY_HEADER.size
+    return undo_utility.UndoEntry(data[start:start + length].decode(),
+                                  bool(flags & 1),
+                                  bytes(data[start + length:]),
+                                  bool(flags & 2))
+
+
+class JournalSession:
+    """ What a journal has of the last session: the entries of the undo
+        history & the scene (SceneState, with "selection").
+    """
+
+    def __init__(self, entries, scene):
+        self.entries = entries
+        self.scene = scene
+
+
+class JournalWriter(threading.Thread):
+    """ Appends what it gets to the file & syncs it to the disk at most once
+        per fsync_interval, so the GUI thread never waits for the disk.
+
+        The queue has the data to append, ('replace', data) to replace the
+        whole file (compaction) or None to stop.
+    """
+
+    def __init__(self, path, fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        super(JournalWriter, self).__init__(daemon=True)
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue()
+        self.file = None
+
+        self.writes = 0
+        self.syncs = 0
+
+    def run(self):
+        self.file = open(self.path, 'ab')
+        unsynced = False
+        last_sync = time.monotonic()
+
+        while True:
+            timeout = None
+            if unsynced:
+                timeout = max(0.0, last_sync + self.fsync_interval -
+                              time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = b''
+
+            # everything that is queued is written at once
+            items = [item]
+            while item is not None:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+
+            for item in items:
+                if item is None:
+                    self.sync()
+                    self.file.close()
+                    return
+                elif isinstance(item, tuple):
+                    self.replace(item[1])
+                    last_sync = time.monotonic()
+                    unsynced = False
+                elif item:
+                    self.file.write(item)
+                    self.writes += 1
+                    unsynced = True
+
+            if unsynced and \
+               time.monotonic() - last_sync >= self.fsync_interval:
+                self.sync()
+                last_sync = time.monotonic()
+                unsynced = False
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.syncs += 1
+
+    def replace(self, data):
+        """ Writes the data to a new file that replaces the journal (so a
+            crash leaves the old or the new one).
+        """
+        self.file.close()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, 'ab')
+        self.syncs += 1
+
+
+class UndoJournal:
+    """ An append-only file with the changes of the undo history (see
+        UndoUtility.journal) & of the scene, so both can be restored after
+        a crash or a restart.
+
+        The GUI thread only encodes the records (the entries of the history
+        are stored as they are); a JournalWriter writes them. When the file
+        gets bigger than compact_bytes, it is rewritten with only what is
+        still needed.
+    """
+
+    def __init__(self, path, compact_bytes=JOURNAL_COMPACT_BYTES,
+                 fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self.fsync_interval = fsync_interval
+
+        self.writer = None
+        # the UndoUtility the journal belongs to (see start)
+        self.history = None
+        # bytes in the file (with the ones that are still queued) & the size
+        # at which it is compacted (at least twice what is still needed)
+        self.size = 0
+        self.compact_at = compact_bytes
+
+        # the last scene that was written & the number of scene records
+        # since the last time it was written as a whole
+        self.scene = None
+        self.scene_records = 0
+
+        self.compactions = 0
+
+    @property
+    def active(self):
+        return self.writer is not None
+
+    def read(self):
+        """ Returns the JournalSession in the file, or None if there is
+            none. The file is memory-mapped; of the scene records, only the
+            ones since the last whole scene are decoded. An incomplete or
+            damaged end (e.g. after a crash) is ignored.
+        """
+        if not os.path.isfile(self.path) or \
+           os.path.getsize(self.path) <= len(JOURNAL_MAGIC):
+            return None
+
+        with open(self.path, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+                print('undo journal: unknown format:', self.path)
+                return None
+
+            # the records (kind, start & end of the data)
+            records = []
+            offset = len(JOURNAL_MAGIC)
+            while offset + RECORD_HEADER.size <= len(data):
+                kind, length, crc = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                end = start + length
+                if end > len(data) or \
+                   zlib.crc32(data[start:end]) != crc:
+                    print('undo journal: ignoring a damaged end')
+                    break
+                records.append((kind, start, end))
+                offset = end
+
+            entries = []
+            scene_records = []
+            for kind, start, end in records:
+                if kind == ENTRY:
+                    entries.append(read_entry(data[start:end]))
+                elif kind == TRUNCATE:
+                    del entries[COUNT.unpack_from(data, start)[0]:]
+                elif kind == DROP:
+                    del entries[:COUNT.unpack_from(data, start)[0]]
+                elif kind == FIRST:
+                    entries[0] = read_entry(data[start:end])
+                elif kind == RESET:
+                    entries = []
+                elif kind == SCENE:
+                    if data[start] & 1:
+                        scene_records = []
+                    scene_records.append((start, end))
+
+            scene_records = [read_entry(data[start:end])
+                             for start, end in scene_records]
+
+        if not scene_records or not scene_records[0].keyframe:
+            return None
+
+        scene = scene_state.freeze_state(scene_records[0].value())
+        for scene_record in scene_records[1:]:
+            scene = undo_utility.apply_delta(
+                scene, scene_state.freeze(scene_record.value()))
+
+        return JournalSession(entries, scene)
+
+    def start(self, history, scene=None):
+        """ Starts a new journal for the history (UndoUtility) & the scene
+            (None: not known yet); the file is replaced.
+        """
+        self.history = history
+        self.writer = JournalWriter(self.path, self.fsync_interval)
+        self.writer.start()
+        self.scene = scene
+        self.compact()
+
+    def compact(self):
+        """ Replaces the file with the entries of the history & the
+            scene.
+        """
+        data = [JOURNAL_MAGIC]
+        for entry in self.history.entries:
+            data.append(record(ENTRY, entry_data(entry)))
+        if self.scene is not None:
+            data.append(self.scene_record(True, self.scene))
+        self.scene_records = 0
+
+        data = b''.join(data)
+        self.size = len(data)
+        self.compact_at = max(self.compact_bytes, 2 * self.size)
+        self.writer.queue.put(('replace', data))
+        self.compactions += 1
+
+    def write(self, data):
+        self.writer.queue.put(data)
+        self.size += len(data)
+        if self.size > self.compact_at:
+            self.compact()
+
+    def scene_record(self, keyframe, value):
+        return record(SCENE, entry_data(undo_utility.UndoEntry.encode(
+            '', keyframe, value, True)))
+
+    def scene_changed(self, scene):
+        """ scene: the current scene (SceneState) """
+        if self.scene is None or \
+           self.scene_records + 1 >= JOURNAL_SCENE_KEYFRAME_INTERVAL:
+            data = self.scene_record(True, scene)
+            self.scene_records = 0
+        else:
+            delta = undo_utility.state_delta(self.scene, scene)
+            if not delta:
+                return
+            data = self.scene_record(False, delta)
+            self.scene_records += 1
+
+        self.scene = scene
+        self.write(data)
+
+    # see UndoUtility.journal
+
+    def entry_added(self, entry):
+        self.write(record(ENTRY, entry_data(entry)))
+
+    def entries_truncated(self, length):
+        self.write(record(TRUNCATE, COUNT.pack(length)))
+
+    def entries_dropped(self, count):
+        self.write(record(DROP, COUNT.pack(count)))
+
+    def first_replaced(self, entry):
+        self.write(record(FIRST, entry_data(entry)))
+
+    def history_reset(self):
+        self.write(record(RESET))
+
+    def close(self):
+        """ Writes what is queued, syncs the file & stops the writer. """
+        if self.writer is None:
+            return
+
+        self.writer.queue.put(None)
+        self.writer.join()
+        self.writer = None
+
+    def stats(self):
+        """ Size of the journal (for debugging). """
+        return {"bytes": self.size, "compactions": self.compactions,
+                "writes": self.writer.writes if self.writer else 0,
+                "syncs": self.writer.syncs if self.writer else 0}
@@ -1,16 +1,168 @@
-from python.modules import utility_module as um
+import json
+import time
+import zlib
+from collections import OrderedDict
 
-# number of states that can be undone
-UNDO_LENGTH = 15
+from python.modules import scene_state
+
+# bytes the states that can be undone may take up (the oldest are dropped)
+UNDO_BYTES = 4 * 1024 * 1024
+# most states are stored as the changes to the state before them; every
+# UNDO_KEYFRAME_INTERVAL steps, the whole state is stored (undo has to go
+# through at most that many changes to get a state)
+UNDO_KEYFRAME_INTERVAL = 16
+# compress the stored states / changes (zlib)
+UNDO_COMPRESS = True
+# the states of this many keyframes (& the changes after them) are kept
+# decoded
+DECODED_GROUPS = 2
+# an action of the same kind on the same mesh as the last one, less than
+# this many seconds after it, is merged into the last entry (see coalesce;
+# 0: never)
+UNDO_COALESCE_WINDOW = 1.0
+
+
+def state_delta(old_state, new_state):
+    """ The changes from one state of the scene (dict, see saveScene in
+        setup_scene.js) to the next:
+        "meshes": the meshes that were added or changed
+        "removed": ids of the meshes that were removed
+        "order": the ids of all meshes (only if the meshes were reordered)
+        "set": the other properties that changed (room, textures, selection)
+        "unset": the other properties that were removed
+    """
+    old_meshes = {mesh["id"]: mesh for mesh in old_state["meshes"]}
+    ids = []
+    changed = []
+    added = []
+    for mesh in new_state["meshes"]:
+        ids.append(mesh["id"])
+        old_mesh = old_meshes.get(mesh["id"])
+        if old_mesh is None:
+            added.append(mesh["id"])
+        if old_mesh != mesh:
+            changed.append(mesh)
+
+    new_ids = set(ids)
+    kept = [mesh["id"] for mesh in old_state["meshes"]
+            if mesh["id"] in new_ids]
+
+    delta = {}
+    if changed:
+        delta["meshes"] = changed
+    if len(kept) != len(old_meshes):
+        delta["removed"] = [mesh_id for mesh_id in old_meshes
+                            if mesh_id not in new_ids]
+    # apply_delta keeps the meshes in place & appends the new ones
+    if kept + added != ids:
+        delta["order"] = ids
+
+    changed_properties = {key: value for key, value in new_state.items()
+                          if key != "meshes" and
+                          (key not in old_state or old_state[key] != value)}
+    if changed_properties:
+        delta["set"] = changed_properties
+    removed_properties = [key for key in old_state if key not in new_state]
+    if removed_properties:
+        delta["unset"] = removed_properties
+
+    return delta
+
+
+def apply_delta(state, delta):
+    """ The state (SceneState) after the changes (see state_delta); it
+        shares the meshes that did not change with state.
+    """
+    meshes = {mesh["id"]: mesh for mesh in state["meshes"]}
+    for mesh_id in delta.get("removed", ()):
+        del meshes[mesh_id]
+    for mesh in delta.get("meshes", ()):
+        meshes[mesh["id"]] = mesh
+
+    new_state = {}
+    unset = delta.get("unset", ())
+    for key, value in state.items():
+        if key not in unset:
+            new_state[key] = value
+    new_state.update(delta.get("set", {}))
+
+    if "order" in delta:
+        new_state["meshes"] = tuple(meshes[mesh_id]
+                                    for mesh_id in delta["order"])
+    else:
+        new_state["meshes"] = tuple(meshes.values())
+
+    return scene_state.SceneState(new_state)
+
+
+class UndoEntry:
+    """ A stored state: the whole state (keyframe) or the changes to the
+        state of the entry before it, as (compressed) JSON.
+    """
+    __slots__ = ('action', 'keyframe', 'data', 'compressed')
+
+    def __init__(self, action, keyframe, data, compressed):
+        self.action = action
+        self.keyframe = keyframe
+        self.data = data
+        self.compressed = compressed
+
+    @classmethod
+    def encode(cls, action, keyframe, value, compress):
+        data = json.dumps(value, separators=(',', ':')).encode()
+        if compress:
+            compressed = zlib.compress(data, 1)
+            if len(compressed) < len(data):
+                return cls(action, keyframe, compressed, True)
+        return cls(action, keyframe, data, False)
+
+    def text(self):
+        data = zlib.decompress(self.data) if self.compressed else self.data
+        return data.decode()
+
+    def value(self):
+        return json.loads(self.text())
+
+    def __len__(self):
+        return len(self.data)
 
 
 class UndoUtility:
-    def __init__(self, max_steps=UNDO_LENGTH):
-        self.action_history_ring = um.RingArray(max_steps)
+    def __init__(self, max_bytes=UNDO_BYTES,
+                 keyframe_interval=UNDO_KEYFRAME_INTERVAL,
+                 compress=UNDO_COMPRESS, max_steps=None,
+                 coalesce_window=UNDO_COALESCE_WINDOW):
+        """ max_bytes: size of the stored states before the oldest are
+                       dropped (the last one is always kept)
+            keyframe_interval: store the whole state every ... steps
+                               (1: always)
+            max_steps: number of states that can be undone (None: only
+                       limited by max_bytes)
+            coalesce_window: seconds in which actions of the same kind on
+                             the same mesh are merged (0: never)
+        """
+        self.max_bytes = max_bytes
+        self.keyframe_interval = keyframe_interval
+        self.compress = compress
         self.max_steps = max_steps
+        self.coalesce_window = coalesce_window
 
-        # index of the currently active state in the RingArray of system
-        # states. Usually the Array's length -1 (= the last state);
+        # the saved states (UndoEntry), oldest first; the first one is
+        # always a keyframe
+        self.entries = []
+        self.total_bytes = 0
+        # the state of the last entry (to find the changes to the next one)
+        # & the number of entries since the last keyframe
+        self.last_state = None
+        self.since_keyframe = 0
+        # index of a keyframe -> [its state, the states after it, ...] for
+        # the last DECODED_GROUPS keyframes that were used (the states that
+        # were added or restored last; undo & redo usually need the states
+        # next to them)
+        self.decoded = OrderedDict()
+
+        # index of the currently active state in the list of system
+        # states. Usually the list's length -1 (= the last state);
         # gets decreased by Undo and increased by Redo.
         self.current_index = 0
 
@@ -21,43 +173,258 @@ class UndoUtility:
         # i.e. the last operation was either Undo or Redo.
         self.currently_undoing = False
 
+        # the action of the last entry: (action, target, time) if it can be
+        # continued (see coalesce), the action that was started & whose
+        # state is not added yet, the number of merged actions
+        self.last_action = None
+        self.started_action = None
+        self.merged_actions = 0
+
+        # gets all changes of the entries (see undo_journal.UndoJournal)
+        self.journal = None
+
     def reset(self):
-        self.action_history_ring = um.RingArray(self.max_steps)
+        self.entries = []
+        self.total_bytes = 0
+        self.last_state = None
+        self.since_keyframe = 0
+        self.decoded = OrderedDict()
         self.current_index = 0
 
         self.first_state_at_undo = None
         self.currently_undoing = False
 
-    def add_action(self, action, state):
+        self.last_action = None
+        self.started_action = None
+
+        if self.journal is not None:
+            self.journal.history_reset()
+
+    def load_entries(self, entries):
+        """ Replaces the history with the entries (e.g. the ones of the
+            last session, see undo_journal); the first one has to be a
+            keyframe.
+        """
+        self.reset()
+        self.entries = list(entries)
+        self.total_bytes = sum(len(entry) for entry in self.entries)
+        if self.entries:
+            self.last_state = self.state_at(len(self.entries) - 1)
+            self.drop_oldest()
+            self.current_index = len(self.entries) - 1
+
+    def coalesce(self, action, target):
+        """ Has to be called when an action starts, before its state is
+            saved. Returns True if it continues the action of the last
+            entry (the same action on the same target, e.g. the id of the
+            mesh, less than coalesce_window seconds after it & not after
+            undo): then the last entry (the state before the first of them)
+            is kept for both & there is no state to add.
+
+            Actions without a target are never merged.
+        """
+        now = time.monotonic()
+        last_action = self.last_action
+        if target is not None and last_action is not None and \
+           last_action[:2] == (action, target) and \
+           now - last_action[2] < self.coalesce_window and \
+           not self.currently_undoing and \
+           self.current_index == len(self.entries) - 1:
+            # (from the last one, so a continuous manipulation stays one
+            # entry)
+            self.last_action = (action, target, now)
+            self.merged_actions += 1
+            return True
+
+        self.started_action = (action, target, now)
+        return False
+
+    def add_action(self, action, state, target=None):
         """ params: action = string description of the action
-                    state = program state
+                    state = program state (SceneState; a dict or JSON
+                            string is frozen, see scene_state)
+                    target = what the action changes (e.g. the id of the
+                             mesh), to merge it with the last one (see
+                             coalesce); None: coalesce was called already
+                             (or the action is never merged)
         """
+        if target is not None and self.coalesce(action, target):
+            return
+
         # overwrite undo
         self.currently_undoing = False
         self.first_state_at_undo = None
 
-        if self.current_index != len(self.action_history_ring) - 1 and\
-           len(self.action_history_ring) != 0:
+        if self.current_index != len(self.entries) - 1 and\
+           len(self.entries) != 0:
             # was currently undoing & now appended another action -->
             # the states that followed must be overwritten.
-            old_action_ring = self.action_history_ring
-            self.action_history_ring = um.RingArray(self.max_steps)
-            for i in range(0, self.current_index):
-                self.action_history_ring.append(old_action_ring[i])
+            self.truncate(max(self.current_index, 0))
 
-        self.action_history_ring.append({"action": action, "state": state})
-        self.current_index = len(self.action_history_ring) - 1
+        state = scene_state.freeze_state(state)
+        if self.last_state is None or \
+           self.since_keyframe + 1 >= self.keyframe_interval:
+            entry = UndoEntry.encode(action, True, state, self.compress)
+        else:
+            delta = state_delta(self.last_state, state)
+            changed = len(delta.get("meshes", ())) + \
+                len(delta.get("removed", ()))
+            if changed >= len(state["meshes"]) and changed > 0:
+                # (about) everything changed, e.g. another room was loaded
+                entry = UndoEntry.encode(action, True, state, self.compress)
+            else:
+                entry = UndoEntry.encode(action, False, delta, self.compress)
+
+        self.entries.append(entry)
+        self.total_bytes += len(entry)
+        self.last_state = state
+        if self.journal is not None:
+            self.journal.entry_added(entry)
+        self.since_keyframe = 0 if entry.keyframe else self.since_keyframe + 1
+
+        # the state does not have to be decoded for undo
+        start = len(self.entries) - 1 - self.since_keyframe
+        if entry.keyframe:
+            self.decoded_states(start).append(state)
+        else:
+            states = self.decoded.get(start)
+            if states is not None and len(states) == self.since_keyframe:
+                states.append(state)
+
+        self.drop_oldest()
+        self.current_index = len(self.entries) - 1
+
+        started_action = self.started_action
+        self.started_action = None
+        if started_action is not None and started_action[0] == action:
+            self.last_action = started_action
+        else:
+            self.last_action = None
+
+    def truncate(self, length):
+        """ Keeps the first "length" entries. """
+        del self.entries[length:]
+        self.total_bytes = sum(len(entry) for entry in self.entries)
+        if self.journal is not None:
+            self.journal.entries_truncated(length)
+        for start, states in list(self.decoded.items()):
+            if start >= length:
+                del self.decoded[start]
+            else:
+                del states[length - start:]
+
+        if self.entries:
+            self.last_state = self.state_at(length - 1)
+            keyframe = length - 1
+            while not self.entries[keyframe].keyframe:
+                keyframe -= 1
+            self.since_keyframe = length - 1 - keyframe
+        else:
+            self.last_state = None
+            self.since_keyframe = 0
+
+    def drop_oldest(self):
+        """ Drops the oldest entries while there are too many steps /
+            bytes.
+        """
+        while len(self.entries) > 1:
+            if self.max_steps is not None and \
+               len(self.entries) > self.max_steps:
+                self.drop_first(1)
+            elif self.total_bytes > self.max_bytes:
+                # the oldest keyframe & the changes to it (if there is
+                # another keyframe; else the next state has to become one)
+                count = 1
+                for i in range(1, len(self.entries)):
+                    if self.entries[i].keyframe:
+                        count = i
+                        break
+                self.drop_first(count)
+            else:
+                break
+
+        keyframe = len(self.entries) - 1
+        while not self.entries[keyframe].keyframe:
+            keyframe -= 1
+        self.since_keyframe = len(self.entries) - 1 - keyframe
+
+    def drop_first(self, count):
+        oldest = self.entries[0]
+        del self.entries[:count]
+        self.total_bytes = sum(len(entry) for entry in self.entries)
+        if self.journal is not None:
+            self.journal.entries_dropped(count)
+
+        decoded = self.decoded
+        self.decoded = OrderedDict((start - count, states) for start, states
+                                   in decoded.items() if start >= count)
+
+        following = self.entries[0]
+        if not following.keyframe:
+            # the next one becomes the keyframe
+            states = decoded.get(0, ())
+            if len(states) > count:
+                state = states[count]
+                self.decoded[0] = states[count:]
+            else:
+                state = apply_delta(oldest.value(), following.value())
+            keyframe = UndoEntry.encode(following.action, True, state,
+                                        self.compress)
+            self.entries[0] = keyframe
+            self.total_bytes += len(keyframe) - len(following)
+            if self.journal is not None:
+                self.journal.first_replaced(keyframe)
+
+    def state_at(self, index):
+        """ The state (SceneState) of the entry: the last keyframe before it
+            with the changes up to it.
+        """
+        start = index
+        while not self.entries[start].keyframe:
+            start -= 1
+
+        states = self.decoded_states(start)
+        if not states:
+            states.append(scene_state.freeze_state(
+                self.entries[start].text()))
+
+        # (the states share the meshes that did not change)
+        for i in range(start + len(states), index + 1):
+            states.append(apply_delta(
+                states[-1], scene_state.loads(self.entries[i].text())))
+
+        return states[index - start]
+
+    def decoded_states(self, start):
+        """ The decoded states of the keyframe at start & after it (a list
+            that can be extended).
+        """
+        states = self.decoded.get(start)
+        if states is None:
+            states = self.decoded[start] = []
+            if len(self.decoded) > DECODED_GROUPS:
+                self.decoded.popitem(last=False)
+        else:
+            self.decoded.move_to_end(start)
+
+        return states
+
+    def history_item(self, index):
+        if index < 0:
+            index += len(self.entries)
+        return {"action": self.entries[index].action,
+                "state": self.state_at(index)}
 
     def undo(self):
         """ Returns the state before the last change, or None. """
-        if self.current_index not in range(0, len(self.action_history_ring)):
+        if self.current_index not in range(0, len(self.entries)):
             return None
 
         self.currently_undoing = True
         index = self.current_index
         self.current_index -= 1
 
-        return self.action_history_ring[index]
+        return self.history_item(index)
 
     def set_first_state_at_undo(self, state):
         """ In order to be able to Redo, the state of the app before the
@@ -66,20 +433,20 @@ class UndoUtility:
             overwriting the state.
         """
         if not self.currently_undoing:
-            self.first_state_at_undo = state
+            self.first_state_at_undo = scene_state.freeze_state(state)
 
     def redo(self):
         """ Returns the state before the last "undo", or None. """
         if not self.currently_undoing:
             return None
 
-        if self.current_index == len(self.action_history_ring) - 2:
+        if self.current_index == len(self.entries) - 2:
             state = self.first_state_at_undo
             self.current_index += 1
             return {"state": state, "action": "not identified"}
-        elif self.current_index < len(self.action_history_ring) - 2:
+        elif self.current_index < len(self.entries) - 2:
             self.current_index += 1
-            return self.action_history_ring[self.current_index + 1]
+            return self.history_item(self.current_index + 1)
         else:
             return None
 
@@ -92,13 +459,21 @@ class UndoUtility:
             made to reach the other state and is hence not required in a
             "full reload".
         """
-        if len(self.action_history_ring) == 0:
+        if len(self.entries) == 0:
             return None
         if after_undo:
-            if self.current_index == len(self.action_history_ring) - 2:
+            if self.current_index == len(self.entries) - 2:
                 return {"state": self.first_state_at_undo,
                         "action": "not identified"}
             else:
-                return self.action_history_ring[self.current_index + 2]
+                return self.history_item(self.current_index + 2)
         else:
-            return self.action_history_ring[self.current_index]
+            return self.history_item(self.current_index)
+
+    def stats(self):
+        """ Size of the history (for debugging). """
+        return {"steps": len(self.entries),
+                "keyframes": sum(1 for entry in self.entries
+                                 if entry.keyframe),
+                "bytes": self.total_bytes,
+                "merged actions": self.merged_actions}
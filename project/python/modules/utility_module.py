@@ -6,6 +6,7 @@ from collections import deque
 import pylab as pl
 import json
 import os
+import io
 import base64
 
 
@@ -261,53 +262,121 @@ def get_projection_transformed_point(src_x_values, src_y_values, dest_width,
     return x, y
 
 
-def get_name_for_new_mesh(name, type_, used_names):
-    if name is None:
-        name = type_
-    # "original" = unadulterated name
-    original_name = name
-    index = 1
-    while name in used_names:
-        name = original_name + str(index)
-        index += 1
-    return name
-
-
-def get_name_for_copy(orig_mesh_id, used_names):
-    name = original_name = orig_mesh_id + "_copy"
-    index = 1
-    while name in used_names:
-        name = original_name + str(index)
-        index += 1
-    return name
+# characters that cannot appear unescaped in a single-quoted JS string
+# (UTF-8) & their escapes; the line separators both start with b'\xe2'
+JS_STRING_ESCAPES = ((b'\\', b'\\\\'), (b"'", b"\\'"), (b'\n', b'\\n'),
+                     (b'\r', b'\\r'))
+JS_LINE_SEPARATOR_ESCAPES = (('\u2028'.encode(), b'\\u2028'),
+                             ('\u2029'.encode(), b'\\u2029'))
+# files are read & escaped in chunks of this many bytes (small enough to
+# stay in the CPU cache while they are escaped)
+JS_STRING_CHUNK_SIZE = 64 * 1024
 
 
 def read_file_as_js_string(file, regular_contents_as_well=False):
-    for_js = '('
-    regular_contents = ''
-    for line in file:
-        for_js += "'" + line[:-1] + "' + \n"
-        if regular_contents_as_well:
-            regular_contents += line
-    for_js += "'')"
+    """ Returns the contents of the file as a JS string literal (UTF-8
+        bytes, with quotes, backslashes and line breaks escaped), so it can
+        be put into the code for evaluateJavaScript.
+
+        file can be a file object (binary or text mode) or a buffer (bytes,
+        str). It is read once, in chunks of JS_STRING_CHUNK_SIZE; each chunk
+        is escaped (see escape_js_bytes) & written to a BytesIO, whose buffer
+        becomes the result (getvalue does not copy it). So there are no
+        per-line strings & no other copies of the whole file.
+
+        If regular_contents_as_well is True, the unescaped contents are
+        returned as the second value (the buffer that was passed, or the
+        bytes that were read).
+    """
+    buffer = io.BytesIO()
+    buffer.write(b"'")
+    # (only needed if the file is read here)
+    contents = [] if regular_contents_as_well and \
+        not isinstance(file, (str, bytes)) else None
+    rest = b''
+    for chunk in read_chunks(file):
+        if contents is not None:
+            contents.append(chunk)
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if rest:
+            chunk = rest + chunk
+        # (a line separator can be split between two chunks)
+        rest = b''
+        if chunk.endswith(b'\xe2'):
+            chunk, rest = chunk[:-1], chunk[-1:]
+        elif chunk.endswith(b'\xe2\x80'):
+            chunk, rest = chunk[:-2], chunk[-2:]
+        buffer.write(escape_js_bytes(chunk))
+    buffer.write(rest + b"'")
+    for_js = buffer.getvalue()
 
     if regular_contents_as_well:
-        return for_js, regular_contents
+        if contents is not None:
+            file = (''.join if contents and isinstance(contents[0], str)
+                    else b''.join)(contents)
+        return for_js, file
     else:
         return for_js
 
 
-def load_images_as_base64(mesh_json):
-    """ Loads images (only for material diffuse textures) from jpeg
-        files as base 64 strings.
-        Returns a dict where the original file name (the one in the JSON)
-        is the key and the base64 data is the value. Thus, the corresponding
-        mesh data can easily be found in JS.
+def read_chunks(file):
+    """ Yields the contents of the file object or buffer in chunks of
+        JS_STRING_CHUNK_SIZE.
+    """
+    if isinstance(file, (str, bytes)):
+        for start in range(0, len(file), JS_STRING_CHUNK_SIZE):
+            yield file[start:start + JS_STRING_CHUNK_SIZE]
+        return
+
+    while True:
+        chunk = file.read(JS_STRING_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def escape_js_bytes(data):
+    """ Escapes UTF-8 text (a chunk of a file) for a single-quoted JS string
+        literal. Looking for a byte (memchr) is much faster than a regular
+        expression, and the chunk is only copied for the characters that
+        occur in it (in model files, usually only a few line breaks).
+    """
+    for char, escaped in JS_STRING_ESCAPES:
+        if char in data:
+            data = data.replace(char, escaped)
+    if b'\xe2' in data:
+        for char, escaped in JS_LINE_SEPARATOR_ESCAPES:
+            data = data.replace(char, escaped)
+    return data
+
+
+def prepare_mesh_payload(mesh_file_name, texture_files=None):
+    """ Reads a .babylon file and returns everything the JS component needs
+        to add the mesh: the mesh data as a JS string literal (bytes) and the
+        dict of its texture files (see find_texture_files).
+
+        texture_files: if given (e.g. from asset_index.AssetIndex), the JSON
+                       does not have to be parsed to find the textures
+    """
+    with open(mesh_file_name, 'rb') as mesh_file:
+        if texture_files is not None:
+            return read_file_as_js_string(mesh_file), texture_files
+
+        data, json_data = read_file_as_js_string(mesh_file, True)
+
+    return data, find_texture_files(json_data)
+
+
+def find_texture_files(mesh_json):
+    """ Finds the image files (only for material diffuse textures) of a
+        mesh. Returns a dict where the original file name (the one in the
+        JSON) is the key and the path of the file is the value.
 
         Will just do nothing if there is an error. The Param is a JSON string,
         no JSON object.
     """
-    images = {}
+    files = {}
     mesh_json = json.loads(mesh_json)
     if "materials" in mesh_json:
         for material in mesh_json["materials"]:
@@ -316,10 +385,22 @@ def load_images_as_base64(mesh_json):
                     file_name = "assets/models/" + \
                                 material["diffuseTexture"]["name"]
                     if os.path.isfile(file_name):
-                        jpeg_file = load_single_img_as_base64(file_name)
-                        images[material["diffuseTexture"]["name"]] = \
-                            jpeg_file
-    return images
+                        files[material["diffuseTexture"]["name"]] = file_name
+    return files
+
+
+def load_images_as_base64(mesh_json):
+    """ Loads images (only for material diffuse textures) from jpeg
+        files as base 64 strings.
+        Returns a dict where the original file name (the one in the JSON)
+        is the key and the base64 data is the value. Thus, the corresponding
+        mesh data can easily be found in JS.
+
+        Will just do nothing if there is an error. The Param is a JSON string,
+        no JSON object.
+    """
+    return {name: load_single_img_as_base64(file_name)
+            for name, file_name in find_texture_files(mesh_json).items()}
 
 
 def load_single_img_as_base64(file_name):
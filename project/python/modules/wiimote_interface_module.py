@@ -2,7 +2,12 @@
 
 from PyQt5 import QtCore
 import time
-from python.lib import wiimote as wm
+try:
+    from python.lib import wiimote as wm
+except ImportError:
+    # PyBluez is missing: no Wiimote can be connected, the system can still
+    # be used with the mouse (or with a headless_scene.HeadlessScene)
+    wm = None
 from python.modules import utility_module as um
 import pylab as pl
 
@@ -80,6 +85,10 @@ class Wiimote(QtCore.QObject):
                                             'Plus', 'One', 'Two'], False)
 
     def connect(self, address):
+        if wm is None:
+            print('Connection Failed: PyBluez (bluetooth) is not installed')
+            return
+
         try:
             self.wm = wm.connect(address)
         except Exception:
@@ -5,20 +5,40 @@ from PyQt5 import uic, QtGui, QtCore, Qt, QtWidgets
 from PyQt5.QtCore import QUrl, Qt
 from PyQt5.QtWidgets import (QApplication, QMainWindow)
 from PyQt5.QtNetwork import QNetworkProxyFactory
-from PyQt5.QtWebKitWidgets import QWebView
+try:
+    from PyQt5.QtWebKitWidgets import QWebView
+except ImportError:
+    # the Window can only be used with a backend (e.g. headless_scene)
+    QWebView = None
 
 import numpy as np
 import json
+from collections import OrderedDict
 
 from python.modules import undo_utility as undo
 from python.modules import js_interface_module as js
 from python.modules import wiimote_interface_module as wii
 from python.modules import blend_model_picker as model_table
 from python.modules import utility_module as um
+from python.modules import asset_cache
+from python.modules import asset_scheme
+from python.modules import asset_loader
+from python.modules import asset_compiler
+from python.modules import asset_index
+from python.modules import bridge_profiler
+from python.modules import scene_mirror
+from python.modules import scene_registry
+from python.modules import scene_diff
+from python.modules import scene_state
+from python.modules import undo_journal
 
 
 class Window(QMainWindow):
-    def __init__(self, url, app):
+    def __init__(self, url, app, backend=None):
+        """ backend: replaces the web view & the JS component (see
+                     SetupScene.init_backend), e.g. a
+                     headless_scene.HeadlessScene; url is not loaded then
+        """
         super(Window, self).__init__()
         self.progress = 0
         self.app = app
@@ -48,6 +68,46 @@ class Window(QMainWindow):
         self.TEXTURE_SELECT_TABLE_X_LEFT = 50
         self.SELECT_TABLES_Y = 665
 
+        self.MODEL_CACHE_BYTES = asset_cache.MODEL_CACHE_BUDGET
+        # level of detail of compiled models (0 = full detail, 1, 2 = the
+        # coarser levels made by compile_assets.py)
+        self.LOD_QUALITY = 0
+        # if the meshes in the scene would have more vertices than this,
+        # coarser levels of detail are used for new meshes
+        self.SCENE_VERTEX_BUDGET = 1500000
+        # prepare the models of a category of the selection bar while it is
+        # open, at most PREFETCH_MAX_MODELS models / PREFETCH_MAX_BYTES of
+        # model files per category; the hovered model is always prepared
+        # (before the others)
+        self.PREFETCH_MODELS = False
+        self.PREFETCH_MAX_MODELS = 6
+        self.PREFETCH_MAX_BYTES = 8 * 1024 * 1024
+        # load models & textures via asset:/// URLs instead of putting their
+        # data into the JS code
+        self.SERVE_ASSETS_BY_URL = True
+        # record counts, payload sizes & latencies of the calls between
+        # Python & JS (see bridge_profiler); F12 prints them, they are
+        # written to BRIDGE_PROFILE_FILE when the system is closed
+        self.PROFILE_BRIDGE = False
+        self.BRIDGE_PROFILE_FILE = 'bridge_profile.json'
+        # keep the numbers of loading a scene in self.load_metrics (see
+        # asset_loader.LoadMetrics; benchmarks/bench_room_loading.py prints
+        # them for the bundled rooms)
+        self.MEASURE_LOADING = False
+        # take the states for undo from the scene mirror (False: ask the JS
+        # component for the whole scene each time)
+        self.MIRROR_SCENE = True
+        # keep the undo history & the scene in UNDO_JOURNAL_FILE (see
+        # undo_journal), so they survive a crash or a restart; the next
+        # start offers to restore them. The scene is written at most once
+        # per JOURNAL_SCENE_INTERVAL ms
+        self.JOURNAL_UNDO = False
+        self.UNDO_JOURNAL_FILE = 'undo_journal.bin'
+        self.JOURNAL_SCENE_INTERVAL = 500
+        # dragging, transforming or duplicating the same mesh again within
+        # this many seconds is one step of undo (0: every time)
+        self.UNDO_COALESCE_WINDOW = undo.UNDO_COALESCE_WINDOW
+
         screen_dimens = self.app.desktop().screenGeometry()
         self.url = url
         self.monitor_width = screen_dimens.width()
@@ -56,22 +116,56 @@ class Window(QMainWindow):
         QNetworkProxyFactory.setUseSystemConfiguration(True)
 
         self.win = uic.loadUi(self.UI_FILE_PATH)
-        self.wv = QWebView(self.win)
+        if backend is None:
+            self.wv = QWebView(self.win)
+
+            if self.SERVE_ASSETS_BY_URL:
+                asset_scheme.install(self.wv, os.path.dirname(
+                    os.path.realpath(__file__)))
+        else:
+            # takes the place (& the key events) of the web view
+            self.wv = QtWidgets.QWidget(self.win)
+
+        bridge_profiler.PROFILER.enabled = self.PROFILE_BRIDGE
+        if self.PROFILE_BRIDGE:
+            self.app.aboutToQuit.connect(
+                lambda: bridge_profiler.PROFILER.dump(
+                    self.BRIDGE_PROFILE_FILE))
 
-        js.SetupScene.init(self.wv)
+        if backend is None:
+            js.SetupScene.init(self.wv)
+        else:
+            js.SetupScene.init_backend(backend)
         js.SetupScene.apply_callback(self.CALLBACK, self)
 
-        self.wv.load(self.url)
+        if backend is None:
+            self.wv.load(self.url)
 
-        self.list_widget = self.win.list_widget
+        # the meshes in the scene (& the ones that are loading) by id; the
+        # list view shows the loaded ones
+        self.scene = scene_registry.SceneRegistry()
+        self.mesh_list = scene_registry.SceneListModel(self.scene, self)
+        self.list_view = self.win.list_view
+        self.list_view.setModel(self.mesh_list)
         self.mesh_select_table = None
         self.model_table = None
         self.texture_select_table = None
 
         self.setup_ui()
 
-        self.meshes = []
+        # the scene as the JS component has it (see on_scene_changed)
+        self.scene_mirror = scene_mirror.SceneMirror()
+        # model files that were prefetched for the open category (& the
+        # number & size of the ones that count towards its budget)
+        self.prefetched_models = set()
+        self.prefetched_count = 0
+        self.prefetched_bytes = 0
+        # LoadMetrics of the last load_state (if MEASURE_LOADING is True)
+        self.load_metrics = None
         self.selected_mesh = None
+        # meshes that have an outline in the JS component, so a selection
+        # change only has to remove the outlines that are there
+        self.highlighted_meshes = set()
         self.mesh_translation = []
         self.mesh_rotation = []
         self.mesh_scale = []
@@ -96,7 +190,44 @@ class Window(QMainWindow):
 
         self.win.show()
 
-        self.undo_utility = undo.UndoUtility()
+        self.undo_utility = undo.UndoUtility(
+            coalesce_window=self.UNDO_COALESCE_WINDOW)
+        self.undo_journal = None
+        if self.JOURNAL_UNDO:
+            self.open_undo_journal(backend is None)
+
+        # texture files, vertex counts etc. of the models, without parsing
+        # them; updates itself for models that changed since the last start
+        self.asset_index = asset_index.AssetIndex()
+        self.asset_index.build()
+
+        # the payloads of the models, or in URL mode the templates the JS
+        # component keeps (see load_mesh_template)
+        self.model_cache = asset_cache.ModelCache(
+            lambda file_name: um.prepare_mesh_payload(
+                file_name, self.asset_index.texture_files(file_name)),
+            self.MODEL_CACHE_BYTES,
+            js.SetupScene.drop_mesh_template if self.SERVE_ASSETS_BY_URL
+            else None)
+        self.texture_store = asset_cache.TextureStore(
+            asset_scheme.asset_url if self.SERVE_ASSETS_BY_URL
+            else um.load_single_img_as_base64)
+        # binary bundles made by compile_assets.py (used in URL mode)
+        self.compiled_assets = asset_compiler.CompiledAssets()
+        # reads & encodes files off the GUI thread
+        self.asset_loader = asset_loader.AssetLoader(parent=self)
+        self.app.aboutToQuit.connect(self.asset_loader.cancel_all)
+        self.app.aboutToQuit.connect(self.asset_loader.wait)
+        # separate from the asset_loader, so meshes that are actually added
+        # never wait for a prefetch
+        self.prefetch_loader = asset_loader.AssetLoader(1, parent=self)
+        self.app.aboutToQuit.connect(self.prefetch_loader.cancel_all)
+        self.app.aboutToQuit.connect(self.prefetch_loader.wait)
+        # entries that were updated while the system was running
+        self.app.aboutToQuit.connect(self.asset_index.save)
+        if backend is None:
+            # a (re)loaded page has none of the images & templates
+            self.wv.loadFinished.connect(self.on_page_loaded)
 
         self.selected_plane = self.PLANE_XZ
         self.select_plane(self.selected_plane)
@@ -163,7 +294,7 @@ class Window(QMainWindow):
 
     def on_wm_b_button_press(self, data):
         if self.is_first_b_button_callback:
-            js.SetupScene.save_state("wiimote_transform")
+            self.save_state("wiimote_transform", self.selected_mesh)
             self.initial_accelerometer_data = data
             self.is_first_b_button_callback = False
 
@@ -183,13 +314,12 @@ class Window(QMainWindow):
 
     def on_wm_plus_button_press(self):
         if self.selected_mesh is not None:
-            js.SetupScene.save_state("duplicate_mesh")
-            if self.selected_mesh is not None:
-                self.request_duplicate_mesh(self.selected_mesh)
+            # (request_duplicate_mesh saves the state)
+            self.request_duplicate_mesh(self.selected_mesh)
 
     def on_wm_minus_button_press(self):
         if self.selected_mesh is not None:
-            js.SetupScene.save_state("remove_mesh")
+            self.save_state("remove_mesh", self.selected_mesh)
             self.delete_mesh(self.selected_mesh)
 
     def on_wm_home_button_clicked(self):
@@ -223,7 +353,7 @@ class Window(QMainWindow):
         self.wv.installEventFilter(self)
         self.win.installEventFilter(self)
 
-        self.list_widget.selectionModel().selectionChanged.connect(
+        self.list_view.selectionModel().selectionChanged.connect(
             self.mesh_selection_changed)
 
         self.setup_selection_tables()
@@ -314,44 +444,288 @@ class Window(QMainWindow):
 
             name: might be overwritten if it is already in use
             transform: location, rotation and scale (default="null" = at the
-                       center of the scene, scale = 1 & rotation = 0, 0, 0)
+                       center of the scene, scale = 1 & rotation = 0, 0, 0);
+                       JSON string or dict
             from_load: when this method is called to load another state (True),
                        no new "undo state" will be created. Default=False
         """
         if not from_load:
-            js.SetupScene.save_state("add_mesh")
+            self.save_state("add_mesh")
+
+        if isinstance(transform, str):
+            transform = json.loads(transform)
+
+        self.add_mesh_instances(mesh_file_name, [
+            self.create_mesh_instance(mesh_file_name, type_, name,
+                                      transform)])
+
+    def load_meshes(self, meshes, measure=False):
+        """ Adds the meshes of a saved state (list of dicts with "id",
+            "type", "fileName", "pos", "rot" and "scale").
+
+            Meshes are grouped by their file: each distinct file is
+            prepared once (in parallel, by the asset loader) & imported once
+            by the JS component, which clones it for the other meshes.
+
+            measure: if True, self.load_metrics is replaced by the metrics
+                     of this load (complete when its wall_time is set).
+        """
+        by_file = OrderedDict()
+        for mesh in meshes:
+            by_file.setdefault(mesh["fileName"], []).append(mesh)
+
+        instances_by_file = OrderedDict()
+        for mesh_file_name, file_meshes in by_file.items():
+            instances_by_file[mesh_file_name] = [
+                self.create_mesh_instance(mesh_file_name, mesh["type"],
+                                          mesh["id"], mesh_transform(mesh))
+                for mesh in file_meshes]
+
+        if measure:
+            self.load_metrics = asset_loader.LoadMetrics(
+                [instance["id"] for instances in instances_by_file.values()
+                 for instance in instances],
+                list(instances_by_file.keys()))
+
+        for mesh_file_name, instances in instances_by_file.items():
+            self.add_mesh_instances(mesh_file_name, instances)
+
+    def create_mesh_instance(self, mesh_file_name, type_, name, transform):
+        """ Reserves a name for a new mesh & returns the dict the JS component
+            needs to create it.
+        """
+        # (the registry has the meshes that are still loading, too)
+        name = self.scene.names.name_for_new_mesh(name, type_)
+        self.scene.reserve(name)
+
+        return {"id": name, "type": type_, "transform": transform,
+                "fileName": mesh_file_name}
+
+    def add_mesh_instances(self, mesh_file_name, instances):
+        """ Adds meshes that all use the same model file. """
+        if self.SERVE_ASSETS_BY_URL:
+            # prefer the compiled bundle, if it is up to date
+            compiled_file, vertices = self.compiled_assets.choose_lod(
+                mesh_file_name, len(instances), self.LOD_QUALITY,
+                self.SCENE_VERTEX_BUDGET - self.scene.total_vertices)
+            if vertices is None:
+                vertices = self.asset_index.vertex_count(mesh_file_name)
+            for instance in instances:
+                self.scene.reserve(instance["id"], vertices)
+
+            url = self.load_mesh_template(mesh_file_name, compiled_file)
+            js.SetupScene.add_mesh_instances_from_url(url, instances)
+            return
 
-        name = um.get_name_for_new_mesh(name, type_, self.meshes)
+        def add(prepared):
+            self.add_prepared_mesh(prepared, instances, mesh_file_name)
 
-        mesh_file = open(mesh_file_name)
-        data, json_data = um.read_file_as_js_string(mesh_file, True)
-        mesh_file.close()
+        def fail(error):
+            for instance in instances:
+                self.js_mesh_load_error(instance["id"], error)
+
+        # the file is only read & encoded the first time it is added
+        payload = self.model_cache.lookup(mesh_file_name)
+        if payload is not None:
+            self.asset_loader.deliver((payload, None), add)
+        else:
+            self.asset_loader.submit(
+                self.prepare_mesh,
+                (mesh_file_name,
+                 self.asset_index.texture_files(mesh_file_name)),
+                add, fail, mesh_file_name)
+
+    def load_mesh_template(self, mesh_file_name, compiled_file):
+        """ URL mode: makes the JS component keep the model it imports as a
+            hidden template, as long as it is in the model cache (which
+            drops the templates of the least recently used models, see
+            SetupScene.drop_mesh_template). Adding the model again only
+            clones the template.
+
+            Returns the URL of the model.
+        """
+        model_file = compiled_file or mesh_file_name
+        url = asset_scheme.asset_url(model_file)
+        if self.model_cache.lookup(model_file) is None:
+            # (the budget is in bytes of the model files)
+            stamp = asset_cache.file_stamp(mesh_file_name)
+            if self.model_cache.put(model_file, url,
+                                    size=stamp[1] if stamp else 0):
+                js.SetupScene.load_mesh_template(url)
+
+        return url
+
+    def prepare_mesh(self, mesh_file_name, texture_files):
+        """ Runs in the thread pool of the asset loader: reads the mesh file
+            & its textures. Must not change anything in the window (the
+            texture files are looked up in the asset index before, it is not
+            thread-safe).
+        """
+        payload = um.prepare_mesh_payload(mesh_file_name, texture_files)
+        textures = {texture_name: self.texture_store.load(file_name)
+                    for texture_name, file_name in payload[1].items()}
+
+        return payload, textures
+
+    def add_prepared_mesh(self, prepared, instances, mesh_file_name):
+        """ Second part of add_mesh_instances, in the GUI thread.
+            prepared: the result of prepare_mesh, or (cached payload, None)
+        """
+        payload, loaded_textures = prepared
+        if loaded_textures is None:
+            loaded_textures = {}
+        elif mesh_file_name not in self.model_cache:
+            # (several requests can share one result)
+            self.model_cache.put(mesh_file_name, payload)
+
+        data, texture_files = payload
+        texture_hashes = {}
+        for texture_name, file_name in texture_files.items():
+            if texture_name in loaded_textures:
+                texture_hashes[texture_name] = self.register_loaded_texture(
+                    loaded_textures[texture_name])
+            else:
+                texture_hashes[texture_name] = self.send_texture(file_name)
 
-        texture_images = um.load_images_as_base64(json_data)
+        js.SetupScene.add_mesh_instances(data, instances, texture_hashes)
 
-        js.SetupScene.add_mesh(data, name, texture_images, type_, transform,
-                               mesh_file_name)
+    def prefetch_models(self, mesh_file_names, hovered=False):
+        """ Starts preparing the models in the background (if
+            PREFETCH_MODELS is True), so they appear right away when they
+            are added: in URL mode, the JS component imports them as
+            templates (see load_mesh_template), otherwise their payloads are
+            put into the model cache.
+
+            hovered: the models were asked for explicitly (the cursor is on
+                     them); they do not count towards the budget of the
+                     category & are prepared first
+        """
+        if not self.PREFETCH_MODELS:
+            return
+
+        for mesh_file_name in mesh_file_names:
+            if mesh_file_name in self.prefetched_models:
+                continue
+
+            entry = self.asset_index.entry(mesh_file_name)
+            if entry is None:
+                continue
+            if not hovered:
+                if self.prefetched_count >= self.PREFETCH_MAX_MODELS or \
+                        self.prefetched_bytes + entry['size'] > \
+                        self.PREFETCH_MAX_BYTES:
+                    break
+                self.prefetched_count += 1
+                self.prefetched_bytes += entry['size']
+
+            self.prefetched_models.add(mesh_file_name)
+
+            if self.SERVE_ASSETS_BY_URL:
+                # same file as add_mesh_instances would use for one instance
+                compiled_file, vertices = self.compiled_assets.choose_lod(
+                    mesh_file_name, 1, self.LOD_QUALITY,
+                    self.SCENE_VERTEX_BUDGET - self.scene.total_vertices)
+                self.load_mesh_template(mesh_file_name, compiled_file)
+            elif mesh_file_name not in self.model_cache:
+                self.prefetch_loader.submit(
+                    self.prepare_mesh,
+                    (mesh_file_name, dict(entry['textures'])),
+                    lambda prepared, f=mesh_file_name:
+                        self.on_model_prefetched(f, prepared),
+                    lambda error: None, mesh_file_name, hovered)
+
+    def on_model_prefetched(self, mesh_file_name, prepared):
+        payload, loaded_textures = prepared
+        if mesh_file_name not in self.model_cache:
+            self.model_cache.put(mesh_file_name, payload)
+        # the JS component keeps the images, so adding the model later only
+        # needs their hashes
+        for loaded in loaded_textures.values():
+            self.register_loaded_texture(loaded)
+
+    def cancel_prefetch(self):
+        """ Stops prefetching (e.g. because the category was closed). What
+            was prepared already stays in the model cache.
+        """
+        self.prefetch_loader.cancel_all()
+        self.prefetched_models.clear()
+        self.prefetched_count = 0
+        self.prefetched_bytes = 0
 
     @QtCore.pyqtSlot(str)
+    @bridge_profiler.callback
     def js_mesh_loaded(self, mesh_name):
         """ Gets called when the JS component successfully created an object.
         """
-        self.list_widget.addItem(mesh_name)
-        self.meshes.append(mesh_name)
+        if mesh_name not in self.scene:
+            # it was removed (or the scene was cleared) while it was loading
+            js.SetupScene.remove_mesh(mesh_name)
+            return
+
+        self.mesh_list.mesh_loaded(mesh_name)
+        self.on_mesh_load_done(mesh_name)
         self.select_mesh(mesh_name)
 
     @QtCore.pyqtSlot(str, str)
+    @bridge_profiler.callback
     def js_mesh_load_error(self, mesh_name, error):
         """ Gets called when the JS component failed to create an object. """
+        self.scene.remove(mesh_name)
+        self.on_mesh_load_done(mesh_name)
         print(mesh_name, error)
 
+    def on_mesh_load_done(self, mesh_name):
+        if self.load_metrics is not None:
+            self.load_metrics.mesh_done(mesh_name)
+
     def request_change_texture(self, file_name, name, type_,
                                create_undo_point=True):
         if create_undo_point:
-            js.SetupScene.save_state("change_texture")
+            self.save_state("change_texture")
+
+        def set_texture(hash_):
+            js.SetupScene.set_texture(type_, name, hash_, file_name)
+
+        hash_ = self.texture_store.lookup(file_name)
+        if hash_ is not None:
+            self.asset_loader.deliver(hash_, set_texture)
+        else:
+            self.asset_loader.submit(
+                self.texture_store.load, (file_name,),
+                lambda loaded: set_texture(
+                    self.register_loaded_texture(loaded)))
+
+    def send_texture(self, file_name):
+        """ Makes sure the JS component has the image & returns the hash
+            it is registered under there. The data of each distinct image
+            is only sent once.
+        """
+        hash_ = self.texture_store.lookup(file_name)
+        if hash_ is None:
+            hash_ = self.register_loaded_texture(
+                self.texture_store.load(file_name))
 
-        base64data = um.load_single_img_as_base64(file_name)
-        js.SetupScene.set_texture(type_, name, base64data, file_name)
+        return hash_
+
+    def on_page_loaded(self, ok):
+        """ The JS component starts without the images that were
+            registered (& in URL mode the model templates), so they have to
+            be sent again.
+        """
+        self.texture_store.forget()
+        if self.SERVE_ASSETS_BY_URL:
+            self.model_cache.invalidate()
+            self.cancel_prefetch()
+
+    def register_loaded_texture(self, loaded):
+        """ Takes the result of TextureStore.load & sends the image to the
+            JS component if it does not have it yet. Returns the hash.
+        """
+        hash_, texture_data = self.texture_store.add(loaded)
+        if texture_data is not None:
+            js.SetupScene.register_texture(hash_, texture_data)
+
+        return hash_
 
     # PLANE / CAMERA BUTTONS ON THE SIDE
 
@@ -374,8 +748,10 @@ class Window(QMainWindow):
     # OBJECT MANIPULATIONS
 
     def request_duplicate_mesh(self, mesh_id):
-        js.SetupScene.save_state("duplicate_mesh")
-        name = um.get_name_for_copy(mesh_id, self.meshes)
+        self.save_state("duplicate_mesh", mesh_id)
+        name = self.scene.names.name_for_copy(mesh_id)
+        # the copy is a clone of the same model
+        self.scene.reserve(name, self.scene.vertices(mesh_id))
         js.SetupScene.duplicate_mesh(mesh_id, name)
 
     def handle_mesh_scaling_fine(self, data):
@@ -408,7 +784,8 @@ class Window(QMainWindow):
             js.SetupScene.rotate_mesh_by_id(self.selected_mesh, 0, angle +
                                             self.last_angle_y_rotation, 0)
 
-    @QtCore.pyqtSlot(str, str, str)
+    @QtCore.pyqtSlot('QVariantList', 'QVariantList', 'QVariantList')
+    @bridge_profiler.callback
     def on_translation_rotation_scale_request(self, trans, rot, scale):
         self.get_mesh_properties(trans, 'trans')
         self.get_mesh_properties(rot, 'rot')
@@ -417,42 +794,46 @@ class Window(QMainWindow):
     def get_mesh_properties(self, data, mode):
 
         if mode == 'trans':
-            self.mesh_translation = js.deserialize_list(data)
+            self.mesh_translation = js.to_floats(data)
 
         if mode == 'rot':
-            self.mesh_rotation = js.deserialize_list(data)
+            self.mesh_rotation = js.to_floats(data)
 
         if mode == 'scale':
-            self.mesh_scale = js.deserialize_list(data)
+            self.mesh_scale = js.to_floats(data)
 
     # dragging happens in JS, Python is notified when it starts to enable Undo:
 
     @QtCore.pyqtSlot(str)
+    @bridge_profiler.callback
     def on_js_obj_drag_start(self, mesh_id):
-        js.SetupScene.save_state("js_drag_translate")
+        self.save_state("js_drag_translate", mesh_id)
 
     # DELETING / RESETTING
 
     def clear_all(self):
         """ Resets the entire scene & the undo utility. """
-        while self.list_widget.count() > 0:
-            self.list_widget.takeItem(0)
+        # results of files that are still being prepared are stale now
+        self.asset_loader.cancel_all()
+        self.cancel_prefetch()
+        self.highlighted_meshes.clear()
 
-        for mesh in self.meshes:
+        for mesh in self.scene:
             js.SetupScene.remove_mesh(mesh)
+        # meshes the JS component is still importing are dropped
+        js.SetupScene.cancel_mesh_loads()
 
         js.SetupScene.remove_texture("walls")
         js.SetupScene.remove_texture("carpet")
-        self.meshes = []
+        # (meshes that are still loading are forgotten, too)
+        self.mesh_list.clear()
         self.selected_mesh = None
         self.undo_utility.reset()
 
     def delete_mesh(self, mesh_id):
         self.selected_mesh = None
-        if mesh_id in self.meshes:
-            index = self.meshes.index(mesh_id)
-            del self.meshes[index]
-            self.list_widget.takeItem(index)
+        self.mesh_list.remove_mesh(mesh_id)
+        self.highlighted_meshes.discard(mesh_id)
         js.SetupScene.remove_mesh(mesh_id)
 
     # MESH SELECTION
@@ -461,9 +842,9 @@ class Window(QMainWindow):
         """ Callback for when the selection in the list of scene objects
             changes.
         """
-        selected = self.list_widget.selectedIndexes()
+        selected = self.list_view.selectedIndexes()
         if len(selected) > 0:
-            self.select_mesh(self.meshes[selected[0].row()], False)
+            self.select_mesh(self.scene.id_at(selected[0].row()), False)
         else:
             self.de_select_meshes(False)
 
@@ -479,43 +860,49 @@ class Window(QMainWindow):
         # selected"
 
         self.selected_mesh = obj_id
-        for mesh in self.meshes:
-            if mesh == obj_id:
-                continue
-
-            js.SetupScene.remove_highlight_from_mesh(mesh)
+        self.remove_highlights(obj_id)
 
         if update_list and not was_selected:
-            if obj_id in self.meshes:
+            if self.scene.is_loaded(obj_id):
                 # remove any selection:
-                selection_model = self.list_widget.selectionModel()
+                selection_model = self.list_view.selectionModel()
                 selection_model.clear()
                 # add new selection:
-                selected_index = self.meshes.index(obj_id)
-                new_selection = self.list_widget.indexFromItem(
-                    self.list_widget.item(selected_index))
+                new_selection = self.mesh_list.index_of(obj_id)
                 selection_model.select(new_selection,
                                        QtCore.QItemSelectionModel.Select)
 
         js.SetupScene.highlight_mesh(obj_id, from_click)
+        self.highlighted_meshes.add(obj_id)
 
     def de_select_meshes(self, from_js=True):
         if from_js:
-            selection_model = self.list_widget.selectionModel()
+            selection_model = self.list_view.selectionModel()
             selection_model.clear()
         self.selected_mesh = None
+        self.remove_highlights()
+
+    def remove_highlights(self, keep=None):
+        """ Removes the outline of the highlighted meshes (except keep). """
+        for mesh in self.highlighted_meshes:
+            if mesh != keep:
+                js.SetupScene.remove_highlight_from_mesh(mesh)
 
-        for mesh in self.meshes:
-            js.SetupScene.remove_highlight_from_mesh(mesh)
+        if keep in self.highlighted_meshes:
+            self.highlighted_meshes = {keep}
+        else:
+            self.highlighted_meshes = set()
 
     @QtCore.pyqtSlot(str)
+    @bridge_profiler.callback
     def on_object_clicked(self, obj_id):
-        if obj_id in self.meshes:
+        if self.scene.is_loaded(obj_id):
             self.select_mesh(obj_id, True, True)
         else:  # == None; None does not work from JS
             self.de_select_meshes()
 
-    @QtCore.pyqtSlot(str, str, str)
+    @QtCore.pyqtSlot(str, float, float)
+    @bridge_profiler.callback
     def on_mesh_highlighted(self, obj_id, scale, y_rotation):
         self.last_scale_factor = float(scale)
         self.last_angle_y_rotation = float(y_rotation)
@@ -595,7 +982,7 @@ class Window(QMainWindow):
             js.SetupScene.create_new_scene(x, y)
 
     def on_save_action(self):
-        js.SetupScene.save_state("save")
+        self.save_state("save")
 
     def on_load_action(self):
         scene_json = um.FileDialog.load_json_from_file()
@@ -603,90 +990,167 @@ class Window(QMainWindow):
         if scene_json != '':
             self.load_state(scene_json)
 
-    @QtCore.pyqtSlot(str, str)
-    def save_state_result(self, scene_json, identifier):
-        """ Callback for when JS successfully saved the scene.
+    def save_state(self, identifier, mesh_id=None):
+        """ Saves the current state of the scene (see on_state_saved).
+
+            mesh_id: the mesh the action changes; the same action on it
+                     right after the last one needs no new state (see
+                     UndoUtility.coalesce)
+        """
+        if identifier not in ("undo", "save") and \
+           self.undo_utility.coalesce(identifier, mesh_id):
+            return
+
+        if not self.MIRROR_SCENE:
+            js.SetupScene.save_state(identifier)
+            return
+
+        # the mirror gets the changes of the queued calls when they are sent
+        js.SetupScene.flush()
+        self.on_state_saved(self.scene_mirror.state(), identifier)
+
+    @QtCore.pyqtSlot('QVariantMap')
+    @bridge_profiler.callback
+    def on_scene_changed(self, changes):
+        """ Gets called by the JS component with what changed in the scene
+            (see sendSceneChanges in setup_scene.js).
+        """
+        self.scene_mirror.apply(js.from_js_object(changes))
+
+        if self.undo_journal is not None and self.undo_journal.active and \
+           not self.journal_timer.isActive():
+            self.journal_timer.start()
+
+    @QtCore.pyqtSlot('QVariantMap', str)
+    @bridge_profiler.callback
+    def save_state_result(self, scene, identifier):
+        """ Callback for when JS successfully saved the scene
+            (SetupScene.save_state).
+
+            scene: the scene data as a dict (see saveScene in setup_scene.js)
+        """
+        self.on_state_saved(
+            scene_state.freeze_state(js.from_js_object(scene)), identifier)
+
+    def on_state_saved(self, scene_obj, identifier):
+        """ scene_obj: the state of the scene (SceneState)
 
-            identifier: same string that was given to the JS component
+            identifier: same string that was given to save_state
                         to mark why the state was saved. E.g., if it is
                         "undo", that means it was created to be able to
                         redo the scene & it should not be added to the
                         undo list.
         """
-        scene_obj = json.loads(scene_json)
-
-        scene_obj["selection"] = self.selected_mesh if \
-            (self.selected_mesh is not None) else "None"
-
-        scene_json = json.dumps(scene_obj)
+        scene_obj = scene_state.with_changes(
+            scene_obj, selection=self.selected_mesh
+            if (self.selected_mesh is not None) else "None")
 
         if identifier == "undo":
-            self.undo_utility.set_first_state_at_undo(scene_json)
+            self.undo_utility.set_first_state_at_undo(scene_obj)
             self.undo()
         elif identifier == "save":
-            um.FileDialog.save_json_to_file(scene_json)
+            um.FileDialog.save_json_to_file(scene_obj.to_json())
+        else:
+            # (the undo history only stores what changed)
+            self.undo_utility.add_action(identifier, scene_obj)
+
+    def open_undo_journal(self, wait_for_page):
+        """ Reads the journal of the last session; when the page is loaded
+            (wait_for_page) the user can restore it & the new journal is
+            started.
+        """
+        self.undo_journal = undo_journal.UndoJournal(self.UNDO_JOURNAL_FILE)
+        session = self.undo_journal.read()
+
+        self.journal_timer = QtCore.QTimer(self)
+        self.journal_timer.setSingleShot(True)
+        self.journal_timer.setInterval(self.JOURNAL_SCENE_INTERVAL)
+        self.journal_timer.timeout.connect(self.journal_scene)
+        self.app.aboutToQuit.connect(self.close_undo_journal)
+
+        if wait_for_page:
+            self.wv.loadFinished.connect(
+                lambda ok: self.start_undo_journal(session))
         else:
-            self.undo_utility.add_action(identifier, scene_json)
+            QtCore.QTimer.singleShot(
+                0, lambda: self.start_undo_journal(session))
+
+    def start_undo_journal(self, session):
+        if self.undo_journal.active:
+            return
+
+        if session is not None and self.ask_restore_session():
+            self.load_scene(session.scene)
+            # (load_state resets the history)
+            self.undo_utility.load_entries(session.entries)
+            self.undo_journal.start(self.undo_utility, session.scene)
+        else:
+            self.undo_journal.start(self.undo_utility)
+        self.undo_utility.journal = self.undo_journal
+
+    def ask_restore_session(self):
+        answer = QtWidgets.QMessageBox.question(
+            self.win, "Restore Session",
+            "Restore the scene & the undo history of the last session?",
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+            QtWidgets.QMessageBox.Yes)
+        return answer == QtWidgets.QMessageBox.Yes
+
+    def journal_scene(self):
+        if not self.undo_journal.active:
+            return
+
+        self.undo_journal.scene_changed(scene_state.with_changes(
+            self.scene_mirror.state(), selection=self.selected_mesh
+            if (self.selected_mesh is not None) else "None"))
+
+    def close_undo_journal(self):
+        if self.undo_journal.active:
+            self.journal_timer.stop()
+            self.journal_scene()
+            self.undo_utility.journal = None
+            self.undo_journal.close()
 
     def load_state(self, scene_json):
         """ Load the state in scene_json (JSON String) while completely
             discarding the current state. Cannot be undone.
         """
+        self.load_scene(scene_state.freeze_state(scene_json))
+
+    def load_scene(self, state):
+        """ Same as load_state, for a SceneState. """
         self.clear_all()
-        as_data = json.loads(scene_json)
 
-        js.SetupScene.redo_scene(as_data["room"]["x"], as_data["room"]["y"])
+        js.SetupScene.redo_scene(state["room"]["x"], state["room"]["y"])
 
-        for mesh in as_data["meshes"]:
-            self.request_add_mesh(mesh["fileName"], mesh["type"], mesh["id"],
-                                  json.dumps({
-                                    "pos": mesh["pos"],
-                                    "rot": mesh["rot"],
-                                    "scale": mesh["scale"]
-                                    }), True)
+        self.load_meshes(state["meshes"], self.MEASURE_LOADING)
 
-        self.load_selection(as_data)
+        self.load_selection(state)
 
-        self.load_floor_and_walls(as_data)
+        self.load_floor_and_walls(state)
 
     def load_changed_state(self, current_state, next_state):
-        """ Loads the "next_state" (JSON Object / dicts and lists) from the
+        """ Loads the "next_state" (SceneState) from the
             current state. Is faster than load_state & can be undone; use this
             method for "undo" and "redo" (when there are likely to be few
             changes between the states & undo must be possible).
+
+            Only what differs between the states is sent to the JS component
+            (see scene_diff.diff_states).
         """
+        diff = scene_diff.diff_states(current_state, next_state)
 
-        # delete meshes if they are not in the next state
-        for mesh in current_state["meshes"]:
-            found_mesh = False
-            for other_mesh in next_state["meshes"]:
-                if other_mesh["id"] == mesh["id"]:
-                    found_mesh = True
-                    break
-            if not found_mesh:
-                self.delete_mesh(mesh["id"])
-
-        # transform meshes for the next state / create them, if they don't
-        # exist yet
-        for mesh in next_state["meshes"]:
-            found_mesh = False
-            for previous_state in current_state["meshes"]:
-                if previous_state["id"] == mesh["id"]:
-                    found_mesh = True
-                    self.load_transformations_for_mesh(mesh, previous_state)
-                    break
+        for mesh_id in diff.removed:
+            self.delete_mesh(mesh_id)
 
-            if not found_mesh:
-                self.request_add_mesh(mesh["fileName"], mesh["type"],
-                                      mesh["id"], json.dumps({
-                                        "pos": mesh["pos"],
-                                        "rot": mesh["rot"],
-                                        "scale": mesh["scale"]
-                                      }), True)
+        self.load_transformations(diff)
+
+        if len(diff.added) > 0:
+            self.load_meshes(diff.added)
 
         self.load_selection(next_state)
 
-        self.load_floor_and_walls(next_state)
+        self.load_floor_and_walls(next_state, diff.textures)
 
     def load_selection(self, next_state):
         if next_state["selection"] is not "None":
@@ -694,8 +1158,12 @@ class Window(QMainWindow):
         else:
             self.de_select_meshes()
 
-    def load_floor_and_walls(self, next_state):
-        for texture_type in ("walls", "floor"):
+    def load_floor_and_walls(self, next_state,
+                             texture_types=scene_diff.TEXTURE_TYPES):
+        """ texture_types: the textures to load (the others are left as they
+                           are)
+        """
+        for texture_type in texture_types:
             if texture_type in next_state:
                 self.request_change_texture(
                     next_state[texture_type]["fileName"],
@@ -707,44 +1175,52 @@ class Window(QMainWindow):
                 else:
                     js.SetupScene.remove_texture(texture_type)
 
-    def load_transformations_for_mesh(self, mesh, previous_state):
-        pos_data_new = mesh["pos"]
-        pos_data_old = previous_state["pos"]
-        js.SetupScene.translate_mesh_by_id(
-            mesh["id"], pos_data_new[0] - pos_data_old[0],
-            pos_data_new[1] - pos_data_old[1],
-            pos_data_new[2] - pos_data_old[2])
-
-        rot_data = mesh["rot"]
-        js.SetupScene.rotate_mesh_by_id(mesh["id"], rot_data[0], rot_data[1],
-                                        rot_data[2])
-
-        scale_data = mesh["scale"]
-        js.SetupScene.scale_mesh_by_id(
-            mesh["id"], scale_data[0], scale_data[1], scale_data[2], False)
+    def load_transformations(self, diff):
+        """ Moves, rotates & scales the meshes that changed (see
+            scene_diff.SceneDiff).
+        """
+        for mesh, previous_state in diff.moved:
+            pos_data_new = mesh["pos"]
+            pos_data_old = previous_state["pos"]
+            js.SetupScene.translate_mesh_by_id(
+                mesh["id"], pos_data_new[0] - pos_data_old[0],
+                pos_data_new[1] - pos_data_old[1],
+                pos_data_new[2] - pos_data_old[2])
+
+        for mesh in diff.rotated:
+            rot_data = mesh["rot"]
+            js.SetupScene.rotate_mesh_by_id(mesh["id"], rot_data[0],
+                                            rot_data[1], rot_data[2])
+
+        for mesh in diff.scaled:
+            scale_data = mesh["scale"]
+            js.SetupScene.scale_mesh_by_id(
+                mesh["id"], scale_data[0], scale_data[1], scale_data[2],
+                False)
 
     def request_undo(self):
-        js.SetupScene.save_state("undo")
+        self.save_state("undo")
 
     def undo(self):
         undone_state = self.undo_utility.undo()
         current_state = self.undo_utility.current_state(True)
         if undone_state is not None:
             # self.load_state(undone_state["state"])
-            self.load_changed_state(json.loads(current_state["state"]),
-                                    json.loads(undone_state["state"]))
+            self.load_changed_state(current_state["state"],
+                                    undone_state["state"])
 
     def redo(self):
         redone_state = self.undo_utility.redo()
         current_state = self.undo_utility.current_state(False)
         if redone_state is not None:
             # self.load_state(redone_state["state"])
-            self.load_changed_state(json.loads(current_state["state"]),
-                                    json.loads(redone_state["state"]))
+            self.load_changed_state(current_state["state"],
+                                    redone_state["state"])
 
     # MISCELLANY
 
     @QtCore.pyqtSlot(str)
+    @bridge_profiler.callback
     def on_js_console_log(self, log):
         """
         function for debugging purposes
@@ -754,6 +1230,14 @@ class Window(QMainWindow):
         """
         print(log)
 
+    def print_bridge_profile(self):
+        if not bridge_profiler.PROFILER.enabled:
+            print('bridge profiling is off (see PROFILE_BRIDGE)')
+            return
+
+        print(bridge_profiler.PROFILER.report())
+        print(js.SetupScene.stats())
+
     def explain_controls(self):
         msg_box = QtWidgets.QMessageBox()
         pixmap = QtGui.QPixmap()
@@ -768,7 +1252,7 @@ class Window(QMainWindow):
 
     def eventFilter(self, source, event):
         """ Causes selection tables to lose focus (if they have the focus)
-            and handles ctrl+z & ctrl+y
+            and handles ctrl+z, ctrl+y & F12 (bridge profile)
         """
         if event.type() == QtGui.QMouseEvent.MouseButtonPress:
             self.mesh_select_table.lose_focus()
@@ -784,12 +1268,19 @@ class Window(QMainWindow):
             elif (source == self.win and event.key() == 89 and
                   int(event.modifiers()) == QtCore.Qt.ControlModifier):
                 self.redo()
+            elif source == self.win and event.key() == QtCore.Qt.Key_F12:
+                self.print_bridge_profile()
             else:
                 pass
                 #  print(event.key(), int(event.modifiers()))
         return super(Window, self).eventFilter(source, event)
 
 
+def mesh_transform(mesh):
+    """ The part of a saved mesh that loadTransformations (JS) needs. """
+    return {"pos": mesh["pos"], "rot": mesh["rot"], "scale": mesh["scale"]}
+
+
 def main():
     app = QApplication(sys.argv)
     url = QUrl('file:///' + os.path.dirname(os.path.realpath(__file__)) +